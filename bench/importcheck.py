@@ -0,0 +1,68 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Check that importing netdevicelib.connections stays cheap: it must not
+#  pull in the SSH libraries or setuptools, and must fit a time budget.
+#  Exits non-zero when it doesn't, so it can gate a build
+#
+#  $Id$
+# ========================================================================
+
+import optparse, subprocess, sys
+
+# Modules which only the transports or plugins that need them may load
+HEAVY = [ 'sshlib', 'paramiko', 'cryptography', 'pkg_resources',
+          'multiprocessing' ]
+
+# Seconds the import may take, best of several runs
+BUDGET = 0.05
+
+# Run in a fresh interpreter each time, so nothing is imported already
+PROBE = """
+import sys, time
+start = time.time()
+import netdevicelib.connections
+print time.time() - start
+print ' '.join( [ name for name in %r if sys.modules.get( name ) ] )
+"""
+
+# ------------------------------------------------------------------------
+
+def measure( inHeavy=HEAVY ):
+    """ Import the module in a new interpreter. Returns ( seconds, list of
+        heavy modules loaded ) """
+
+    probe = subprocess.Popen( [ sys.executable, "-c", PROBE % inHeavy ],
+                              stdout=subprocess.PIPE )
+    output = probe.communicate()[0].split( "\n" )
+    if probe.returncode != 0:
+        raise RuntimeError( "Importing netdevicelib.connections failed" )
+
+    return float( output[0] ), output[1].split()
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+
+    parser = optparse.OptionParser()
+    parser.add_option( "-b", "--budget", type="float", default=BUDGET,
+                       help="import time budget in seconds [0.05]" )
+    parser.add_option( "-n", "--runs", type="int", default=5,
+                       help="runs, the best one is kept [5]" )
+    opts, args = parser.parse_args()
+
+    best = None
+    for i in range( opts.runs ):
+        elapsed, loaded = measure()
+        if loaded:
+            print "FAIL: importing netdevicelib.connections loads %s" % \
+                  ", ".join( loaded )
+            sys.exit( 1 )
+        if best == None or elapsed < best:
+            best = elapsed
+
+    print "import netdevicelib.connections: %.3fs (budget %.3fs, best of %d)" % \
+          ( best, opts.budget, opts.runs )
+    if best > opts.budget:
+        print "FAIL: over budget"
+        sys.exit( 1 )
@@ -0,0 +1,163 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Measure getConfig() throughput over SSH against a local stand-in
+#  server, with and without the transport tuning options.
+#
+#  How much compression helps depends on the config: the generated one
+#  varies descriptions, addresses and ACLs, but still compresses better
+#  than most real ones. Pass a real config with -c for numbers that mean
+#  something for a given fleet
+#
+#  $Id$
+# ========================================================================
+
+import optparse, random, socket, sys, threading, time
+
+import paramiko
+
+from netdevicelib.connections import ConnectionFactory
+from netdevicelib.sshtransport import FAST_OPTIONS
+
+# ------------------------------------------------------------------------
+
+class SlowSocket:
+    """ Socket wrapper limiting how fast the server may send, to stand in
+        for a WAN link """
+
+    def __init__( self, inSock, inRate ):
+        self._sock = inSock
+        self._rate = inRate
+
+    def send( self, inData ):
+        sent = self._sock.send( inData[:16384] )
+        if self._rate:
+            time.sleep( float( sent ) / self._rate )
+        return sent
+
+    def __getattr__( self, inName ):
+        return getattr( self._sock, inName )
+
+class StandIn( paramiko.ServerInterface ):
+    """ Accepts any password and answers exec requests with the config """
+
+    def __init__( self, inConfig ):
+        self._config = inConfig
+
+    def check_auth_password( self, inUser, inPass ):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths( self, inUser ):
+        return 'password'
+
+    def check_channel_request( self, inKind, inId ):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request( self, inChannel, inCommand ):
+        def reply():
+            time.sleep( 0.05 )
+            inChannel.sendall( self._config )
+            inChannel.send_exit_status( 0 )
+            inChannel.close()
+        threading.Thread( target=reply ).start()
+        return True
+
+def _address():
+    return "10.%d.%d.%d" % ( random.randint( 0, 255 ), random.randint( 0, 255 ),
+                             random.randint( 1, 254 ) )
+
+def makeConfig( inSize ):
+    """ Generate roughly inSize bytes of IOS-looking configuration, with
+        the per-line variety (names, addresses, ACL entries) of real ones """
+
+    random.seed( 42 )
+    words = [ "uplink", "server", "printer", "floor", "rack", "core", "dmz",
+              "voice", "camera", "ap", "wan", "backup", "mgmt", "storage" ]
+
+    lines, size, i = [], 0, 0
+    while size < inSize:
+        if i % 3:
+            line = "interface GigabitEthernet%d/0/%d\n" \
+                   " description %s-%s-%04x %s\n" \
+                   " switchport access vlan %d\n" \
+                   " ip address %s 255.255.255.%d\n" \
+                   "!\n" % ( i / 48 + 1, i % 48, random.choice( words ),
+                             random.choice( words ), random.getrandbits( 16 ),
+                             random.choice( words ), random.randint( 2, 4094 ),
+                             _address(), random.choice( ( 0, 128, 192, 224, 252 ) ) )
+        else:
+            line = "access-list %d %s %s %s host %s eq %d\n" % \
+                   ( random.randint( 100, 199 ), random.choice( ( "permit", "deny" ) ),
+                     random.choice( ( "tcp", "udp" ) ), _address(), _address(),
+                     random.randint( 1, 65535 ) )
+        lines.append( line )
+        size = size + len( line )
+        i = i + 1
+    return "".join( lines )
+
+def serve( inConfig, inRate ):
+    """ Start the stand-in server and return its port """
+
+    key      = paramiko.RSAKey.generate( 2048 )
+    listener = socket.socket()
+    listener.bind( ( '127.0.0.1', 0 ) )
+    listener.listen( 5 )
+
+    def loop():
+        while 1:
+            sock, addr = listener.accept()
+            transport = paramiko.Transport( SlowSocket( sock, inRate ) )
+            transport.add_server_key( key )
+            transport.use_compression( True )
+            transport.start_server( server=StandIn( inConfig ) )
+
+    t = threading.Thread( target=loop )
+    t.setDaemon( 1 )
+    t.start()
+    return listener.getsockname()[1]
+
+# ========================================================================
+#  Main
+# ========================================================================
+
+if __name__ == "__main__":
+
+    parser = optparse.OptionParser()
+    parser.add_option( "-s", "--size", type="float", default=4,
+                       help="generated config size in MB [4]" )
+    parser.add_option( "-c", "--config",
+                       help="file holding a real config to send instead" )
+    parser.add_option( "-r", "--rate", type="int", default=1024,
+                       help="server send rate in KB/s, 0 for unlimited [1024]" )
+    parser.add_option( "-n", "--runs", type="int", default=3,
+                       help="runs per configuration [3]" )
+    opts, args = parser.parse_args()
+
+    if opts.config:
+        config = open( opts.config ).read()
+    else:
+        config = makeConfig( int( opts.size * 1024 * 1024 ) )
+    port   = serve( config, opts.rate * 1024 )
+
+    # The stand-in server makes a new host key every run
+    tuned = FAST_OPTIONS.copy()
+    tuned['strictHostKeys'] = 0
+    for name, options in ( ( "default", { 'strictHostKeys' : 0 } ),
+                           ( "tuned",   tuned ) ):
+        best = None
+        for i in range( opts.runs ):
+            conn = ConnectionFactory().createConnection( "ssh-exec", "IOS", options )
+            conn.open( "127.0.0.1", port )
+            conn.login( "bench", "bench" )
+
+            start  = time.time()
+            output = conn.getConfig()
+            elapsed = time.time() - start
+            conn.close()
+
+            assert len( output ) == len( config )
+            if best == None or elapsed < best:
+                best = elapsed
+
+        print "%-8s %8.0f KB/s  (%d bytes in %.2fs, best of %d)" % \
+              ( name, len( config ) / best / 1024, len( config ), best, opts.runs )
@@ -0,0 +1,187 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Classes which hold the output of commands, spilling it to disk when it
+#  gets too large to keep in memory
+#
+#  $Id$
+# ========================================================================
+
+import mmap, tempfile
+
+# ------------------------------------------------------------------------
+
+# Module documentation strings
+__version__ = '$Revision: 1.1 $'.split()[-2]
+
+# Exceptions
+OutputLimitException = "Output exceeded the connection's memory budget"
+
+# ------------------------------------------------------------------------
+
+class SpilledOutput:
+    """ Read-only, string-like view of command output kept on disk.
+
+    Supports len(), indexing and slicing (which return plain strings),
+    str(), find()/rfind(), 'in', startswith()/endswith() and iteration
+    over lines, without loading the whole output in memory.
+    """
+
+    def __init__( self, inMap=None, inStart=0, inEnd=None ):
+        """ Constructor """
+        assert inMap != None
+
+        if inEnd == None:
+            inEnd = len( inMap )
+
+        self._map   = inMap
+        self._start = inStart
+        self._end   = inEnd
+
+    def __len__( self ):
+        return self._end - self._start
+
+    def __str__( self ):
+        return self._map[self._start:self._end]
+
+    def __repr__( self ):
+        return "<SpilledOutput of %d bytes>" % len( self )
+
+    def __getitem__( self, inIndex ):
+        if isinstance( inIndex, slice ):
+            start, stop, step = inIndex.indices( len( self ) )
+            return self._map[self._start + start:self._start + stop:step]
+
+        if inIndex < 0:
+            inIndex = inIndex + len( self )
+        if inIndex < 0 or inIndex >= len( self ):
+            raise IndexError( "SpilledOutput index out of range" )
+        return self._map[self._start + inIndex]
+
+    def __getslice__( self, inStart, inStop ):
+        return self.__getitem__( slice( inStart, inStop ) )
+
+    def __contains__( self, inString ):
+        return self.find( inString ) != -1
+
+    def __iter__( self ):
+        """ Iterate over the lines of the output, line endings included """
+
+        pos = self._start
+        while pos < self._end:
+            eol = self._map.find( "\n", pos, self._end )
+            if eol == -1:
+                eol = self._end
+            else:
+                eol = eol + 1
+            yield self._map[pos:eol]
+            pos = eol
+
+    def find( self, inString, inStart=0, inEnd=None ):
+        start, end = self._bounds( inStart, inEnd )
+        pos = self._map.find( inString, start, end )
+        if pos == -1:
+            return -1
+        return pos - self._start
+
+    def rfind( self, inString, inStart=0, inEnd=None ):
+        start, end = self._bounds( inStart, inEnd )
+        pos = self._map.rfind( inString, start, end )
+        if pos == -1:
+            return -1
+        return pos - self._start
+
+    def startswith( self, inString ):
+        return self[:len( inString )] == inString
+
+    def endswith( self, inString ):
+        return len( inString ) <= len( self ) and self[-len( inString ):] == inString
+
+    def splitlines( self, inKeepEnds=0 ):
+        """ Return the lines of the output as a list of strings """
+
+        if inKeepEnds:
+            return list( self )
+        return [ line.rstrip( "\r\n" ) for line in self ]
+
+    def view( self, inStart=0, inEnd=None ):
+        """ Return a SpilledOutput for part of this one, sharing the file """
+
+        start, end = self._bounds( inStart, inEnd )
+        return SpilledOutput( self._map, start, end )
+
+    def _bounds( self, inStart, inEnd ):
+        """ Turn offsets relative to this view into offsets in the map """
+
+        start, end, step = slice( inStart, inEnd ).indices( len( self ) )
+        return ( self._start + start, self._start + max( start, end ) )
+
+class OutputBuffer:
+    """ Accumulates command output in memory, moving it to a temporary file
+        past inSpillSize bytes and refusing to grow past inMaxSize """
+
+    def __init__( self, inSpillSize=None, inMaxSize=None ):
+        """ Constructor """
+
+        self._spillSize = inSpillSize
+        self._maxSize   = inMaxSize
+        self._chunks    = []
+        self._size      = 0
+        self._file      = None
+
+    def __len__( self ):
+        return self._size
+
+    def append( self, inData=None ):
+        """ Add some output to the buffer """
+        assert inData != None
+
+        if not inData:
+            return
+
+        if self._maxSize and self._size + len( inData ) > self._maxSize:
+            raise RuntimeError, OutputLimitException
+
+        self._size = self._size + len( inData )
+
+        if self._file != None:
+            self._file.write( inData )
+            return
+
+        self._chunks.append( inData )
+        if self._spillSize and self._size > self._spillSize:
+            self._file = tempfile.TemporaryFile( prefix='netdevicelib-' )
+            self._file.write( "".join( self._chunks ) )
+            self._chunks = []
+
+    def trim( self, inCount=0 ):
+        """ Remove inCount characters from the end of the buffer """
+
+        inCount    = min( inCount, self._size )
+        self._size = self._size - inCount
+
+        if self._file != None:
+            self._file.seek( self._size )
+            self._file.truncate()
+            return
+
+        while inCount > 0 and self._chunks:
+            last = self._chunks.pop()
+            if len( last ) > inCount:
+                self._chunks.append( last[:-inCount] )
+                inCount = 0
+            else:
+                inCount = inCount - len( last )
+
+    def getvalue( self ):
+        """ Return the output: a string, or a SpilledOutput if it was moved
+            to disk """
+
+        if self._file == None:
+            return "".join( self._chunks )
+
+        self._file.flush()
+        if self._size == 0:
+            return ""
+        return SpilledOutput( mmap.mmap( self._file.fileno(), self._size,
+                                         access=mmap.ACCESS_READ ) )
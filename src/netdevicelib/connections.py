@@ -9,8 +9,7 @@
 #  $Id: connections.py,v 1.11 2002/06/19 22:59:40 bluecoat93 Exp $
 # ========================================================================
 
-import getopt, re, string, sys, telnetlib, types, time
-from sshlib.ssh import Ssh
+import getopt, re, socket, string, sys, threading, types, time
 
 # We requre Python 2.0
 pyversion = string.split( string.split( sys.version )[0], "." )
@@ -19,7 +18,13 @@ if map( int, pyversion ) < [2, 0, 0]:
     sys.stderr.write( "Sorry, this library requires at least Python 2.0\n" )
     sys.exit(1);
     
+from netdevicelib.buffers import OutputBuffer, SpilledOutput
 from netdevicelib.devices import DeviceFactory
+from netdevicelib.plugins import TRANSPORTS_GROUP, loadEntryPoints
+from netdevicelib.sockets import openSocket
+from netdevicelib.sshtransport import AuthenticationError, SshShell, authenticate, \
+                                      openTransport
+from netdevicelib.telnet import Telnet
 
 # ------------------------------------------------------------------------
 
@@ -30,21 +35,36 @@ __version__ = '$Revision: 1.11 $'.split()[-2]
 LoginFailedException   = "Login failed. Bad username or password"
 EnableFailedException  = "Enable failed. Access denied"
 DisableFailedException = "Disable command failed."
+ContextFailedException = "Changing context failed. No such context"
 
 # ------------------------------------------------------------------------
 class Connection:
     """ Base class for all connections """
     
-    def __init__( self, inDevice=None, inTimeout=10 ):
-        """ Constructor """
+    def __init__( self, inDevice=None, inTimeout=10, inJumpHost=None ):
+        """ Constructor. inJumpHost is a tunnels.JumpHost to reach the
+            device through """
         assert inDevice != None
 
         self._device      = inDevice
         self._timeout     = inTimeout
+        self._jumpHost    = inJumpHost
         self._isDebugging = 0
         self._isOpen      = 0
         self._lastPrompt  = ''
 
+        self._resetMode()
+
+        # How often _expect() wakes up to check the idle timeout, and how
+        # much of the previous read it keeps to find split prompts
+        self._pollInterval = 1.0
+        self._tailSize     = 512
+
+        # Output larger than _spillSize goes to a temporary file, output
+        # larger than _maxSize aborts the command. None means no limit
+        self._spillSize    = None
+        self._maxSize      = None
+
     # Virtual methods -- must be overridden
     def open( self, inHost=None, inPort=23 ):
         """ Open the connection to the device """
@@ -58,7 +78,8 @@ class Connection:
         """ Login to the device using a username and password """
         raise RuntimeError, "Unimplemented base class method called"
 
-    def cmd( self, inCmd=None, inPrompt=None ):
+    def cmd( self, inCmd=None, inPrompt=None, inConfirm=False,
+             inTimeout=None, inDeadline=None ):
         """ Run a command on the device and return the output """
         raise RuntimeError, "Unimplemented base class method called"
 
@@ -77,6 +98,57 @@ class Connection:
 
         return self._isDebugging
     
+    def memoryBudget( self, inSpillSize=None, inMaxSize=None ):
+        """ Accessor method for the output memory budget: output past
+            inSpillSize bytes is kept in a temporary file, output past
+            inMaxSize bytes aborts the command and closes the connection.
+            Returns the current ( spillSize, maxSize ) """
+
+        if inSpillSize != None:
+            self._spillSize = inSpillSize
+        if inMaxSize != None:
+            self._maxSize = inMaxSize
+
+        return ( self._spillSize, self._maxSize )
+
+    def _abort( self ):
+        """ Drop the connection without trying to talk to the device """
+
+        self._debuglog( "Aborting connection" )
+        try:
+            self._conn.close()
+        finally:
+            self._isOpen = 0
+            self._resetMode()
+
+    def _cleanOutput( self, inCmd=None, inOutput=None ):
+        """ Remove the echoed command and the trailing prompt from output """
+        assert inCmd    != None
+        assert inOutput != None
+
+        exp = re.compile( '^%s\s*$\n' % re.escape(inCmd), re.MULTILINE )
+        if not isinstance( inOutput, SpilledOutput ):
+            output = exp.sub( '', inOutput, 1 )
+
+            # The prompt is anchored at the end, so only the tail can hold
+            # it; searching the whole output costs more than reading it
+            tail = output[-self._tailSize:]
+            return output[:len( output ) - len( tail )] + \
+                   self._device.getPromptRE('command').sub( '', tail )
+
+        # Too big to work on as a string: only look at both ends
+        head  = inOutput[:self._tailSize + len( inCmd )]
+        match = exp.search( head )
+        if match != None and match.start() == 0:
+            inOutput = inOutput.view( match.end() )
+
+        tail  = inOutput[-self._tailSize:]
+        match = self._device.getPromptRE('command').search( tail )
+        if match != None:
+            inOutput = inOutput.view( 0, len( inOutput ) - len( tail ) + match.start() )
+
+        return inOutput
+
     def isEnabled( self ):
         """ Returns true if the connection is in 'superuser' mode """
         pass
@@ -93,17 +165,306 @@ class Connection:
         """ Take the connection out of 'superuser' mode """
         pass
 
+    def getDevice( self ):
+        """ Accessor method to get the device object """
+        return self._device
+
     def getLastPrompt( self ):
         """ Accessor method to get the last prompt we saw """
         return self._lastPrompt
 
+    def _resetMode( self ):
+        """ Forget what we know about the session """
+
+        # What we know about the session, so that commands which wouldn't
+        # change anything can be skipped. None means "don't know yet"
+        self._mode = { 'paging'  : None,
+                       'enabled' : None,
+                       'config'  : None,
+                       'context' : None }
+
+    def getMode( self, inKey=None ):
+        """ Accessor method for the tracked session mode: paging, enabled,
+            config (the config submode, '' outside config mode) or context """
+        assert inKey != None
+        return self._mode[inKey]
+
+    def _setLastPrompt( self, inPrompt=None ):
+        """ Store the last prompt we saw and update the session mode from it,
+            if it is a command prompt """
+        assert inPrompt != None
+
+        self._lastPrompt = inPrompt
+
+        # A confirmation or other prompt given to cmd() says nothing about
+        # the mode: "[confirm]" would read as not enabled and not in config
+        exp = self._device.getPromptRE( 'command' )
+        if exp == None or exp.search( inPrompt ) == None:
+            return
+
+        exp = self._device.getPromptRE( 'enabledIndicator' )
+        if exp != None:
+            self._mode['enabled'] = int( exp.search( inPrompt ) != None )
+
+        exp = self._device.getPromptRE( 'command-config' )
+        if exp != None:
+            match = exp.search( inPrompt )
+            if match != None:
+                self._mode['config'] = match.group( 1 )
+            else:
+                self._mode['config'] = ''
+
+        exp = self._device.getPromptRE( 'contextIndicator' )
+        if exp != None:
+            match = exp.search( inPrompt )
+            if match != None:
+                self._mode['context'] = match.group( 1 )
+            else:
+                self._mode['context'] = ''
+
+    def _openSocket( self, inHost=None, inPort=None ):
+        """ Return a connected socket to the device, or a channel to it
+            through the jump host, within the connect timeout """
+        assert inHost != None
+        assert inPort != None
+
+        if self._jumpHost != None:
+            self._debuglog( "Opening a channel through " + repr( self._jumpHost ) )
+            return self._jumpHost.openChannel( inHost, inPort,
+                                               self._getTimeout( 'connect' ) )
+
+        return openSocket( inHost, inPort, self._getTimeout( 'connect' ) )
+
+    def _getTimeout( self, inKey=None, inValue=None ):
+        """ Work out a timeout: an explicit value wins over the device's,
+            which wins over the connection's. Only the idle, login and
+            connect timeouts fall back to the connection's """
+        assert inKey != None
+
+        if inValue != None:
+            return inValue
+
+        value = self._device.getTimeout( inKey )
+        if value != None or inKey == 'deadline':
+            return value
+
+        return self._timeout
+
+    def _expect( self, inPrompts=None, inTimeout=None, inDeadline=None ):
+        """ Wrapper around expect() which pages through --More-- markers.
+            inTimeout is how long the device may stay silent, inDeadline
+            the limit for the whole response. Returns the same
+            ( index, match, text ) tuple as expect() """
+        assert inPrompts != None
+
+        idle     = self._getTimeout( 'idle',     inTimeout )
+        deadline = self._getTimeout( 'deadline', inDeadline )
+
+        # The pager marker goes first: the generic command prompt would
+        # happily match "<--- More --->" too
+        more = self._device.getPrompt( 'more' )
+        if more:
+            prompts = [ more ] + inPrompts
+        else:
+            prompts = inPrompts
+        exps = map( re.compile, prompts )
+
+        start    = time.time()
+        lastData = start
+        output   = OutputBuffer( self._spillSize, self._maxSize )
+        tail     = ''
+        paged    = 0
+
+        while 1:
+            now  = time.time()
+            wait = lastData + idle - now
+            if deadline:
+                wait = min( wait, start + deadline - now )
+            if wait <= 0:
+                self._debuglog( "Timed out waiting for a prompt" )
+                index, match = -1, None
+                break
+
+            # Read in short slices so that a device still sending data
+            # isn't cut off by the idle timeout
+            index, match, text = self._conn.expect( prompts,
+                                         min( wait, self._pollInterval ) )
+            if text:
+                lastData = time.time()
+
+            offset = 0
+            if index == -1 and text:
+                # The prompt may have been split across two reads. expect()
+                # has searched text already, so only a match starting in
+                # the tail of the previous read is new
+                window = tail + text
+                for i in range( len( exps ) ):
+                    for pos in range( len( tail ) ):
+                        match = exps[i].match( window, pos )
+                        if match != None:
+                            break
+                    if match != None:
+                        index  = i
+                        offset = len( tail )
+                        break
+
+            if more and index == 0:
+                self._debuglog( "Found a pager marker. Sending continuation key" )
+                cut = match.start() - offset
+                if cut < 0:
+                    output.trim( -cut )
+                    cut = 0
+                text  = text[:cut]
+                tail  = ''
+                paged = 1
+                self._conn.write( self._device.getCommand( 'pagerContinue' ) )
+            else:
+                tail = ( tail + text )[-self._tailSize:]
+
+            if paged:
+                # Remove what the device sends to erase the marker from the
+                # screen, as it comes in
+                text = self._device.getPromptRE( 'moreErase' ).sub( '', text )
+
+            try:
+                output.append( text )
+            except RuntimeError:
+                self._abort()
+                raise
+
+            if index > 0 or ( index == 0 and not more ):
+                break
+
+        if more and index != -1:
+            index = index - 1
+
+        return ( index, match, output.getvalue() )
+
+    def waitFor( self, inKeys=None, inTimeout=None, inDeadline=None ):
+        """ Wait for one of the device prompts named in inKeys, for at most
+            inTimeout seconds of silence and inDeadline seconds in all.
+            Returns ( key, text ), with a key of None on timeout """
+        assert inKeys != None
+
+        keys = [ key for key in inKeys if self._device.getPrompt( key ) ]
+        index, match, text = self._expect( map( self._device.getPrompt, keys ),
+                                           inTimeout, inDeadline )
+        if index == -1:
+            return ( None, text )
+        return ( keys[index], text )
+
+    def sendLine( self, inLine=None ):
+        """ Send a line to the device without waiting for an answer """
+        assert inLine != None
+
+        self._debuglog( "sending (" + inLine + ")" )
+        self._conn.write( inLine + "\r" )
+
+    def sendBreak( self ):
+        """ Send a serial break, through a console server """
+        raise RuntimeError( "This connection can't send a break" )
+
     def disablePaging( self ):
         """ Helper function to disable screen paging for a connection """
+        if self._mode['paging'] == 0:
+            return
         self.cmd( self._device.getCommand('disablePaging') )
+        self._mode['paging'] = 0
 
     def enablePaging( self ):
         """ Helper function to enable screen paging for a connection """
+        # Only undo what disablePaging() did: paging is on by default
+        if self._mode['paging'] != 0:
+            return
         self.cmd( self._device.getCommand('enablePaging') )
+        self._mode['paging'] = 1
+
+    def configMode( self ):
+        """ Helper function to enter configuration mode """
+        if self._mode['config']:
+            return
+        self.cmd( self._device.getCommand('config') )
+
+    def endConfigMode( self ):
+        """ Helper function to leave configuration mode """
+        if self._mode['config'] == '':
+            return
+        self.cmd( self._device.getCommand('end') )
+
+    def getContexts( self ):
+        """ Return the names of the device's security contexts (ASA) or
+            VDCs (NX-OS). Must be run from the system level """
+        exp = self._device.getPromptRE( 'contextList' )
+        if exp == None:
+            raise RuntimeError( "This device has no contexts" )
+
+        output = self.cmd( self._device.getCommand( 'listContexts' ) )
+        return exp.findall( str( output ) )
+
+    def changeContext( self, inContext=None ):
+        """ Switch the session to a context, or back to the system level if
+            inContext is '' """
+        assert inContext != None
+
+        # Sessions start at the system level unless the prompt said otherwise
+        current = self._mode['context'] or ''
+        if current == inContext:
+            return
+
+        if inContext and current and \
+           self._device.switchesFromSystem():
+            self.changeContext( '' )
+
+        if inContext:
+            output = self.cmd( self._device.getCommand( 'changeContext' ) % inContext )
+        else:
+            output = self.cmd( self._device.getCommand( 'changeSystem' ) )
+
+        exp = self._device.getPromptRE( 'contextError' )
+        if exp != None and exp.search( str( output ) ):
+            raise RuntimeError, ContextFailedException
+
+        self._mode['context'] = inContext
+
+        # Terminal settings don't follow the session into a context
+        self._mode['paging'] = None
+
+    def forEachContext( self, inCommands=None, inContexts=None ):
+        """ Run commands in several contexts over this one session: those in
+            inContexts, or the system level ('') and every context. The
+            command 'getConfig' stands for getConfig(). Returns a dictionary
+            of context -> list of outputs """
+        assert inCommands != None
+
+        if inContexts == None:
+            self.changeContext( '' )
+            inContexts = [ '' ] + self.getContexts()
+
+        results = {}
+        try:
+            for context in inContexts:
+                self.changeContext( context )
+
+                outputs = []
+                for command in inCommands:
+                    if command == 'getConfig':
+                        outputs.append( self.getConfig() )
+                    else:
+                        outputs.append( self.cmd( command ) )
+                results[context] = outputs
+        except:
+            # Going back to the system level is likely to fail too once
+            # the session is broken: don't let that hide the real error
+            info = sys.exc_info()
+            if self._isOpen:
+                try:
+                    self.changeContext( '' )
+                except Exception:
+                    pass
+            raise info[0], info[1], info[2]
+
+        self.changeContext( '' )
+        return results
 
     def wakeup( self ):
         """ Helper function to send CRLF's to the device in order to wake it up """
@@ -121,18 +482,31 @@ class Connection:
 class SshConnection( Connection ):
     """ Encapsulates an Ssh Connection to a device """
     
-    def __init__( self, inDevice=None ):
-        """ Constructor """
+    def __init__( self, inDevice=None, inOptions=None, inJumpHost=None ):
+        """ Constructor. inOptions are the transport options described in
+            sshtransport; when given, or with a jump host, the connection
+            runs over paramiko instead of sshlib, and checks host keys as
+            described there """
         assert inDevice != None
         
-        Connection.__init__( self, inDevice )
-        self._conn = Ssh()
+        Connection.__init__( self, inDevice, inJumpHost=inJumpHost )
+        self._options = inOptions
+        if inOptions or inJumpHost != None:
+            self._conn = SshShell( inOptions )
+        else:
+            # Imported here so that telnet users never load sshlib
+            from sshlib.ssh import Ssh
+            self._conn = Ssh()
 
     def open( self, inHost=None, inPort=22 ):
         """ Open the connection to the device """
         assert inHost != None
         
-        self._conn.open( inHost, inPort )
+        if isinstance( self._conn, SshShell ):
+            self._conn.open( inHost, inPort, self._getTimeout( 'connect' ),
+                             self._openSocket( inHost, inPort ) )
+        else:
+            self._conn.open( inHost, inPort )
         self._isOpen = 1
         self._debuglog( "Connection open" )
         if self._device.needsWakeup():
@@ -153,6 +527,7 @@ class SshConnection( Connection ):
                 self._conn.cmd(self._device.getCommand('logout'))
             self._conn.close()
         self._isOpen = 0
+        self._resetMode()
 
 #	def whereami( self ):
 #		matches = [
@@ -170,7 +545,10 @@ class SshConnection( Connection ):
         # Whooooo's on the other end ? a little state machine is more suited to the task:
         # one's never know what state is the device in anyway
 
-        self._conn.login(inUser,inPass)
+        try:
+            self._conn.login(inUser,inPass)
+        except AuthenticationError:
+            raise RuntimeError, LoginFailedException
 
         matches = [ self._device.getPrompt('rommon'),
                     self._device.getPrompt('username'),
@@ -187,7 +565,7 @@ class SshConnection( Connection ):
             self._debuglog( "Trying to match:\n\t" + "\n\t".join(matches) \
                 + " in: " + self._lastPrompt )
 
-            result = self._conn.expect( matches, self._timeout )
+            result = self._conn.expect( matches, self._getTimeout( 'login' ) )
             
             if result[0] == 0:
                 self._debuglog( "Matched: [" +  str(result[0]) + "]: " + matches[result[0]] )
@@ -219,6 +597,7 @@ class SshConnection( Connection ):
             elif result[0] == 4:
                 self._debuglog( "Matched: [" + str(result[0]) + "]: " + matches[result[0]] )
                 self._debuglog( "Found a cmd prompt: We are logged in" )
+                self._setLastPrompt( result[1].group() )
                 loggedIn = 1
 
             elif result[0] == 5:
@@ -246,8 +625,10 @@ class SshConnection( Connection ):
         else:
             self.disablePaging()
     
-    def cmd( self, inCmd=None, inPrompt=None, inConfirm=False ):
-        """ Run a command on the device and return the output """
+    def cmd( self, inCmd=None, inPrompt=None, inConfirm=False,
+             inTimeout=None, inDeadline=None ):
+        """ Run a command on the device and return the output.
+            inTimeout is the idle timeout, inDeadline the total one """
         assert inCmd != None
 
         # Handle blank commands (i.e. unimplemented in the Device subclass)
@@ -272,19 +653,15 @@ class SshConnection( Connection ):
         self._debuglog( "Trying to match:\n\t" + "\n\t".join(prompts) \
                        + "\n             in: " + self._lastPrompt )
 
-        result = self._conn.expect( prompts, self._timeout )
+        result = self._expect( prompts, inTimeout, inDeadline )
 
         # Store the last prompt we saw
         if result[1] != None:
-            self._lastPrompt = result[1].group()
+            self._setLastPrompt( result[1].group() )
 
-        # Remove the command itself from the output
-        exp = re.compile( '^%s\s*$\n' % re.escape(inCmd), re.MULTILINE )
-        output = exp.sub( '', result[2], 1 )
-        
-        # Remove the prompt from the output and return the results
-        exp = re.compile( self._device.getPrompt('command') )
-        return exp.sub( '', output )
+        # Remove the command itself and the prompt from the output and
+        # return the results
+        return self._cleanOutput( inCmd, result[2] )
 
     #def cmd( self, inCmd=None, inPrompt=None, inConfirm=False ):
     #    """ Run a command on the device and return the output """
@@ -347,6 +724,10 @@ class SshConnection( Connection ):
     def enable( self, inPass=None ):
         """ Put the connection in 'superuser' mode """
 
+        if self._mode['enabled']:
+            self._debuglog( "Already enabled" )
+            return True
+
         if inPass == None:
             inPass = ''
  
@@ -364,7 +745,7 @@ class SshConnection( Connection ):
         
         while enabled != 1:
             self._debuglog( "Trying to match:\n\t" + "\n\t".join(matches) )
-            result = self._conn.expect( matches, self._timeout )
+            result = self._conn.expect( matches, self._getTimeout( 'idle' ) )
             
             if result[0] == 0:
                 self._debuglog( "Matched: [" +  str(result[0]) + "]: " + matches[result[0]] )
@@ -378,7 +759,7 @@ class SshConnection( Connection ):
                     if sentExtraNewline:
                         self._debuglog( "Still facing a password prompt. Enable Failed" )
                         self._debuglog( "matched [" + str(result[0]) + "]:" + result[2] )
-                        raise RuntimeError, LoginFailedException
+                        raise RuntimeError, EnableFailedException
                     else:
                         self._debuglog( "Still facing a password prompt. Extra Newline ?" )
                         self._debuglog( "matched [" + str(result[0]) + "]:" + result[2] )
@@ -393,7 +774,7 @@ class SshConnection( Connection ):
                 if sentEnablePass:
                     self._debuglog( "Still facing a not-enabled prompt. Enable Failed" )
                     self._debuglog( "matched [" + str(result[0]) + "]:" + result[2] )
-                    raise RuntimeError, LoginFailedException
+                    raise RuntimeError, EnableFailedException
                 self._debuglog( "Found a not-enabled prompt. Sending Enable" )
                 self._conn.write( self._device.getCommand('enable') + "\n" )
                 sentEnable = 1
@@ -401,6 +782,7 @@ class SshConnection( Connection ):
             elif result[0] == 2:
                 self._debuglog( "Matched: [" +  str(result[0]) + "]: " + matches[result[0]] )
                 self._debuglog( "Found an enabled cmd prompt: We are enabled" )
+                self._setLastPrompt( result[1].group() )
                 enabled  = 1
            
             elif result[0] == -1:
@@ -408,7 +790,7 @@ class SshConnection( Connection ):
                 if sentWakeup:
                     self._debuglog( "Still no command or password prompt. Quitting" )
                     self._debuglog( "matched [" + str(result[0]) + "]:" + result[2] )
-                    raise RuntimeError, LoginFailedException
+                    raise RuntimeError, EnableFailedException
                 self._debuglog( "Found no command or password prompt. Trying to wakeup the device with CRLF." )
                 self.wakeup()
                 sentWakeup = 1
@@ -425,10 +807,12 @@ class SshConnection( Connection ):
     def isEnabled( self ):
         """ Returns true if the connection is in 'superuser' mode """
         
+        if self._mode['enabled'] != None:
+            return self._mode['enabled']
+
         self._debuglog( "Trying to match " + self._device.getPrompt( 'enabledIndicator' ) \
             + " in " + self._lastPrompt )
-        exp = re.compile( self._device.getPrompt( 'enabledIndicator' ) )
-        if exp.search( self._lastPrompt ) == None:
+        if self._device.getPromptRE( 'enabledIndicator' ).search( self._lastPrompt ) == None:
             return 0
         else:
             return 1
@@ -436,8 +820,7 @@ class SshConnection( Connection ):
     def isLoggedIn( self ):
         """ Returns true if the connection is already logged in """
     
-        exp = re.compile( self._device.getPrompt( 'command' ) )
-        if exp.search( self._lastPrompt ) == None:
+        if self._device.getPromptRE( 'command' ).search( self._lastPrompt ) == None:
             return 0
         else:
             return 1
@@ -446,18 +829,20 @@ class SshConnection( Connection ):
 class TelnetConnection( Connection ):
     """ Encapsulates a telnet connection to a device """
     
-    def __init__( self, inDevice=None ):
-        """ Constructor """
+    def __init__( self, inDevice=None, inOptions=None, inJumpHost=None ):
+        """ Constructor. Telnet has no transport options; inOptions is only
+            here so every transport is created the same way """
         assert inDevice != None
         
-        Connection.__init__( self, inDevice )
-        self._conn = telnetlib.Telnet()
+        Connection.__init__( self, inDevice, inJumpHost=inJumpHost )
+        self._conn = Telnet()
 
     def open( self, inHost=None, inPort=23 ):
         """ Open the connection to the device """
         assert inHost != None
         
-        self._conn.open( inHost, inPort )
+        self._conn.open( inHost, inPort,
+                         inSock=self._openSocket( inHost, inPort ) )
         self._isOpen = 1
         self._debuglog( "Connection open" )
         if self._device.needsWakeup():
@@ -466,6 +851,11 @@ class TelnetConnection( Connection ):
     def crlf( self ):
         self._conn.write("\r\n")
 
+    def sendBreak( self ):
+        """ Send a serial break, through a console server """
+        self._debuglog( "sending a break" )
+        self._conn.sendBreak()
+
     def wakeup( self ):
         """ Helper function to send CRLF's to the device in order to wake it up """
         self._debuglog( "Trying to wakeup the device with CRLF (twice)" )
@@ -482,6 +872,7 @@ class TelnetConnection( Connection ):
                 self._conn.cmd(self._device.getCommand('logout'))
             self._conn.close()
         self._isOpen = 0
+        self._resetMode()
 
     def login( self, inUser=None, inPass=None ):
         """ Login to the device using a username and password """
@@ -505,7 +896,7 @@ class TelnetConnection( Connection ):
 
         while loggedIn != 1:
             self._debuglog( "Trying to match:\n\t" + "\n\t".join(matches) )
-            result = self._conn.expect( matches, self._timeout )
+            result = self._conn.expect( matches, self._getTimeout( 'login' ) )
 
             if result[0] == 0:
                 self._debuglog( "Matched: [" +  str(result[0]) + "]: " + matches[result[0]] )
@@ -539,6 +930,7 @@ class TelnetConnection( Connection ):
             elif result[0] == 4:
                 self._debuglog( "Matched: [" +  str(result[0]) + "]: " + matches[result[0]] )
                 self._debuglog( "Found a cmd prompt: We are logged in" )
+                self._setLastPrompt( result[1].group() )
                 loggedIn = 1
 
             elif result[0] == 5:
@@ -565,8 +957,10 @@ class TelnetConnection( Connection ):
         else:
             self.disablePaging()
     
-    def cmd( self, inCmd=None, inPrompt=None, inConfirm=False ):
-        """ Run a command on the device and return the output """
+    def cmd( self, inCmd=None, inPrompt=None, inConfirm=False,
+             inTimeout=None, inDeadline=None ):
+        """ Run a command on the device and return the output.
+            inTimeout is the idle timeout, inDeadline the total one """
         assert inCmd != None
 
         # Handle blank commands (i.e. unimplemented in the Device subclass)
@@ -589,19 +983,15 @@ class TelnetConnection( Connection ):
 
         self._debuglog( "Looking for cmd prompt + (" + str(prompts) + ")" )
 
-        result = self._conn.expect( prompts, self._timeout )
+        result = self._expect( prompts, inTimeout, inDeadline )
 
         # Store the last prompt we saw
         if result[1] != None:
-            self._lastPrompt = result[1].group()
+            self._setLastPrompt( result[1].group() )
 
-        # Remove the command itself from the output
-        exp = re.compile( '^%s\s*$\n' % re.escape(inCmd), re.MULTILINE )
-        output = exp.sub( '', result[2], 1 )
-        
-        # Remove the prompt from the output and return the results
-        exp = re.compile( self._device.getPrompt('command') )
-        return exp.sub( '', output )
+        # Remove the command itself and the prompt from the output and
+        # return the results
+        return self._cleanOutput( inCmd, result[2] )
 
     #def cmd( self, inCmd=None, inPrompt=None, inConfirm=False ):
     #        """ Run a command on the device and return the output """
@@ -676,6 +1066,10 @@ class TelnetConnection( Connection ):
         if self._device._needsEnable == 0:
             return True
 
+        if self._mode['enabled']:
+            self._debuglog( "Already enabled" )
+            return True
+
         if inPass == None:
             inPass = ''
  
@@ -693,7 +1087,7 @@ class TelnetConnection( Connection ):
         
         while enabled != 1:
             self._debuglog( "Trying to match:\n\t" + "\n\t".join(matches) )
-            result = self._conn.expect( matches, self._timeout )
+            result = self._conn.expect( matches, self._getTimeout( 'idle' ) )
             
             if result[0] == 0:
                 self._debuglog( "Matched: [" +  str(result[0]) + "]: " + matches[result[0]] )
@@ -707,7 +1101,7 @@ class TelnetConnection( Connection ):
                     if sentExtraNewline:
                         self._debuglog( "Still facing a password prompt. Enable Failed" )
                         self._debuglog( "matched [" + str(result[0]) + "]:" + result[2] )
-                        raise RuntimeError, LoginFailedException
+                        raise RuntimeError, EnableFailedException
                     else:
                         self._debuglog( "Still facing a password prompt. Extra Newline ?" )
                         self._debuglog( "matched [" + str(result[0]) + "]:" + result[2] )
@@ -722,7 +1116,7 @@ class TelnetConnection( Connection ):
                 if sentEnablePass:
                     self._debuglog( "Still facing a not-enabled prompt. Enable Failed" )
                     self._debuglog( "matched [" + str(result[0]) + "]:" + result[2] )
-                    raise RuntimeError, LoginFailedException
+                    raise RuntimeError, EnableFailedException
                 self._debuglog( "Found a not-enabled prompt. Sending Enable" )
                 self._conn.write( self._device.getCommand('enable') + "\n" )
                 sentEnable = 1
@@ -730,6 +1124,7 @@ class TelnetConnection( Connection ):
             elif result[0] == 3:
                 self._debuglog( "Matched: [" +  str(result[0]) + "]: " + matches[result[0]] )
                 self._debuglog( "Found an enabled cmd prompt: We are enabled" )
+                self._setLastPrompt( result[1].group() )
                 enabled  = 1
            
             elif result[0] == -1:
@@ -737,7 +1132,7 @@ class TelnetConnection( Connection ):
                 if sentWakeup:
                     self._debuglog( "Still no command or password prompt. Quitting" )
                     self._debuglog( "matched [" + str(result[0]) + "]:" + result[2] )
-                    raise RuntimeError, LoginFailedException
+                    raise RuntimeError, EnableFailedException
                 self._debuglog( "Found no command or password prompt. Trying to wakeup the device with CRLF." )
                 self.wakeup()
                 sentWakeup = 1
@@ -760,10 +1155,12 @@ class TelnetConnection( Connection ):
         if self._device._needsEnable == 0:
             return True
         
+        if self._mode['enabled'] != None:
+            return self._mode['enabled']
+
         self._debuglog( "Trying to match " + self._device.getPrompt( 'enabledIndicator' ) \
             + " in " + self._lastPrompt )
-        exp = re.compile( self._device.getPrompt( 'enabledIndicator' ) )
-        if exp.search( self._lastPrompt ) == None:
+        if self._device.getPromptRE( 'enabledIndicator' ).search( self._lastPrompt ) == None:
             return 0
         else:
             return 1
@@ -771,33 +1168,215 @@ class TelnetConnection( Connection ):
     def isLoggedIn( self ):
         """ Returns true if the connection is already logged in """
     
-        exp = re.compile( self._device.getPrompt( 'command' ) )
-        if exp.search( self._lastPrompt ) == None:
+        if self._device.getPromptRE( 'command' ).search( self._lastPrompt ) == None:
             return 0
         else:
             return 1
 
 # ------------------------------------------------------------------------
 
+class SshExecConnection( Connection ):
+    """ Encapsulates an Ssh connection running each command on its own
+        exec channel. No prompt matching is needed: the output of a command
+        ends when the device closes its channel. """
+
+    def __init__( self, inDevice=None, inChannels=4, inOptions=None,
+                  inJumpHost=None ):
+        """ Constructor. inOptions are the transport options described in
+            sshtransport. Host keys are checked against ~/.ssh/known_hosts
+            and unknown hosts refused; set strictHostKeys to 0 to accept
+            them on first use """
+        assert inDevice != None
+
+        Connection.__init__( self, inDevice, inJumpHost=inJumpHost )
+        self._transport = None
+        self._channels  = inChannels
+        self._options   = inOptions
+
+    def open( self, inHost=None, inPort=22 ):
+        """ Open the connection to the device """
+        assert inHost != None
+
+        self._transport = openTransport( inHost, inPort, self._options,
+                                         self._getTimeout( 'connect' ),
+                                         self._getTimeout( 'login' ),
+                                         self._openSocket( inHost, inPort ) )
+        self._isOpen = 1
+        self._debuglog( "Connection open" )
+
+    def close( self ):
+        """ Close the connection to the device """
+
+        if self._isOpen:
+            self._transport.close()
+        self._isOpen = 0
+        self._resetMode()
+
+    def login( self, inUser=None, inPass=None ):
+        """ Login to the device using a username and password """
+        assert inUser != None
+
+        try:
+            authenticate( self._transport, inUser, inPass )
+        except AuthenticationError:
+            raise RuntimeError, LoginFailedException
+
+        if not self._transport.is_authenticated():
+            raise RuntimeError, LoginFailedException
+        self._debuglog( "Authenticated as " + inUser )
+
+    def cmd( self, inCmd=None, inPrompt=None, inConfirm=False,
+             inTimeout=None, inDeadline=None ):
+        """ Run a command on its own channel and return the output.
+            inTimeout is the idle timeout, inDeadline the total one """
+        assert inCmd != None
+
+        # Handle blank commands (i.e. unimplemented in the Device subclass)
+        if inCmd == "":
+            return ""
+
+        idle     = self._getTimeout( 'idle',     inTimeout )
+        deadline = self._getTimeout( 'deadline', inDeadline )
+        start    = time.time()
+
+        self._debuglog( "running command (" + inCmd + ") on a new channel" )
+        chan = self._transport.open_session( timeout=idle )
+        try:
+            chan.settimeout( idle )
+            chan.exec_command( inCmd )
+
+            if inConfirm:
+                chan.sendall( "y\n" )
+
+            output = OutputBuffer( self._spillSize, self._maxSize )
+            while 1:
+                if deadline and time.time() - start > deadline:
+                    raise socket.timeout( "Deadline exceeded running " + inCmd )
+                data = chan.recv( 32768 )
+                if not data:
+                    break
+                output.append( data )
+        finally:
+            chan.close()
+
+        return output.getvalue()
+
+    def cmds( self, inCmds=None, inChannels=None ):
+        """ Run several commands concurrently, each on its own channel, and
+            return their outputs in the same order """
+        assert inCmds != None
+
+        if inChannels == None:
+            inChannels = self._channels
+
+        outputs = [ None ] * len( inCmds )
+        errors  = []
+        pending = range( len( inCmds ) )
+        lock    = threading.Lock()
+
+        def worker():
+            while 1:
+                lock.acquire()
+                try:
+                    if not pending or errors:
+                        return
+                    i = pending.pop( 0 )
+                finally:
+                    lock.release()
+
+                try:
+                    outputs[i] = self.cmd( inCmds[i] )
+                except Exception, e:
+                    errors.append( e )
+
+        threads = []
+        for i in range( min( inChannels, len( inCmds ) ) ):
+            t = threading.Thread( target=worker )
+            t.start()
+            threads.append( t )
+        for t in threads:
+            t.join()
+
+        if errors:
+            raise errors[0]
+
+        return outputs
+
+    # Exec channels run at the privilege level given at login, and have
+    # no pager, so these are no-ops
+    def disablePaging( self ):
+        pass
+
+    def enablePaging( self ):
+        pass
+
+    def enable( self, inPass=None ):
+        """ Put the connection in 'superuser' mode """
+        return True
+
+    def disable( self ):
+        """ Take the connection out of 'superuser' mode """
+        return True
+
+    def isEnabled( self ):
+        """ Returns true if the connection is in 'superuser' mode """
+        return True
+
+    def changeContext( self, inContext=None ):
+        """ Each command runs in a new session here, so there is no context
+            to carry over """
+        assert inContext != None
+
+        if inContext:
+            raise RuntimeError( "Contexts need an interactive (telnet or ssh) session" )
+
+    def isLoggedIn( self ):
+        """ Returns true if the connection is already logged in """
+
+        if self._transport != None and self._transport.is_authenticated():
+            return 1
+        return 0
+
+# ------------------------------------------------------------------------
+
 
     
+# Connection classes by transport name. Other packages add theirs with
+# registerTransport(), or through a 'netdevicelib.transports' entry point
+_transports = { 'telnet'   : TelnetConnection,
+                'ssh'      : SshConnection,
+                'ssh-exec' : SshExecConnection }
+
+def registerTransport( inType=None, inConstructor=None ):
+    """ Make a connection class available to ConnectionFactory under a
+        name. It is called as inConstructor( device, inOptions=...,
+        inJumpHost=... ) """
+    assert inType        != None
+    assert inConstructor != None
+
+    _transports[inType] = inConstructor
+
 class ConnectionFactory:
     """ Factory class for creating Connecton sub-class objects """
     
-    def createConnection( self, inType=None, inClass=None ):
-        """ Factory method to create Connection sub-class objects """
+    def createConnection( self, inType=None, inClass=None, inOptions=None,
+                          inJumpHost=None ):
+        """ Factory method to create Connection sub-class objects.
+            inOptions are transport options, used by ssh connections, and
+            inJumpHost a tunnels.JumpHost to reach the device through """
         assert inType  != None
         assert inClass != None
 
+        if not _transports.has_key( inType ):
+            loadEntryPoints( TRANSPORTS_GROUP, _transports )
+        if not _transports.has_key( inType ):
+            raise RuntimeError( "Type '" + inType + "' not supported" )
+
         # Create the device object
         device = DeviceFactory().createDevice( inClass )
         
-        if inType == 'telnet':
-            return TelnetConnection( device )
-        elif inType == 'ssh':
-            return SshConnection( device )
-        else:
-            raise RuntimeError( "Type '" + inType + "' not supported" )
+        return _transports[inType]( device, inOptions=inOptions,
+                                    inJumpHost=inJumpHost )
 
 # ========================================================================
 #  Test driver
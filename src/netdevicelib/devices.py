@@ -9,7 +9,7 @@
 #  $Id: devices.py,v 1.6 2002/06/19 22:59:41 bluecoat93 Exp $
 # ========================================================================
 
-import string, sys
+import re, string, sys
 
 # We requre Python 2.0
 pyversion = string.split( string.split( sys.version )[0], "." )
@@ -18,6 +18,8 @@ if map( int, pyversion ) < [2, 0, 0]:
     sys.stderr.write( "Sorry, this library requires at least Python 2.0\n" )
     sys.exit(1);
 
+from netdevicelib.plugins import DEVICES_GROUP, loadEntryPoints
+
 # ------------------------------------------------------------------------
 
 # Module documentation strings
@@ -29,9 +31,11 @@ class Device:
     def __init__( self ):
         """ Constructor """
         self._class             = "BASE CLASS"
+        self._compiled          = {}
         
         self._needsEnable       = 1
         self._needsWakeup       = 0
+        self._switchFromSystem  = 0
         self._commands          = { 'disablePaging' : '',
                                     'enablePaging'  : '',
                                     'getConfig'     : '',
@@ -45,15 +49,24 @@ class Device:
                                     'enable'          : '',
                                     'enabledIndicator': ''}
 
+        # Timeouts in seconds. None means "use the connection's timeout",
+        # except for the deadline where it means "no total deadline"
+        self._timeouts          = { 'connect'  : None,
+                                    'login'    : None,
+                                    'idle'     : None,
+                                    'deadline' : None }
+
         # These are the default commands and prompts
         self.setCommand('erase-config',        'write erase')
         self.setCommand('write erase',         'write erase')
         self.setCommand('save-config',         'write mem')
+        self.setCommand('load-config',         'copy startup-config running-config')
         self.setCommand('reload',              'reload' )
         self.setCommand('enable',              'enable' )
         self.setCommand('disable',             'disable' )
         self.setCommand('config',              'config term' )
         self.setCommand('end',                 'end' )
+        self.setCommand('pagerContinue',       ' ' )
         self.setPrompt( 'login',               '[Ll]ogin[:\s]*$' )
         self.setPrompt( 'username',            '[Uu]sername[:\s]*$' )
         self.setPrompt( 'password',            '[Pp]assw(?:or)?d[:\s]*$' )
@@ -67,7 +80,11 @@ class Device:
         self.setPrompt( 'initialconfig',       'Would you like to enter the initial configuration dialog\? \[yes/no\]:\s*' )
         self.setPrompt( 'rommon',              'rommon\s*#?\d+\s*>\s*$' )
         self.setPrompt( 'confirm',             '\[(confirm|Y|N|yes/no)\]' )
+        self.setPrompt( 'filename',            '[Ff]ilename \[[\w.:/-]*\]\?\s*$' )
         self.setPrompt( 'booting',             '##################|@@@@@@@@@@@@@@@@|POST: PortASIC' )
+        self.setPrompt( 'pressReturn',         'Press RETURN to get started' )
+        self.setPrompt( 'more',                ' ?--More--\s*$|<--- More --->\s*$' )
+        self.setPrompt( 'moreErase',           '\x08+ *\x08+|\r {2,}\r|\x1b\[K' )
 
     def getPrompt( self, inKey=None ):
         """ Get the RE to match a given prompt on the device """
@@ -84,6 +101,23 @@ class Device:
         assert inValue != None
 
         self._prompts[inKey] = inValue
+        if self._compiled.has_key( inKey ):
+            del self._compiled[inKey]
+
+    def getPromptRE( self, inKey=None ):
+        """ Get the compiled RE for a given prompt, or None if it isn't set """
+        assert inKey != None
+
+        try:
+            return self._compiled[inKey]
+        except KeyError:
+            prompt = self.getPrompt( inKey )
+            if prompt:
+                exp = re.compile( prompt )
+            else:
+                exp = None
+            self._compiled[inKey] = exp
+            return exp
 
     def getCommand( self, inKey=None ):
         """ Get the command to perform a given function on the device """
@@ -101,6 +135,21 @@ class Device:
 
         self._commands[inKey] = inValue
 
+    def getTimeout( self, inKey=None ):
+        """ Get a timeout (connect, login, idle or deadline) for the device """
+        assert inKey != None
+
+        try:
+            return self._timeouts[inKey]
+        except KeyError:
+            return None
+
+    def setTimeout( self, inKey=None, inValue=None ):
+        """ Set a timeout (connect, login, idle or deadline) for the device """
+        assert inKey != None
+
+        self._timeouts[inKey] = inValue
+
     def needsEnable( self ):
         return self._needsEnable
     
@@ -110,6 +159,10 @@ class Device:
             self._needsWakeup = val
         return ret
 
+    def switchesFromSystem( self ):
+        """ True if changing contexts must start from the system level """
+        return self._switchFromSystem
+
 class NXOSDevice( Device ):
     def __init__( self ):
         """ Constructor"""
@@ -123,6 +176,15 @@ class NXOSDevice( Device ):
         self.setCommand( 'getConfig',     'show running-config' )
         self.setPrompt(  'rommon',        'switch\(boot\)(?:\(config\))?#\s*$' )
 
+        # VDCs. The default VDC (number 1) is the system level, left out
+        # of the list; switchto only works from there
+        self._switchFromSystem = 1
+        self.setCommand( 'listContexts',  'show vdc' )
+        self.setCommand( 'changeContext', 'switchto vdc %s' )
+        self.setCommand( 'changeSystem',  'switchback' )
+        self.setPrompt(  'contextList',   '(?m)^\s*(?!1\s)\d+\s+([\w.-]+)\s+active' )
+        self.setPrompt(  'contextError',  '(?m)^\s*(?:% |Invalid|ERROR)' )
+
 class IOSDevice( Device ):
     def __init__( self ):
         """ Constructor"""
@@ -161,6 +223,7 @@ class PixDevice( Device ):
         self.setCommand( 'disablePaging', 'no pager' )
         self.setCommand( 'enablePaging',  'pager' )
         self.setCommand( 'getConfig',     'write term' )
+        self.setPrompt(  'more',          '<--- More --->\s*$' )
 
 class ASADevice( Device ):
     def __init__( self ):
@@ -177,6 +240,20 @@ class ASADevice( Device ):
         self.setCommand( 'disablePaging',   "conf t\r\nno pager\r\nend"   )
         self.setCommand( 'enablePaging',    "conf t\r\npager 24\r\nend"   )
         self.setCommand( 'getConfig',       'write term'                  )
+        self.setPrompt(  'more',            '<--- More --->\s*$'          )
+        self.setPrompt(  'initialconfig',   'Pre-configure Firewall now through interactive prompts \[yes\]\?\s*' )
+
+        # Security contexts. Their prompts read "hostname/context#"
+        self.setCommand( 'listContexts',       'show context' )
+        self.setCommand( 'changeContext',      'changeto context %s' )
+        self.setCommand( 'changeSystem',       'changeto system' )
+        self.setPrompt(  'contextList',        '(?m)^[ *]([\w.-]+)\s' )
+        self.setPrompt(  'contextError',       '(?m)^(?:ERROR|% )' )
+        self.setPrompt(  'contextIndicator',   '/([\w.-]+)(?:\([\w.-]+\))?[#>]\s*$' )
+        self.setPrompt(  'command-config',     '[\w./-]+(?:\((ca-trustpoint|config[\w.-]*)\)#)\s*$' )
+        self.setPrompt(  'command-enabled',    '[\w()./-]+(>\s?\(enabled\)|(?<!#)#)\s*$' )
+        self.setPrompt(  'command-notenabled', '[\w()./-]+(?:\d+)?[\$>]\s*$' )
+        self.setPrompt(  'command',            '[\w()./-]+(?<!#)[\$#>]\s?(?:\(enable\))?\s*$' )
 
 class BBDevice( Device ):
     def __init__(self):
@@ -192,26 +269,37 @@ class BBDevice( Device ):
         self.setPrompt( 'command-answer',      'Press <ESC> to Exit ...\s*$' )
         self.setPrompt( 'command',             'RPM>\s*$' )
         self.setPrompt( 'command-enabled',     'RPM>\s*$' )
+        self.setPrompt( 'more',                '' )
+
+# ------------------------------------------------------------------------
+
+# Device classes by name. Other packages add theirs with registerDevice(),
+# or through a 'netdevicelib.devices' entry point
+_devices = { 'IOS'   : IOSDevice,
+             'NXOS'  : NXOSDevice,
+             'CatOS' : CatOSDevice,
+             'Pix'   : PixDevice,
+             'ASA'   : ASADevice,
+             'BB'    : BBDevice }
+
+def registerDevice( inClass=None, inConstructor=None ):
+    """ Make a device class available to DeviceFactory under a name """
+    assert inClass       != None
+    assert inConstructor != None
+
+    _devices[inClass] = inConstructor
 
 class DeviceFactory:
     def createDevice( self, inClass=None ):
         assert inClass != None
 
-        if inClass == 'IOS':
-            return IOSDevice()
-        elif inClass == 'NXOS':
-            return NXOSDevice()
-        elif inClass == 'CatOS':
-            return CatOSDevice()
-        elif inClass == 'Pix':
-            return PixDevice()
-        elif inClass == 'ASA':
-            return ASADevice()
-        elif inClass == 'BB':
-            return BBDevice()
-        else:
+        if not _devices.has_key( inClass ):
+            loadEntryPoints( DEVICES_GROUP, _devices )
+        if not _devices.has_key( inClass ):
             raise RuntimeError( "Class '" + inClass + "' not supported" )
 
+        return _devices[inClass]()
+
 # ------------------------------------------------------------------------
 
 if __name__ == "__main__":
@@ -0,0 +1,281 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Classes which run fleet jobs that survive a restart: progress is kept
+#  in an append-only journal so a rerun skips finished work
+#
+#  $Id$
+# ========================================================================
+
+import Queue, os, threading, time, urllib
+
+from netdevicelib.buffers import SpilledOutput
+from netdevicelib.runners import connectHost, resolveHosts, runCommand
+
+# ------------------------------------------------------------------------
+
+# Module documentation strings
+__version__ = '$Revision: 1.1 $'.split()[-2]
+
+# Host states recorded in the journal
+STATE_PENDING   = 'pending'
+STATE_CONNECTED = 'connected'
+STATE_COMMAND   = 'command'
+STATE_STORED    = 'stored'
+STATE_FAILED    = 'failed'
+
+# ------------------------------------------------------------------------
+
+class Journal:
+    """ Append-only record of each host's progress.
+
+    Every update is one line: host, state and the number of commands done,
+    separated by tabs. Lines are buffered and written out every
+    inFlushInterval seconds, so thousands of updates per second cost one
+    write() each interval. Once the file holds inCompactAfter lines more
+    than there are hosts, it is rewritten with just the latest state.
+    """
+
+    def __init__( self, inPath=None, inFlushInterval=1.0, inCompactAfter=100000,
+                  inSync=0 ):
+        """ Constructor. inSync also fsync()s on every flush """
+        assert inPath != None
+
+        self._path          = inPath
+        self._flushInterval = inFlushInterval
+        self._compactAfter  = inCompactAfter
+        self._sync          = inSync
+        self._lock          = threading.Lock()
+        self._state         = {}
+        self._pending       = []
+        self._lines         = 0
+        self._lastFlush     = time.time()
+
+        self._load()
+        self._file = open( self._path, 'a' )
+
+    def _load( self ):
+        """ Replay an existing journal """
+
+        if not os.path.exists( self._path ):
+            return
+
+        f = open( self._path, 'r+' )
+        try:
+            size = 0
+            for line in f:
+                if not line.endswith( "\n" ):
+                    # A torn write from a crash: only the last line can be
+                    break
+                size   = size + len( line )
+                fields = line.rstrip( "\n" ).split( "\t" )
+                if len( fields ) != 3:
+                    continue
+                self._state[fields[0]] = ( fields[1], int( fields[2] ) )
+                self._lines = self._lines + 1
+
+            # Cut the torn line off, or the next record would be appended
+            # to it and lost too
+            f.truncate( size )
+        finally:
+            f.close()
+
+    def get( self, inHost=None ):
+        """ Return ( state, commandsDone ) for a host """
+        assert inHost != None
+
+        return self._state.get( inHost, ( STATE_PENDING, 0 ) )
+
+    def record( self, inHost=None, inState=None, inDone=0 ):
+        """ Record a host's progress """
+        assert inHost  != None
+        assert inState != None
+
+        self._lock.acquire()
+        try:
+            self._state[inHost] = ( inState, inDone )
+            self._pending.append( "%s\t%s\t%d\n" % ( inHost, inState, inDone ) )
+            self._lines = self._lines + 1
+
+            if time.time() - self._lastFlush >= self._flushInterval:
+                self._flush()
+            if self._lines - len( self._state ) >= self._compactAfter:
+                self._compact()
+        finally:
+            self._lock.release()
+
+    def flush( self ):
+        """ Write buffered updates out to the journal """
+
+        self._lock.acquire()
+        try:
+            self._flush()
+        finally:
+            self._lock.release()
+
+    def _flush( self ):
+        if self._pending:
+            self._file.write( "".join( self._pending ) )
+            self._pending = []
+            self._file.flush()
+            if self._sync:
+                os.fsync( self._file.fileno() )
+        self._lastFlush = time.time()
+
+    def _compact( self ):
+        """ Replace the journal by one line per host """
+
+        self._flush()
+        self._file.close()
+
+        tmp = self._path + ".tmp"
+        f = open( tmp, 'w' )
+        try:
+            for host, ( state, done ) in self._state.items():
+                f.write( "%s\t%s\t%d\n" % ( host, state, done ) )
+            f.flush()
+            os.fsync( f.fileno() )
+        finally:
+            f.close()
+        os.rename( tmp, self._path )
+
+        self._lines = len( self._state )
+        self._file  = open( self._path, 'a' )
+
+    def close( self ):
+        """ Flush and close the journal """
+
+        self._lock.acquire()
+        try:
+            self._flush()
+            self._file.close()
+        finally:
+            self._lock.release()
+
+class ResultStore:
+    """ Keeps command outputs in a directory, one file per host and command """
+
+    def __init__( self, inDirectory=None ):
+        """ Constructor """
+        assert inDirectory != None
+
+        self._directory = inDirectory
+        if not os.path.isdir( inDirectory ):
+            os.makedirs( inDirectory )
+
+    def _path( self, inHost, inIndex ):
+        return os.path.join( self._directory,
+                             "%s.%d" % ( urllib.quote( inHost, '' ), inIndex ) )
+
+    def save( self, inHost=None, inIndex=0, inOutput=None ):
+        """ Store the output of command number inIndex on a host """
+        assert inHost   != None
+        assert inOutput != None
+
+        path = self._path( inHost, inIndex )
+        f = open( path + ".tmp", 'wb' )
+        try:
+            if isinstance( inOutput, SpilledOutput ):
+                for line in inOutput:
+                    f.write( line )
+            else:
+                f.write( inOutput )
+        finally:
+            f.close()
+
+        # Only a complete result ever appears under its real name
+        os.rename( path + ".tmp", path )
+
+    def load( self, inHost=None, inIndex=0 ):
+        """ Return the stored output of command number inIndex on a host """
+        assert inHost != None
+
+        f = open( self._path( inHost, inIndex ), 'rb' )
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+# ------------------------------------------------------------------------
+
+class FleetJob:
+    """ Runs a list of commands on many hosts, resuming where a previous
+        run of the same job stopped """
+
+    def __init__( self, inJournal=None, inStore=None, inThreads=16,
+                  inFactory=None, inPolicy=None, inLimiter=None ):
+        """ Constructor """
+        assert inJournal != None
+        assert inStore   != None
+
+        self._journal = inJournal
+        self._store   = inStore
+        self._threads = inThreads
+        self._factory = inFactory
+        self._policy  = inPolicy
+        self._limiter = inLimiter
+
+    def runHost( self, inHost=None, inCommands=None ):
+        """ Run the commands still to do on one host """
+        assert inHost     != None
+        assert inCommands != None
+
+        key         = inHost.getKey()
+        state, done = self._journal.get( key )
+        if state == STATE_STORED and done == len( inCommands ):
+            return 0
+
+        conn = connectHost( inHost, self._factory, self._policy, self._limiter )
+        try:
+            self._journal.record( key, STATE_CONNECTED, done )
+            for i in range( done, len( inCommands ) ):
+                self._store.save( key, i, runCommand( conn, inCommands[i] ) )
+                self._journal.record( key, STATE_COMMAND, i + 1 )
+        finally:
+            conn.close()
+
+        self._journal.record( key, STATE_STORED, len( inCommands ) )
+        return 1
+
+    def run( self, inHosts=None, inCommands=None ):
+        """ Run the job. Returns a dictionary of host key -> 'done',
+            'skipped' or an error message """
+        assert inHosts    != None
+        assert inCommands != None
+
+        resolveHosts( inHosts )
+
+        work = Queue.Queue()
+        for host in inHosts:
+            work.put( host )
+
+        results = {}
+
+        def worker():
+            while 1:
+                try:
+                    host = work.get_nowait()
+                except Queue.Empty:
+                    return
+
+                key = host.getKey()
+                try:
+                    if self.runHost( host, inCommands ):
+                        results[key] = 'done'
+                    else:
+                        results[key] = 'skipped'
+                except Exception, e:
+                    state, done = self._journal.get( key )
+                    self._journal.record( key, STATE_FAILED, done )
+                    results[key] = "%s: %s" % ( e.__class__.__name__, e )
+
+        threads = []
+        for i in range( min( self._threads, len( inHosts ) ) ):
+            t = threading.Thread( target=worker )
+            t.start()
+            threads.append( t )
+        for t in threads:
+            t.join()
+
+        self._journal.flush()
+        return results
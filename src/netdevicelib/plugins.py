@@ -0,0 +1,62 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Functions which find device classes and transports provided by other
+#  packages, through setuptools entry points
+#
+#  $Id$
+# ========================================================================
+
+import sys, threading
+
+# ------------------------------------------------------------------------
+
+# Module documentation strings
+__version__ = '$Revision: 1.1 $'.split()[-2]
+
+# Entry point groups
+DEVICES_GROUP    = 'netdevicelib.devices'
+TRANSPORTS_GROUP = 'netdevicelib.transports'
+
+# Groups already scanned; pkg_resources is slow to import and to scan,
+# so each group is only looked at once, and only when a name is missing
+_scanned     = {}
+_scannedLock = threading.Lock()
+
+# ------------------------------------------------------------------------
+
+def loadEntryPoints( inGroup=None, inRegistry=None ):
+    """ Add the entry points of a group to a registry dictionary, without
+        replacing names already in it. Entry points which fail to load are
+        skipped with a warning. Returns 1 if the group was scanned now, 0
+        if it had been already or setuptools is missing """
+    assert inGroup    != None
+    assert inRegistry != None
+
+    # Held for the whole scan, so that a second caller waits for the
+    # entries instead of finding the group marked and them missing
+    _scannedLock.acquire()
+    try:
+        if _scanned.has_key( inGroup ):
+            return 0
+
+        try:
+            import pkg_resources
+        except ImportError:
+            _scanned[inGroup] = 1
+            return 0
+
+        for entry in pkg_resources.iter_entry_points( inGroup ):
+            if inRegistry.has_key( entry.name ):
+                continue
+            try:
+                inRegistry[entry.name] = entry.load()
+            except Exception, e:
+                # One broken plugin mustn't hide the others
+                sys.stderr.write( "WARNING: can't load %s entry point %s: %s: %s\n" %
+                                  ( inGroup, entry.name, e.__class__.__name__, e ) )
+
+        _scanned[inGroup] = 1
+        return 1
+    finally:
+        _scannedLock.release()
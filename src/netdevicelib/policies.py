@@ -0,0 +1,221 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Classes which decide when to retry connecting to a device and when to
+#  stop trying altogether
+#
+#  $Id$
+# ========================================================================
+
+import errno, random, socket, threading, time
+
+from netdevicelib.connections import LoginFailedException, EnableFailedException
+
+# ------------------------------------------------------------------------
+
+# Module documentation strings
+__version__ = '$Revision: 1.1 $'.split()[-2]
+
+# Exceptions
+CircuitOpenException = "Circuit open. Host recently failed, not trying again yet"
+
+# Failure classes
+FAILURE_REFUSED     = 'refused'
+FAILURE_UNREACHABLE = 'unreachable'
+FAILURE_TIMEOUT     = 'timeout'
+FAILURE_NETWORK     = 'network'
+FAILURE_LOGIN       = 'login'
+FAILURE_ENABLE      = 'enable'
+FAILURE_OTHER       = 'other'
+
+# ------------------------------------------------------------------------
+
+def classifyFailure( inException=None ):
+    """ Map an exception raised while connecting to a failure class """
+    assert inException != None
+
+    if isinstance( inException, socket.timeout ):
+        return FAILURE_TIMEOUT
+
+    if isinstance( inException, socket.error ):
+        code = inException.args and inException.args[0]
+        if code == errno.ECONNREFUSED:
+            return FAILURE_REFUSED
+        if code in ( errno.EHOSTUNREACH, errno.ENETUNREACH ):
+            return FAILURE_UNREACHABLE
+        if code == errno.ETIMEDOUT:
+            return FAILURE_TIMEOUT
+        return FAILURE_NETWORK
+
+    if isinstance( inException, EOFError ):
+        return FAILURE_NETWORK
+
+    if isinstance( inException, RuntimeError ) and inException.args:
+        if inException.args[0] == LoginFailedException:
+            return FAILURE_LOGIN
+        if inException.args[0] == EnableFailedException:
+            return FAILURE_ENABLE
+
+    return FAILURE_OTHER
+
+# ------------------------------------------------------------------------
+
+class RetryPolicy:
+    """ Decides whether a failure is worth retrying and how long to wait """
+
+    def __init__( self, inAttempts=3, inBase=1.0, inMax=30.0, inRetryOn=None ):
+        """ Constructor
+
+        inAttempts -- total number of attempts, including the first one
+        inBase     -- backoff for the first retry, doubled on each retry
+        inMax      -- upper bound for the backoff
+        inRetryOn  -- failure classes worth retrying. Bad credentials are
+                      not retried by default: it only locks accounts.
+        """
+
+        if inRetryOn == None:
+            inRetryOn = [ FAILURE_REFUSED, FAILURE_TIMEOUT, FAILURE_NETWORK ]
+
+        self._attempts = inAttempts
+        self._base     = inBase
+        self._max      = inMax
+        self._retryOn  = inRetryOn
+
+    def shouldRetry( self, inFailure=None, inAttempt=0 ):
+        """ Returns true if attempt number inAttempt (0 based) failing with
+            inFailure should be followed by another attempt """
+        assert inFailure != None
+
+        return inFailure in self._retryOn and inAttempt + 1 < self._attempts
+
+    def delay( self, inAttempt=0 ):
+        """ Seconds to wait after attempt number inAttempt failed. Full
+            jitter keeps many workers from retrying in lockstep """
+
+        return random.uniform( 0, min( self._max, self._base * ( 2 ** inAttempt ) ) )
+
+class CircuitBreaker:
+    """ Stops trying hosts which keep failing for a cooldown period.
+
+    The state is kept in a mapping of host -> ( failures, openUntil ). To
+    share it between processes, pass a multiprocessing.Manager() dict and
+    lock; by default it is shared between the threads of one process.
+    """
+
+    def __init__( self, inThreshold=3, inCooldown=300, inTripOn=None,
+                  inState=None, inLock=None ):
+        """ Constructor """
+
+        if inTripOn == None:
+            inTripOn = [ FAILURE_REFUSED, FAILURE_UNREACHABLE, FAILURE_TIMEOUT,
+                         FAILURE_NETWORK, FAILURE_LOGIN ]
+        if inState == None:
+            inState = {}
+        if inLock == None:
+            inLock = threading.Lock()
+
+        self._threshold = inThreshold
+        self._cooldown  = inCooldown
+        self._tripOn    = inTripOn
+        self._state     = inState
+        self._lock      = inLock
+
+    def allow( self, inHost=None ):
+        """ Returns true if an attempt on inHost may go ahead """
+        assert inHost != None
+
+        self._lock.acquire()
+        try:
+            failures, openUntil = self._state.get( inHost, ( 0, 0 ) )
+            if failures < self._threshold:
+                return 1
+
+            now = time.time()
+            if now < openUntil:
+                return 0
+
+            # Cooldown is over: let a single probe through and keep the
+            # circuit open for everybody else until it reports back
+            self._state[inHost] = ( failures, now + self._cooldown )
+            return 1
+        finally:
+            self._lock.release()
+
+    def isOpen( self, inHost=None ):
+        """ Returns true if attempts on inHost are currently refused """
+        assert inHost != None
+
+        failures, openUntil = self._state.get( inHost, ( 0, 0 ) )
+        return failures >= self._threshold and time.time() < openUntil
+
+    def success( self, inHost=None ):
+        """ Record a successful attempt on inHost """
+        assert inHost != None
+
+        self._lock.acquire()
+        try:
+            if self._state.has_key( inHost ):
+                del self._state[inHost]
+        finally:
+            self._lock.release()
+
+    def failure( self, inHost=None, inFailure=FAILURE_OTHER ):
+        """ Record a failed attempt on inHost """
+        assert inHost != None
+
+        if inFailure not in self._tripOn:
+            return
+
+        self._lock.acquire()
+        try:
+            failures, openUntil = self._state.get( inHost, ( 0, 0 ) )
+            failures = failures + 1
+            if failures >= self._threshold:
+                openUntil = time.time() + self._cooldown
+            self._state[inHost] = ( failures, openUntil )
+        finally:
+            self._lock.release()
+
+# ------------------------------------------------------------------------
+
+class ConnectionPolicy:
+    """ Connects to hosts through a retry policy and a circuit breaker """
+
+    def __init__( self, inRetry=None, inBreaker=None ):
+        """ Constructor """
+
+        if inRetry == None:
+            inRetry = RetryPolicy()
+        if inBreaker == None:
+            inBreaker = CircuitBreaker()
+
+        self._retry   = inRetry
+        self._breaker = inBreaker
+
+    def connect( self, inHost=None, inFactory=None, inLimiter=None ):
+        """ Return a logged-in connection to inHost (a runners.Host). Each
+            attempt's login waits for a slot from inLimiter if one is given """
+        assert inHost != None
+
+        name = inHost.getKey()
+        if not self._breaker.allow( name ):
+            raise RuntimeError, CircuitOpenException
+
+        attempt = 0
+        while 1:
+            try:
+                conn = inHost.connect( inFactory, inLimiter )
+            except Exception, e:
+                failure = classifyFailure( e )
+                self._breaker.failure( name, failure )
+
+                if not self._retry.shouldRetry( failure, attempt ) \
+                   or self._breaker.isOpen( name ):
+                    raise
+
+                time.sleep( self._retry.delay( attempt ) )
+                attempt = attempt + 1
+                continue
+
+            self._breaker.success( name )
+            return conn
@@ -0,0 +1,263 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Classes which poll show commands repeatedly and emit only what changed
+#  since the previous poll, with a full snapshot every so often
+#
+#  $Id$
+# ========================================================================
+
+import Queue, difflib, hashlib, threading
+
+from netdevicelib.runners import connectHost, resolveHosts, runCommand
+
+# ------------------------------------------------------------------------
+
+# Module documentation strings
+__version__ = '$Revision: 1.1 $'.split()[-2]
+
+# Kinds of update
+KIND_FULL  = 'full'
+KIND_DELTA = 'delta'
+KIND_SAME  = 'same'
+
+# ------------------------------------------------------------------------
+
+def diffLines( inOld=None, inNew=None ):
+    """ Line delta turning inOld into inNew: a list of ( start, end, lines )
+        meaning old lines start to end are replaced by lines """
+    assert inOld != None
+    assert inNew != None
+
+    old = inOld.splitlines( True )
+    new = inNew.splitlines( True )
+
+    # Outputs mostly change in a few places: only hand difflib the part
+    # between the common head and tail
+    head  = 0
+    limit = min( len( old ), len( new ) )
+    while head < limit and old[head] == new[head]:
+        head = head + 1
+    tail = 0
+    while tail < limit - head and old[-1 - tail] == new[-1 - tail]:
+        tail = tail + 1
+
+    matcher = difflib.SequenceMatcher( None, old[head:len( old ) - tail],
+                                       new[head:len( new ) - tail], False )
+    delta = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            delta.append( ( head + i1, head + i2, new[head + j1:head + j2] ) )
+    return delta
+
+def applyLines( inOld=None, inDelta=None ):
+    """ Rebuild the new output from the old one and a diffLines() delta """
+    assert inOld   != None
+    assert inDelta != None
+
+    lines = inOld.splitlines( True )
+    for start, end, replacement in reversed( inDelta ):
+        lines[start:end] = replacement
+    return "".join( lines )
+
+def diffRecords( inOld=None, inNew=None ):
+    """ Record delta between two dictionaries of key -> record: a
+        dictionary of the records added or changed, and a list of the keys
+        removed """
+    assert inOld != None
+    assert inNew != None
+
+    changed = {}
+    for key, record in inNew.items():
+        if not inOld.has_key( key ) or inOld[key] != record:
+            changed[key] = record
+
+    removed = [ key for key in inOld.keys() if not inNew.has_key( key ) ]
+    return ( changed, removed )
+
+def applyRecords( inOld=None, inDelta=None ):
+    """ Rebuild the new records from the old ones and a diffRecords() delta """
+    assert inOld   != None
+    assert inDelta != None
+
+    changed, removed = inDelta
+    records = inOld.copy()
+    for key in removed:
+        del records[key]
+    records.update( changed )
+    return records
+
+# ------------------------------------------------------------------------
+
+class DeltaTracker:
+    """ Remembers the last output of every ( host, command ) and turns new
+        outputs into updates.
+
+    An update is ( kind, payload ):
+
+        KIND_FULL  -- payload is the whole output (or its records)
+        KIND_DELTA -- payload is a diffLines() or diffRecords() delta
+        KIND_SAME  -- nothing changed, payload is None
+
+    A full snapshot is sent on the first poll, every inSnapshotEvery polls
+    after that, and whenever a delta wouldn't be much smaller than the
+    output. inParsers maps commands to functions turning their output into
+    a dictionary of key -> record, for record deltas instead of line ones.
+    """
+
+    def __init__( self, inSnapshotEvery=60, inParsers=None ):
+        """ Constructor """
+
+        if inParsers == None:
+            inParsers = {}
+
+        self._snapshotEvery = inSnapshotEvery
+        self._parsers       = inParsers
+        self._last          = {}
+        self._lock          = threading.Lock()
+
+    def update( self, inHost=None, inCommand=None, inOutput=None ):
+        """ Record a new output and return the update to send downstream """
+        assert inHost    != None
+        assert inCommand != None
+        assert inOutput  != None
+
+        output = str( inOutput )
+        digest = hashlib.md5( output ).digest()
+        key    = ( inHost, inCommand )
+
+        self._lock.acquire()
+        try:
+            last = self._last.get( key )
+        finally:
+            self._lock.release()
+
+        parser   = self._parsers.get( inCommand )
+        snapshot = last == None or last[2] + 1 >= self._snapshotEvery
+
+        if not snapshot and last[0] == digest:
+            # Skips the parser too
+            update = ( KIND_SAME, None )
+            value  = last[1]
+        else:
+            if parser != None:
+                value = parser( output )
+            else:
+                value = output
+
+            if snapshot:
+                update = ( KIND_FULL, value )
+            elif parser != None:
+                update = ( KIND_DELTA, diffRecords( last[1], value ) )
+            else:
+                delta = diffLines( last[1], value )
+                size  = 0
+                for start, end, lines in delta:
+                    size = size + sum( map( len, lines ) )
+                if size * 2 > len( output ):
+                    update = ( KIND_FULL, value )
+                else:
+                    update = ( KIND_DELTA, delta )
+
+        if update[0] == KIND_FULL:
+            count = 0
+        else:
+            count = last[2] + 1
+
+        self._lock.acquire()
+        try:
+            self._last[key] = ( digest, value, count )
+        finally:
+            self._lock.release()
+
+        return update
+
+    def forget( self, inHost=None ):
+        """ Drop what is remembered about a host, so it next gets a full
+            snapshot """
+        assert inHost != None
+
+        self._lock.acquire()
+        try:
+            for key in self._last.keys():
+                if key[0] == inHost:
+                    del self._last[key]
+        finally:
+            self._lock.release()
+
+# ------------------------------------------------------------------------
+
+class Poller:
+    """ Runs the same commands on many hosts at every poll() and returns
+        updates from a DeltaTracker """
+
+    def __init__( self, inTracker=None, inThreads=16, inFactory=None,
+                  inPolicy=None, inLimiter=None ):
+        """ Constructor """
+
+        if inTracker == None:
+            inTracker = DeltaTracker()
+
+        self._tracker = inTracker
+        self._threads = inThreads
+        self._factory = inFactory
+        self._policy  = inPolicy
+        self._limiter = inLimiter
+
+    def pollHost( self, inHost=None, inCommands=None ):
+        """ Poll one host. Returns a list of ( command, kind, payload ) """
+        assert inHost     != None
+        assert inCommands != None
+
+        key  = inHost.getKey()
+        conn = connectHost( inHost, self._factory, self._policy, self._limiter )
+        try:
+            updates = []
+            for command in inCommands:
+                kind, payload = self._tracker.update( key, command,
+                                                      runCommand( conn, command ) )
+                updates.append( ( command, kind, payload ) )
+        finally:
+            conn.close()
+
+        return updates
+
+    def poll( self, inHosts=None, inCommands=None ):
+        """ Poll every host. Returns a dictionary of host key -> ( ok, value )
+            where value is the list of updates on success and an error
+            message on failure """
+        assert inHosts    != None
+        assert inCommands != None
+
+        resolveHosts( inHosts )
+
+        work = Queue.Queue()
+        for host in inHosts:
+            work.put( host )
+
+        results = {}
+
+        def worker():
+            while 1:
+                try:
+                    host = work.get_nowait()
+                except Queue.Empty:
+                    return
+
+                try:
+                    results[host.getKey()] = ( 1, self.pollHost( host, inCommands ) )
+                except Exception, e:
+                    # Updates made before the failure never reach the
+                    # caller: start the host over with full snapshots
+                    self._tracker.forget( host.getKey() )
+                    results[host.getKey()] = ( 0, "%s: %s" % ( e.__class__.__name__, e ) )
+
+        threads = []
+        for i in range( min( self._threads, len( inHosts ) ) ):
+            t = threading.Thread( target=worker )
+            t.start()
+            threads.append( t )
+        for t in threads:
+            t.join()
+
+        return results
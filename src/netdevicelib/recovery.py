@@ -0,0 +1,201 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Classes which take many devices through ROMMON recovery at once, over
+#  their console connections: boot ignoring the startup config, load it
+#  back, run commands (to reset passwords, for example), then restore the
+#  config register
+#
+#  $Id$
+# ========================================================================
+
+import Queue, threading
+
+from netdevicelib.connections import ConnectionFactory
+
+# ------------------------------------------------------------------------
+
+# Module documentation strings
+__version__ = '$Revision: 1.1 $'.split()[-2]
+
+# Exceptions
+RecoveryTimeoutException = "Timed out waiting for the device"
+
+# Stages reported for each device, in order
+STAGE_ROMMON   = 'rommon'
+STAGE_CONFREG  = 'confreg'
+STAGE_BOOTING  = 'booting'
+STAGE_SETUP    = 'setup'
+STAGE_LOAD     = 'load'
+STAGE_COMMANDS = 'commands'
+STAGE_RESTORE  = 'restore'
+STAGE_DONE     = 'done'
+STAGE_FAILED   = 'failed'
+
+# ------------------------------------------------------------------------
+
+class Recovery:
+    """ Runs the ROMMON recovery flow on runners.Host objects describing
+        console ports (host and port of the console server).
+
+    Every device is handled by its own thread, waiting on what the
+    console prints rather than sleeping: the device's rommon prompt, then
+    its booting markers and setup dialog, then a command prompt. A device
+    which isn't in ROMMON yet is waited for until it is power-cycled, or,
+    with inBreak, sent a break as soon as it starts booting.
+
+    Once enabled, the startup config the device booted without is copied
+    into the running config, so that inCommands apply on top of it and
+    saving doesn't replace it with a blank config.
+
+    inCommands -- commands run once the device is up, enabled and has its
+                  startup config loaded
+    inSave     -- 1 to save the config after restoring the config register
+    inTimeout  -- longest the console may stay silent at any stage
+    inProgress -- optional function( host, stage, detail ) called at every
+                  step, from the device's thread
+    """
+
+    def __init__( self, inCommands=None, inSave=1, inBreak=0, inThreads=64,
+                  inTimeout=600, inProgress=None, inFactory=None ):
+        """ Constructor """
+
+        if inCommands == None:
+            inCommands = []
+        if inFactory == None:
+            inFactory = ConnectionFactory()
+
+        self._commands = inCommands
+        self._save     = inSave
+        self._break    = inBreak
+        self._threads  = inThreads
+        self._timeout  = inTimeout
+        self._callback = inProgress
+        self._factory  = inFactory
+        self._progress = {}
+
+    def getProgress( self ):
+        """ Return a dictionary of host key -> the stage it last reached """
+        return self._progress.copy()
+
+    def _report( self, inHost, inStage, inDetail='' ):
+        self._progress[inHost.getKey()] = inStage
+        if self._callback != None:
+            self._callback( inHost, inStage, inDetail )
+
+    def _wait( self, inConn, inKeys ):
+        """ Wait for one of the named prompts, failing after inTimeout
+            seconds of silence """
+
+        key, text = inConn.waitFor( inKeys, self._timeout )
+        if key == None:
+            raise RuntimeError, RecoveryTimeoutException
+        return key
+
+    def recoverHost( self, inHost=None ):
+        """ Take one device through recovery. Returns the outputs of the
+            commands """
+        assert inHost != None
+
+        conn   = self._factory.createConnection( inHost.type, inHost.deviceClass )
+        device = conn.getDevice()
+        if inHost.port != None:
+            conn.open( inHost.host, inHost.port )
+        else:
+            conn.open( inHost.host )
+
+        try:
+            self._report( inHost, STAGE_ROMMON, "waiting for ROMMON" )
+            conn.sendLine( '' )
+            booting = 0
+            while 1:
+                key = self._wait( conn, [ 'rommon', 'username', 'login',
+                                          'password', 'booting' ] )
+                if key == 'rommon':
+                    break
+                elif key in ( 'username', 'login' ):
+                    conn.sendLine( inHost.user or '' )
+                elif key == 'password':
+                    conn.sendLine( inHost.password or '' )
+                elif key == 'booting' and not booting:
+                    booting = 1
+                    if self._break:
+                        self._report( inHost, STAGE_ROMMON, "sending a break" )
+                        conn.sendBreak()
+
+            self._report( inHost, STAGE_CONFREG )
+            conn.sendLine( device.getCommand( 'rommon-confreg-ignoreconf' ) )
+            self._wait( conn, [ 'rommon' ] )
+            conn.sendLine( device.getCommand( 'rommon-boot' ) )
+
+            self._report( inHost, STAGE_BOOTING )
+            while 1:
+                key = self._wait( conn, [ 'initialconfig', 'pressReturn',
+                                          'command', 'booting' ] )
+                if key == 'command':
+                    break
+                elif key == 'initialconfig':
+                    self._report( inHost, STAGE_SETUP, "skipping the setup dialog" )
+                    conn.sendLine( 'no' )
+                elif key == 'pressReturn':
+                    conn.sendLine( '' )
+
+            conn.enable( '' )
+            self._report( inHost, STAGE_LOAD, "loading the startup config" )
+            conn.sendLine( device.getCommand( 'load-config' ) )
+            while self._wait( conn, [ 'filename', 'command' ] ) != 'command':
+                conn.sendLine( '' )
+
+            self._report( inHost, STAGE_COMMANDS )
+            outputs = []
+            for command in self._commands:
+                self._report( inHost, STAGE_COMMANDS, command )
+                outputs.append( conn.cmd( command ) )
+
+            self._report( inHost, STAGE_RESTORE )
+            conn.configMode()
+            conn.cmd( device.getCommand( 'default-confreg' ) )
+            conn.endConfigMode()
+            if self._save:
+                conn.cmd( device.getCommand( 'save-config' ) )
+
+            self._report( inHost, STAGE_DONE )
+            return outputs
+        finally:
+            conn.close()
+
+    def run( self, inHosts=None ):
+        """ Recover every host at once, inThreads at a time. Returns a
+            dictionary of host key -> ( ok, value ) where value is the list
+            of outputs on success and an error message on failure """
+        assert inHosts != None
+
+        work = Queue.Queue()
+        for host in inHosts:
+            work.put( host )
+
+        results = {}
+
+        def worker():
+            while 1:
+                try:
+                    host = work.get_nowait()
+                except Queue.Empty:
+                    return
+
+                try:
+                    results[host.getKey()] = ( 1, self.recoverHost( host ) )
+                except Exception, e:
+                    message = "%s: %s" % ( e.__class__.__name__, e )
+                    self._report( host, STAGE_FAILED, message )
+                    results[host.getKey()] = ( 0, message )
+
+        threads = []
+        for i in range( min( self._threads, len( inHosts ) ) ):
+            t = threading.Thread( target=worker )
+            t.start()
+            threads.append( t )
+        for t in threads:
+            t.join()
+
+        return results
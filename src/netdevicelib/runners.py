@@ -0,0 +1,367 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Classes which run commands against many devices at once
+#
+#  $Id$
+# ========================================================================
+
+import Queue, marshal, multiprocessing, os, shutil, sys, tempfile, threading, zlib
+
+from netdevicelib.buffers import SpilledOutput
+from netdevicelib.connections import ConnectionFactory
+from netdevicelib.sockets import defaultResolver
+
+# ------------------------------------------------------------------------
+
+# Module documentation strings
+__version__ = '$Revision: 1.1 $'.split()[-2]
+
+# Records whose compressed size exceeds this many bytes are handed back
+# to the parent through a file in shared memory instead of the pipe
+SPILL_SIZE = 256 * 1024
+
+# ------------------------------------------------------------------------
+
+class Host:
+    """ Describes a device to be handled by a runner """
+
+    def __init__( self, inHost=None, inClass=None, inType='telnet',
+                  inUser=None, inPass=None, inEnablePass=None, inPort=None,
+                  inSite=None, inJumpHost=None ):
+        """ Constructor. inJumpHost is a tunnels.JumpHost, usually shared by
+            every host behind the same bastion """
+        assert inHost  != None
+        assert inClass != None
+
+        self.host        = inHost
+        self.deviceClass = inClass
+        self.type        = inType
+        self.user        = inUser
+        self.password    = inPass
+        self.enablePass  = inEnablePass
+        self.port        = inPort
+        self.site        = inSite
+        self.jumpHost    = inJumpHost
+
+    def __repr__( self ):
+        return "<Host %s (%s/%s)>" % ( self.host, self.type, self.deviceClass )
+
+    def getKey( self ):
+        """ Return a string identifying the host, and port if one was given """
+
+        if self.port != None:
+            return "%s:%s" % ( self.host, self.port )
+        return self.host
+
+    def connect( self, inFactory=None, inLimiter=None ):
+        """ Create, open and login a connection to the host. Only the login
+            waits for a slot from the throttle.AdaptiveLimiter inLimiter """
+
+        if inFactory == None:
+            inFactory = ConnectionFactory()
+
+        # Factories written before jump hosts existed don't take one
+        if self.jumpHost != None:
+            conn = inFactory.createConnection( self.type, self.deviceClass,
+                                               inJumpHost=self.jumpHost )
+        else:
+            conn = inFactory.createConnection( self.type, self.deviceClass )
+        if self.port != None:
+            conn.open( self.host, self.port )
+        else:
+            conn.open( self.host )
+
+        try:
+            if inLimiter != None:
+                inLimiter.call( self._login, conn )
+            else:
+                self._login( conn )
+        except:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            raise
+
+        return conn
+
+    def _login( self, inConn=None ):
+        """ Login and enable an open connection """
+        assert inConn != None
+
+        inConn.login( self.user, self.password )
+
+        if self.enablePass != None:
+            inConn.enable( self.enablePass )
+
+def resolveHosts( inHosts=None ):
+    """ Look up the names of a whole inventory at once, so that connects
+        find them cached. Hosts behind a jump host are resolved by it """
+    assert inHosts != None
+
+    defaultResolver.resolveAll( [ host.host for host in inHosts
+                                  if host.jumpHost == None ] )
+
+def connectHost( inHost=None, inFactory=None, inPolicy=None, inLimiter=None ):
+    """ Return a logged-in connection to a host, going through the
+        policies.ConnectionPolicy inPolicy if one is given, and logging in
+        in a slot from the throttle.AdaptiveLimiter inLimiter if one is
+        given """
+    assert inHost != None
+
+    # The limiter only covers logins: connecting to a dead host or waiting
+    # to retry says nothing about how the AAA servers are doing
+    if inPolicy != None:
+        return inPolicy.connect( inHost, inFactory, inLimiter )
+    return inHost.connect( inFactory, inLimiter )
+
+def runCommands( inHost=None, inCommands=None, inFactory=None, inPolicy=None,
+                 inLimiter=None ):
+    """ Run a list of commands on a host and return the outputs """
+    assert inHost     != None
+    assert inCommands != None
+
+    conn = connectHost( inHost, inFactory, inPolicy, inLimiter )
+    try:
+        outputs = []
+        for command in inCommands:
+            outputs.append( runCommand( conn, command ) )
+    finally:
+        conn.close()
+
+    return outputs
+
+def runCommand( inConn=None, inCommand=None ):
+    """ Run one command on a connection. 'getConfig' stands for the
+        device's own command to show the configuration """
+    assert inConn    != None
+    assert inCommand != None
+
+    if inCommand == 'getConfig':
+        return inConn.getConfig()
+    return inConn.cmd( inCommand )
+
+# ------------------------------------------------------------------------
+
+def _shmDir():
+    """ Return a directory backed by memory if the platform has one """
+
+    if os.path.isdir( '/dev/shm' ):
+        return '/dev/shm'
+    return None
+
+def _plainOutputs( inValue ):
+    """ Turn the SpilledOutput values in a list of outputs, which marshal
+        can't handle, into strings """
+
+    if isinstance( inValue, SpilledOutput ):
+        return str( inValue )
+    if isinstance( inValue, list ):
+        return map( _plainOutputs, inValue )
+    if isinstance( inValue, tuple ):
+        return tuple( map( _plainOutputs, inValue ) )
+    return inValue
+
+def _encodeRecord( inRecord, inDirectory=None ):
+    """ Serialize a result record into a compact string. Large ones go to
+        a file in inDirectory """
+
+    data = zlib.compress( marshal.dumps( inRecord ), 1 )
+    if len( data ) <= SPILL_SIZE:
+        return ( 0, data )
+
+    fd, path = tempfile.mkstemp( prefix='netdevicelib-', dir=inDirectory )
+    try:
+        os.write( fd, data )
+    finally:
+        os.close( fd )
+    return ( 1, path )
+
+def _decodeRecord( inData ):
+    """ Turn the output of _encodeRecord() back into a record """
+
+    spilled, data = inData
+    if spilled:
+        path = data
+        f = open( path, 'rb' )
+        try:
+            data = f.read()
+        finally:
+            f.close()
+            os.unlink( path )
+
+    return marshal.loads( zlib.decompress( data ) )
+
+def _runShard( inIndex, inHosts, inCommands, inProcess, inThreads,
+               inFactory, inPolicy, inLimiter, inResults, inSpillDir ):
+    """ Worker process body: handle one shard of hosts with threads """
+
+    work = Queue.Queue()
+    for i in range( len( inHosts ) ):
+        work.put( i )
+
+    def worker():
+        while 1:
+            try:
+                i = work.get_nowait()
+            except Queue.Empty:
+                return
+
+            host = inHosts[i]
+            try:
+                value = runCommands( host, inCommands, inFactory, inPolicy,
+                                     inLimiter )
+                if inProcess != None:
+                    value = inProcess( host.host, value )
+                record = ( inIndex, i, 1, _plainOutputs( value ) )
+            except Exception, e:
+                record = ( inIndex, i, 0, "%s: %s" % ( e.__class__.__name__, e ) )
+
+            try:
+                inResults.put( _encodeRecord( record, inSpillDir ) )
+            except ValueError:
+                # The processor returned something marshal can't handle
+                inResults.put( _encodeRecord( ( inIndex, i, 0,
+                    "Result for %s is not serializable" % host.host ),
+                    inSpillDir ) )
+
+    threads = []
+    for i in range( min( inThreads, len( inHosts ) ) ):
+        t = threading.Thread( target=worker )
+        t.start()
+        threads.append( t )
+    for t in threads:
+        t.join()
+
+# ------------------------------------------------------------------------
+
+class ShardedRunner:
+    """ Runs commands on many hosts, sharded across worker processes """
+
+    def __init__( self, inProcesses=None, inThreads=16, inProcess=None,
+                  inFactory=None, inPolicy=None, inLimiter=None ):
+        """ Constructor
+
+        inProcesses -- number of worker processes (default: one per CPU)
+        inThreads   -- number of concurrent sessions inside each worker
+        inProcess   -- optional function( host, outputs ) run in the worker
+                       to parse or diff the outputs. It must be defined at
+                       module level and return marshal-able values.
+        inPolicy    -- optional policies.ConnectionPolicy. Give its circuit
+                       breaker a multiprocessing.Manager() dict and lock
+                       to share host state between the workers.
+        inLimiter   -- optional throttle.AdaptiveLimiter for logins. Each
+                       run shares its state between the workers through a
+                       multiprocessing.Manager, so the limit holds for the
+                       whole run; inThreads still bounds the sessions
+                       running commands.
+        """
+
+        if inProcesses == None:
+            inProcesses = multiprocessing.cpu_count()
+
+        assert inProcesses > 0
+        assert inThreads   > 0
+
+        self._processes = inProcesses
+        self._threads   = inThreads
+        self._process   = inProcess
+        self._factory   = inFactory
+        self._policy    = inPolicy
+        self._limiter   = inLimiter
+
+    def run( self, inHosts=None, inCommands=None ):
+        """ Generator yielding ( host, ok, value ) as results arrive
+
+        value is the processed result (or the list of command outputs) on
+        success, and an error message on failure.
+        """
+        assert inHosts    != None
+        assert inCommands != None
+
+        if not inHosts:
+            return
+
+        # Resolve before forking so every worker starts with a warm cache
+        resolveHosts( inHosts )
+
+        # Deal the hosts out round-robin so slow sites get spread around
+        count  = min( self._processes, len( inHosts ) )
+        shards = [ inHosts[i::count] for i in range( count ) ]
+
+        # Large records still in the queue when the caller stops early are
+        # removed along with this directory
+        spillDir = tempfile.mkdtemp( prefix='netdevicelib-', dir=_shmDir() )
+
+        # One limit for all the workers, not one each
+        manager = None
+        limiter = self._limiter
+        if limiter != None:
+            manager = multiprocessing.Manager()
+            limiter = limiter.share( manager )
+
+        results = multiprocessing.Queue()
+        workers = []
+        for i in range( count ):
+            p = multiprocessing.Process( target=_runShard,
+                                         args=( i, shards[i], inCommands,
+                                                self._process, self._threads,
+                                                self._factory, self._policy,
+                                                limiter, results,
+                                                spillDir ) )
+            p.daemon = True
+            p.start()
+            workers.append( p )
+
+        pending = {}
+        for i in range( count ):
+            for j in range( len( shards[i] ) ):
+                pending[ ( i, j ) ] = 1
+
+        try:
+            while pending:
+                try:
+                    data = results.get( True, 1 )
+                except Queue.Empty:
+                    if [ p for p in workers if p.is_alive() ]:
+                        continue
+                    # Every worker is gone; drain what is left and give up
+                    try:
+                        data = results.get( True, 1 )
+                    except Queue.Empty:
+                        break
+
+                shard, index, ok, value = _decodeRecord( data )
+                del pending[ ( shard, index ) ]
+                yield ( shards[shard][index].host, ok, value )
+
+            for shard, index in pending.keys():
+                yield ( shards[shard][index].host, 0, "Worker process died" )
+        finally:
+            for p in workers:
+                if p.is_alive():
+                    p.terminate()
+                p.join()
+            if manager != None:
+                manager.shutdown()
+            shutil.rmtree( spillDir, True )
+
+# ========================================================================
+#  Test driver
+# ========================================================================
+
+if __name__ == "__main__":
+
+    if len( sys.argv ) < 7:
+        print "usage: runners.py type class username password command [host ...]"
+        sys.exit(1)
+
+    hosts = [ Host( h, sys.argv[2], sys.argv[1], sys.argv[3], sys.argv[4] )
+              for h in sys.argv[6:] ]
+
+    for host, ok, value in ShardedRunner().run( hosts, [ sys.argv[5] ] ):
+        if ok:
+            print "%s:\n%s" % ( host, "".join( value ) )
+        else:
+            sys.stderr.write( "%s: %s\n" % ( host, value ) )
@@ -0,0 +1,230 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Classes which schedule multi-device, multi-command jobs: longest work
+#  first, within per-site, per-device and global concurrency limits
+#
+#  $Id$
+# ========================================================================
+
+import marshal, os, threading, time
+
+from netdevicelib.runners import connectHost, resolveHosts, runCommand
+
+# ------------------------------------------------------------------------
+
+# Module documentation strings
+__version__ = '$Revision: 1.1 $'.split()[-2]
+
+# Pseudo-command under which the cost of opening a session is learned
+LOGIN = '<login>'
+
+# ------------------------------------------------------------------------
+
+class CostModel:
+    """ Learns how long each command takes on each class of device, as an
+        exponentially weighted moving average of past runs """
+
+    def __init__( self, inPath=None, inAlpha=0.3, inDefault=1.0 ):
+        """ Constructor. If inPath is given, costs are loaded from and saved
+            to that file """
+
+        self._path    = inPath
+        self._alpha   = inAlpha
+        self._default = inDefault
+        self._costs   = {}
+        self._lock    = threading.Lock()
+
+        if inPath != None and os.path.exists( inPath ):
+            f = open( inPath, 'rb' )
+            try:
+                self._costs = marshal.load( f )
+            finally:
+                f.close()
+
+    def estimate( self, inClass=None, inCommand=None ):
+        """ Expected run time of a command on a class of device, in seconds """
+        assert inClass   != None
+        assert inCommand != None
+
+        return self._costs.get( ( inClass, inCommand ), self._default )
+
+    def observe( self, inClass=None, inCommand=None, inSeconds=0.0 ):
+        """ Feed the measured run time of a command back into the model """
+        assert inClass   != None
+        assert inCommand != None
+
+        key = ( inClass, inCommand )
+        self._lock.acquire()
+        try:
+            if self._costs.has_key( key ):
+                self._costs[key] = self._costs[key] + \
+                                   self._alpha * ( inSeconds - self._costs[key] )
+            else:
+                self._costs[key] = float( inSeconds )
+        finally:
+            self._lock.release()
+
+    def save( self ):
+        """ Write the learned costs to the model's file """
+        assert self._path != None
+
+        self._lock.acquire()
+        try:
+            f = open( self._path + ".tmp", 'wb' )
+            try:
+                marshal.dump( self._costs, f )
+            finally:
+                f.close()
+            os.rename( self._path + ".tmp", self._path )
+        finally:
+            self._lock.release()
+
+# ------------------------------------------------------------------------
+
+class Scheduler:
+    """ Runs tasks, each a ( runners.Host, [ commands ] ) pair handled over
+        one session, longest estimated first.
+
+    inGlobal    -- sessions open at once, overall
+    inPerSite   -- sessions open at once per Host.site: a number for every
+                   site, or a dictionary of site -> number (missing sites
+                   are not limited)
+    inPerDevice -- sessions open at once to the same host, to stay within
+                   VTY and console server limits
+
+    Every limit must be at least 1: a task which could never be started
+    would leave run() waiting forever.
+    inLimiter   -- optional throttle.AdaptiveLimiter: logins then run at
+                   its adaptive concurrency, commands at inGlobal
+    """
+
+    def __init__( self, inCostModel=None, inGlobal=32, inPerSite=None,
+                  inPerDevice=1, inFactory=None, inPolicy=None, inLimiter=None ):
+        """ Constructor """
+        assert inGlobal    > 0
+        assert inPerDevice > 0
+        if type( inPerSite ) == type( {} ):
+            for limit in inPerSite.values():
+                assert limit > 0
+        elif inPerSite != None:
+            assert inPerSite > 0
+
+        if inCostModel == None:
+            inCostModel = CostModel()
+
+        self._costs     = inCostModel
+        self._global    = inGlobal
+        self._perSite   = inPerSite
+        self._perDevice = inPerDevice
+        self._factory   = inFactory
+        self._policy    = inPolicy
+        self._limiter   = inLimiter
+
+    def estimate( self, inTask=None ):
+        """ Expected run time of a task, in seconds """
+        assert inTask != None
+
+        host, commands = inTask
+        cost = self._costs.estimate( host.deviceClass, LOGIN )
+        for command in commands:
+            cost = cost + self._costs.estimate( host.deviceClass, command )
+        return cost
+
+    def _siteLimit( self, inSite ):
+        if inSite == None or self._perSite == None:
+            return None
+        if type( self._perSite ) == type( {} ):
+            return self._perSite.get( inSite )
+        return self._perSite
+
+    def _runTask( self, inTask ):
+        """ Run one task, teaching the cost model as it goes """
+
+        host, commands = inTask
+
+        start = time.time()
+        conn  = connectHost( host, self._factory, self._policy, self._limiter )
+        self._costs.observe( host.deviceClass, LOGIN, time.time() - start )
+
+        try:
+            outputs = []
+            for command in commands:
+                start = time.time()
+                outputs.append( runCommand( conn, command ) )
+                self._costs.observe( host.deviceClass, command, time.time() - start )
+        finally:
+            conn.close()
+
+        return outputs
+
+    def run( self, inTasks=None ):
+        """ Run the tasks. Returns a list, in the same order as inTasks, of
+            ( ok, value ) where value is the list of outputs on success and
+            an error message on failure """
+        assert inTasks != None
+
+        resolveHosts( [ task[0] for task in inTasks ] )
+
+        # Longest first, so that the slow devices don't make the tail
+        queue = range( len( inTasks ) )
+        costs = map( self.estimate, inTasks )
+        queue.sort( lambda a, b: cmp( costs[b], costs[a] ) )
+
+        results = [ None ] * len( inTasks )
+        sites   = {}
+        devices = {}
+        cond    = threading.Condition()
+
+        def pick():
+            """ Take the longest task whose site and device have room """
+            for i in range( len( queue ) ):
+                host  = inTasks[queue[i]][0]
+                limit = self._siteLimit( host.site )
+                if limit != None and sites.get( host.site, 0 ) >= limit:
+                    continue
+                if devices.get( host.getKey(), 0 ) >= self._perDevice:
+                    continue
+                return queue.pop( i )
+            return None
+
+        def worker():
+            while 1:
+                cond.acquire()
+                try:
+                    while 1:
+                        if not queue:
+                            return
+                        index = pick()
+                        if index != None:
+                            break
+                        cond.wait()
+
+                    host = inTasks[index][0]
+                    sites[host.site]       = sites.get( host.site, 0 ) + 1
+                    devices[host.getKey()] = devices.get( host.getKey(), 0 ) + 1
+                finally:
+                    cond.release()
+
+                try:
+                    results[index] = ( 1, self._runTask( inTasks[index] ) )
+                except Exception, e:
+                    results[index] = ( 0, "%s: %s" % ( e.__class__.__name__, e ) )
+
+                cond.acquire()
+                try:
+                    sites[host.site]       = sites[host.site] - 1
+                    devices[host.getKey()] = devices[host.getKey()] - 1
+                    cond.notifyAll()
+                finally:
+                    cond.release()
+
+        threads = []
+        for i in range( min( self._global, len( inTasks ) ) ):
+            t = threading.Thread( target=worker )
+            t.start()
+            threads.append( t )
+        for t in threads:
+            t.join()
+
+        return results
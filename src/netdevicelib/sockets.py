@@ -0,0 +1,257 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Classes and functions for the connect phase: cached, batched name
+#  resolution and happy-eyeballs connects with their own timeout
+#
+#  $Id$
+# ========================================================================
+
+import errno, math, os, select, socket, threading, time
+
+# ------------------------------------------------------------------------
+
+# Module documentation strings
+__version__ = '$Revision: 1.1 $'.split()[-2]
+
+# Delay before racing the next address, as recommended by RFC 8305
+ATTEMPT_DELAY = 0.25
+
+# ------------------------------------------------------------------------
+
+def waitReady( inObjects=None, inWrite=0, inTimeout=None ):
+    """ Wait up to inTimeout seconds for sockets, or anything with a
+        fileno(), to be readable, or writable with inWrite. Returns the
+        ready ones. Uses poll() where there is one, as telnetlib does:
+        select() fails on descriptors past FD_SETSIZE (usually 1024) """
+    assert inObjects != None
+
+    if inTimeout != None:
+        end = time.time() + inTimeout
+
+    if not hasattr( select, 'poll' ):
+        while 1:
+            try:
+                if inWrite:
+                    return select.select( [], inObjects, [], inTimeout )[1]
+                return select.select( inObjects, [], [], inTimeout )[0]
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+            if inTimeout != None:
+                inTimeout = max( 0, end - time.time() )
+
+    if inWrite:
+        mask = select.POLLOUT
+    else:
+        mask = select.POLLIN | select.POLLPRI
+    mask = mask | select.POLLERR | select.POLLHUP
+
+    poller  = select.poll()
+    objects = {}
+    for item in inObjects:
+        objects[item.fileno()] = item
+        poller.register( item, mask )
+
+    while 1:
+        # poll() takes milliseconds; round up so a short wait isn't a spin
+        timeout = None
+        if inTimeout != None:
+            timeout = int( math.ceil( max( 0, end - time.time() ) * 1000 ) )
+        try:
+            events = poller.poll( timeout )
+            break
+        except select.error, e:
+            if e.args[0] != errno.EINTR:
+                raise
+
+    return [ objects[fd] for fd, event in events ]
+
+# ------------------------------------------------------------------------
+
+class Resolver:
+    """ Caches name lookups for inTtl seconds, and resolves whole inventories
+        at once over inThreads threads """
+
+    def __init__( self, inTtl=300, inThreads=16 ):
+        """ Constructor """
+
+        self._ttl     = inTtl
+        self._threads = inThreads
+        self._cache   = {}
+        self._lock    = threading.Lock()
+
+    def _lookup( self, inHost ):
+        """ Resolve a name, bypassing the cache """
+
+        addresses = []
+        for family, type, proto, name, address in \
+                socket.getaddrinfo( inHost, None, socket.AF_UNSPEC,
+                                    socket.SOCK_STREAM ):
+            if ( family, address ) not in addresses:
+                addresses.append( ( family, address ) )
+
+        self._lock.acquire()
+        try:
+            self._cache[inHost] = ( time.time() + self._ttl, addresses )
+        finally:
+            self._lock.release()
+
+        return addresses
+
+    def resolve( self, inHost=None, inPort=None ):
+        """ Return the addresses of a host as a list of ( family, sockaddr ),
+            in the order the system prefers them """
+        assert inHost != None
+        assert inPort != None
+
+        entry = self._cache.get( inHost )
+        if entry != None and entry[0] > time.time():
+            addresses = entry[1]
+        else:
+            addresses = self._lookup( inHost )
+
+        return [ ( family, ( address[0], inPort ) + address[2:] )
+                 for family, address in addresses ]
+
+    def resolveAll( self, inHosts=None ):
+        """ Fill the cache for a list of hosts. Names which don't resolve are
+            left out; connecting to them raises the lookup error then """
+        assert inHosts != None
+
+        now   = time.time()
+        names = {}
+        for host in inHosts:
+            entry = self._cache.get( host )
+            if entry == None or entry[0] <= now:
+                names[host] = 1
+        names = names.keys()
+
+        def worker():
+            while 1:
+                try:
+                    host = names.pop()
+                except IndexError:
+                    return
+                try:
+                    self._lookup( host )
+                except socket.error:
+                    pass
+
+        threads = []
+        for i in range( min( self._threads, len( names ) ) ):
+            t = threading.Thread( target=worker )
+            t.start()
+            threads.append( t )
+        for t in threads:
+            t.join()
+
+    def flush( self ):
+        """ Forget every cached name """
+
+        self._lock.acquire()
+        try:
+            self._cache = {}
+        finally:
+            self._lock.release()
+
+# Resolver used when none is given, shared by every connection in the process
+defaultResolver = Resolver()
+
+# ------------------------------------------------------------------------
+
+def _interleave( inAddresses ):
+    """ Alternate address families, starting with the preferred one """
+
+    families = []
+    byFamily = {}
+    for family, address in inAddresses:
+        if not byFamily.has_key( family ):
+            families.append( family )
+            byFamily[family] = []
+        byFamily[family].append( ( family, address ) )
+
+    result = []
+    while byFamily:
+        for family in families:
+            if byFamily.has_key( family ):
+                result.append( byFamily[family].pop( 0 ) )
+                if not byFamily[family]:
+                    del byFamily[family]
+    return result
+
+def connectSocket( inAddresses=None, inTimeout=None, inDelay=ATTEMPT_DELAY ):
+    """ Connect to the first of inAddresses, a list of ( family, sockaddr ),
+        to answer. A new attempt starts every inDelay seconds, or as soon as
+        one fails, while earlier ones keep running; inTimeout bounds the
+        whole race. Returns a connected, blocking socket """
+    assert inAddresses
+
+    queue     = _interleave( inAddresses )
+    pending   = {}
+    error     = None
+    timedOut  = 0
+    nextStart = 0
+    if inTimeout != None:
+        end = time.time() + inTimeout
+
+    try:
+        while queue or pending:
+            now = time.time()
+            if inTimeout != None and now >= end:
+                timedOut = 1
+                break
+
+            if queue and ( now >= nextStart or not pending ):
+                family, address = queue.pop( 0 )
+                try:
+                    sock = socket.socket( family, socket.SOCK_STREAM )
+                except socket.error, e:
+                    # No stack for this family on this box
+                    error = e
+                    continue
+                sock.setblocking( 0 )
+                err = sock.connect_ex( address )
+                if err == 0:
+                    sock.setblocking( 1 )
+                    return sock
+                if err not in ( errno.EINPROGRESS, errno.EWOULDBLOCK ):
+                    sock.close()
+                    error = socket.error( err, os.strerror( err ) )
+                    continue
+                pending[sock] = address
+                nextStart     = now + inDelay
+
+            wait = None
+            if queue:
+                wait = max( 0, nextStart - now )
+            if inTimeout != None and ( wait == None or wait > end - now ):
+                wait = end - now
+
+            for sock in waitReady( pending.keys(), 1, wait ):
+                del pending[sock]
+                err = sock.getsockopt( socket.SOL_SOCKET, socket.SO_ERROR )
+                if err == 0:
+                    sock.setblocking( 1 )
+                    return sock
+                sock.close()
+                error     = socket.error( err, os.strerror( err ) )
+                nextStart = 0
+    finally:
+        for sock in pending.keys():
+            sock.close()
+
+    # Every address refused or was unreachable
+    if error != None and not timedOut:
+        raise error
+    raise socket.timeout( "timed out" )
+
+def openSocket( inHost=None, inPort=None, inTimeout=None, inResolver=None ):
+    """ Resolve inHost and connect to it, racing its addresses """
+    assert inHost != None
+    assert inPort != None
+
+    if inResolver == None:
+        inResolver = defaultResolver
+
+    return connectSocket( inResolver.resolve( inHost, inPort ), inTimeout )
@@ -0,0 +1,262 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tunable SSH transports built on paramiko
+#
+#  $Id$
+# ========================================================================
+
+import os, threading, time
+
+from netdevicelib.sockets import openSocket, waitReady
+from netdevicelib.telnet import MAX_BUFFER, READ_SIZE, compilePatterns, \
+                                searchPatterns
+
+# paramiko is only needed for ssh-exec connections and tuned ssh ones, and
+# is slow to import, so it is loaded on first use
+paramiko = None
+
+# ------------------------------------------------------------------------
+
+# Module documentation strings
+__version__ = '$Revision: 1.1 $'.split()[-2]
+
+# Exceptions
+HostKeyException = "Host key verification failed"
+
+# Transport options understood by openTransport():
+#
+#   compression    -- 1 to ask for zlib compression
+#   windowSize     -- SSH channel window size, in bytes
+#   packetSize     -- maximum SSH packet size, in bytes
+#   ciphers        -- preferred ciphers, fastest first
+#   macs           -- preferred MACs, fastest first
+#   knownHosts     -- known_hosts file to check host keys against
+#                     (default: ~/.ssh/known_hosts)
+#   strictHostKeys -- 1 (the default) to refuse hosts missing from
+#                     knownHosts; 0 to accept their keys on first use and
+#                     check them on later connections in the process.
+#                     Keys which don't match are always refused
+#
+# Throughput-oriented values for pulling large configs over slow links
+FAST_OPTIONS = { 'compression' : 1,
+                 'windowSize'  : 16 * 1024 * 1024,
+                 'packetSize'  : 32768,
+                 'ciphers'     : [ 'aes128-ctr', 'aes192-ctr', 'aes256-ctr' ],
+                 'macs'        : [ 'hmac-sha2-256', 'hmac-sha1' ] }
+
+# known_hosts file used when the knownHosts option isn't given
+KNOWN_HOSTS = os.path.join( '~', '.ssh', 'known_hosts' )
+
+# Parsed known_hosts files, shared by every connection in the process
+_knownHosts     = {}
+_knownHostsLock = threading.Lock()
+
+# ------------------------------------------------------------------------
+
+class AuthenticationError( Exception ):
+    """ The server refused the username or password """
+    pass
+
+def _loadParamiko():
+    """ Import paramiko, the first time it is needed """
+    global paramiko
+
+    if paramiko == None:
+        try:
+            import paramiko as module
+        except ImportError:
+            raise RuntimeError( "The paramiko module is required for this connection type" )
+        paramiko = module
+    return paramiko
+
+def authenticate( inTransport=None, inUser=None, inPass=None ):
+    """ Authenticate a transport with a password, raising
+        AuthenticationError if it is refused """
+    assert inTransport != None
+    assert inUser      != None
+
+    try:
+        inTransport.auth_password( inUser, inPass or '' )
+    except paramiko.AuthenticationException, e:
+        raise AuthenticationError( str( e ) )
+
+def _loadKnownHosts( inPath=None ):
+    """ Return the HostKeys for a known_hosts file, parsing it only once.
+        A missing file holds no keys """
+    assert inPath != None
+
+    _knownHostsLock.acquire()
+    try:
+        if not _knownHosts.has_key( inPath ):
+            keys = paramiko.HostKeys()
+            if os.path.exists( os.path.expanduser( inPath ) ):
+                keys.load( os.path.expanduser( inPath ) )
+            _knownHosts[inPath] = keys
+        return _knownHosts[inPath]
+    finally:
+        _knownHostsLock.release()
+
+def checkHostKey( inTransport=None, inHost=None, inPort=22, inOptions=None ):
+    """ Check the server's key against the known_hosts file, raising
+        RuntimeError on a mismatch or, unless strictHostKeys is 0, on an
+        unknown host """
+    assert inTransport != None
+    assert inHost      != None
+
+    if inOptions == None:
+        inOptions = {}
+
+    if inPort != 22:
+        inHost = "[%s]:%d" % ( inHost, inPort )
+
+    keys   = _loadKnownHosts( inOptions.get( 'knownHosts' ) or KNOWN_HOSTS )
+    key    = inTransport.get_remote_server_key()
+    known  = keys.lookup( inHost )
+
+    if known != None and key.get_name() in known.keys():
+        if known[key.get_name()] != key:
+            raise RuntimeError, HostKeyException
+        return
+
+    if inOptions.get( 'strictHostKeys', 1 ):
+        raise RuntimeError, HostKeyException
+
+    # Remember it so that later connections to this host are checked
+    _knownHostsLock.acquire()
+    try:
+        keys.add( inHost, key.get_name(), key )
+    finally:
+        _knownHostsLock.release()
+
+def openTransport( inHost=None, inPort=22, inOptions=None,
+                   inConnectTimeout=None, inTimeout=None, inSock=None ):
+    """ Connect to inHost and return a paramiko Transport, negotiated with
+        the given options but not authenticated yet. If inSock is given,
+        the transport runs over it instead of a new TCP connection, made
+        through the resolver cache like every other one """
+    assert inHost != None
+
+    _loadParamiko()
+
+    if inOptions == None:
+        inOptions = {}
+
+    sock = inSock
+    if sock == None:
+        sock = openSocket( inHost, inPort, inConnectTimeout )
+
+    kwargs = {}
+    if inOptions.get( 'windowSize' ):
+        kwargs['default_window_size'] = inOptions['windowSize']
+    if inOptions.get( 'packetSize' ):
+        kwargs['default_max_packet_size'] = inOptions['packetSize']
+    transport = paramiko.Transport( sock, **kwargs )
+
+    if inOptions.get( 'compression' ):
+        transport.use_compression( True )
+
+    # Only reorder what this paramiko knows about
+    security = transport.get_security_options()
+    for option, attr in ( ( 'ciphers', 'ciphers' ), ( 'macs', 'digests' ) ):
+        if inOptions.get( option ):
+            supported = getattr( security, attr )
+            wanted    = [ x for x in inOptions[option] if x in supported ]
+            if wanted:
+                setattr( security, attr, wanted )
+
+    transport.start_client( timeout=inTimeout )
+    checkHostKey( transport, inHost, inPort, inOptions )
+
+    return transport
+
+# ------------------------------------------------------------------------
+
+class SshShell:
+    """ Interactive shell over a paramiko transport, with the same open,
+        login, write, expect and close interface as the sshlib Ssh class """
+
+    def __init__( self, inOptions=None, inMaxBuffer=MAX_BUFFER ):
+        """ Constructor. inOptions are the transport options above: host
+            keys are checked against ~/.ssh/known_hosts and unknown hosts
+            refused unless knownHosts or strictHostKeys say otherwise """
+
+        self._options   = inOptions
+        self._maxBuffer = inMaxBuffer
+        self._transport = None
+        self._chan      = None
+        self._buffer    = ''
+
+    def open( self, inHost=None, inPort=22, inTimeout=None, inSock=None ):
+        """ Connect to the device, over inSock if it is given """
+        assert inHost != None
+
+        self._transport = openTransport( inHost, inPort, self._options,
+                                         inTimeout, inTimeout, inSock )
+
+    def login( self, inUser=None, inPass=None ):
+        """ Authenticate and start a shell """
+        assert inUser != None
+
+        authenticate( self._transport, inUser, inPass )
+
+        self._chan = self._transport.open_session()
+        self._chan.get_pty( width=511, height=0 )
+        self._chan.invoke_shell()
+
+    def write( self, inData=None ):
+        """ Send data to the device """
+        assert inData != None
+
+        self._chan.sendall( inData )
+
+    def expect( self, inList=None, inTimeout=None ):
+        """ Read until one of the REs in inList matches, like
+            telnet.Telnet.expect(), and like it only searching what is new
+            and handing data back past the buffer limit """
+        assert inList != None
+
+        exps, anchored = compilePatterns( inList )
+
+        if inTimeout != None:
+            end = time.time() + inTimeout
+
+        eof      = 0
+        searched = 0
+        while 1:
+            i, match = searchPatterns( exps, anchored, self._buffer, searched )
+            if match != None:
+                text         = self._buffer[:match.end()]
+                self._buffer = self._buffer[match.end():]
+                return ( i, match, text )
+            searched = len( self._buffer )
+
+            if eof or searched >= self._maxBuffer:
+                break
+
+            wait = None
+            if inTimeout != None:
+                wait = end - time.time()
+                if wait <= 0:
+                    break
+
+            if not waitReady( [ self._chan ], 0, wait ):
+                break
+
+            data = self._chan.recv( READ_SIZE )
+            if not data:
+                eof = 1
+            self._buffer = self._buffer + data
+
+        text, self._buffer = self._buffer, ''
+        if eof and not text:
+            raise EOFError
+        return ( -1, None, text )
+
+    def close( self ):
+        """ Close the connection """
+
+        if self._chan != None:
+            self._chan.close()
+        if self._transport != None:
+            self._transport.close()
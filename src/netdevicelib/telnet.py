@@ -0,0 +1,320 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Telnet protocol engine working on whole buffers: option negotiation is
+#  found with str.find() instead of byte by byte, and data is read in
+#  large chunks
+#
+#  $Id$
+# ========================================================================
+
+import re, socket, sre_parse, time
+
+from netdevicelib.sockets import waitReady
+
+# ------------------------------------------------------------------------
+
+# Module documentation strings
+__version__ = '$Revision: 1.1 $'.split()[-2]
+
+# Telnet protocol bytes (RFC 854)
+IAC  = chr( 255 )
+DONT = chr( 254 )
+DO   = chr( 253 )
+WONT = chr( 252 )
+WILL = chr( 251 )
+SB   = chr( 250 )
+BRK  = chr( 243 )
+SE   = chr( 240 )
+
+# Characters dropped from the data stream, as telnetlib does
+IGNORED = '\x00\x11'
+
+# Largest single read from the socket
+READ_SIZE = 65536
+
+# How far back from the end of what was already searched a prompt may
+# start; keeps expect() from searching the whole buffer on every read
+LOOKBEHIND = 1024
+
+# Most data expect() holds while no pattern matches before handing it
+# back, so that callers can move it to an OutputBuffer
+MAX_BUFFER = 1024 * 1024
+
+# Patterns already checked by _isAnchored()
+_anchored = {}
+
+# ------------------------------------------------------------------------
+
+def _isAnchored( inPattern ):
+    """ Return true if every match of a compiled pattern ends at the end of
+        the string, as with prompts ending in '$' """
+
+    if not _anchored.has_key( inPattern ):
+        anchored = 0
+        if not inPattern.flags & re.MULTILINE:
+            try:
+                items = sre_parse.parse( inPattern.pattern ).data
+            except Exception:
+                items = []
+            if len( items ) == 1 and items[0][0] == sre_parse.BRANCH:
+                branches = items[0][1][1]
+            else:
+                branches = [ items ]
+            anchored = 1
+            for branch in branches:
+                if not branch or \
+                   tuple( branch[-1] ) != ( sre_parse.AT, sre_parse.AT_END ):
+                    anchored = 0
+        _anchored[inPattern] = anchored
+
+    return _anchored[inPattern]
+
+def compilePatterns( inList=None ):
+    """ Compile the REs given to an expect(). Returns ( patterns, anchored )
+        where anchored tells which patterns _isAnchored() """
+    assert inList != None
+
+    exps = []
+    for item in inList:
+        if hasattr( item, 'search' ):
+            exps.append( item )
+        else:
+            exps.append( re.compile( item ) )
+
+    return ( exps, map( _isAnchored, exps ) )
+
+def searchPatterns( inExps=None, inAnchored=None, inBuffer=None, inSearched=0 ):
+    """ Look for the first of compilePatterns()' patterns matching in
+        inBuffer, whose first inSearched characters were searched already.
+        Returns ( index, match ), or ( -1, None ) """
+    assert inExps     != None
+    assert inAnchored != None
+    assert inBuffer   != None
+
+    for i in range( len( inExps ) ):
+        # Prompts can only match at the very end: skip the rest
+        if inAnchored[i]:
+            start = len( inBuffer ) - LOOKBEHIND
+        else:
+            start = inSearched - LOOKBEHIND
+        match = inExps[i].search( inBuffer, max( 0, start ) )
+        if match != None:
+            return ( i, match )
+
+    return ( -1, None )
+
+# ------------------------------------------------------------------------
+
+class TelnetProtocol:
+    """ Telnet protocol parser which does no I/O.
+
+    feed() takes what was received from the network and returns the data
+    in it, with the protocol bytes removed, and the bytes to send back.
+    Options are all refused, as telnetlib does. Being I/O free, it can be
+    driven by Telnet below or by any event loop.
+    """
+
+    def __init__( self ):
+        """ Constructor """
+
+        self._pending = ''
+        self._sb      = 0
+
+    def feed( self, inData=None ):
+        """ Parse received bytes. Returns ( data, reply ) """
+        assert inData != None
+
+        if not self._pending and not self._sb and IAC not in inData:
+            # By far the most common case: plain text
+            return ( inData.translate( None, IGNORED ), '' )
+
+        data    = self._pending + inData
+        size    = len( data )
+        pos     = 0
+        text    = []
+        reply   = []
+        self._pending = ''
+
+        while pos < size:
+            if self._sb:
+                # Skip the subnegotiation, up to IAC SE
+                end = data.find( IAC + SE, pos )
+                if end == -1:
+                    if data[-1] == IAC:
+                        self._pending = IAC
+                    break
+                self._sb = 0
+                pos      = end + 2
+                continue
+
+            i = data.find( IAC, pos )
+            if i == -1:
+                text.append( data[pos:] )
+                break
+
+            text.append( data[pos:i] )
+            if i + 1 >= size:
+                self._pending = data[i:]
+                break
+
+            command = data[i + 1]
+            if command == IAC:
+                text.append( IAC )
+                pos = i + 2
+            elif command in ( DO, DONT, WILL, WONT ):
+                if i + 2 >= size:
+                    self._pending = data[i:]
+                    break
+                if command in ( DO, DONT ):
+                    reply.append( IAC + WONT + data[i + 2] )
+                else:
+                    reply.append( IAC + DONT + data[i + 2] )
+                pos = i + 3
+            elif command == SB:
+                self._sb = 1
+                pos      = i + 2
+            else:
+                # NOP, GA and the like carry nothing for us
+                pos = i + 2
+
+        return ( "".join( text ).translate( None, IGNORED ), "".join( reply ) )
+
+    def encode( self, inData=None ):
+        """ Escape data to be sent """
+        assert inData != None
+
+        return inData.replace( IAC, IAC + IAC )
+
+# ------------------------------------------------------------------------
+
+class Telnet:
+    """ Telnet client with the open, write, expect and close interface of
+        telnetlib.Telnet """
+
+    def __init__( self, inReadSize=READ_SIZE, inMaxBuffer=MAX_BUFFER ):
+        """ Constructor """
+
+        self._readSize  = inReadSize
+        self._maxBuffer = inMaxBuffer
+        self._protocol  = TelnetProtocol()
+        self._buffer    = ''
+        self.sock       = None
+        self.host       = None
+        self.port       = None
+        self.eof        = 0
+
+    def open( self, inHost=None, inPort=23, inTimeout=None, inSock=None ):
+        """ Connect to the device, over inSock if it is given """
+        assert inHost != None
+
+        if inSock == None:
+            inSock = socket.create_connection( ( inHost, inPort ), inTimeout )
+
+        self.sock      = inSock
+        self.host      = inHost
+        self.port      = inPort
+        self.eof       = 0
+        self._buffer   = ''
+        self._protocol = TelnetProtocol()
+
+    def fileno( self ):
+        return self.sock.fileno()
+
+    def get_socket( self ):
+        return self.sock
+
+    def write( self, inData=None ):
+        """ Send data to the device """
+        assert inData != None
+
+        self.sock.sendall( self._protocol.encode( inData ) )
+
+    def sendBreak( self ):
+        """ Send a Telnet BREAK, which console servers turn into a serial
+            break """
+
+        self.sock.sendall( IAC + BRK )
+
+    def _fill( self, inTimeout=None ):
+        """ Wait up to inTimeout for data and add it to the buffer. Returns
+            0 if nothing came """
+
+        if not waitReady( [ self.sock ], 0, inTimeout ):
+            return 0
+
+        data = self.sock.recv( self._readSize )
+        if not data:
+            self.eof = 1
+            return 1
+
+        text, reply = self._protocol.feed( data )
+        if reply:
+            self.sock.sendall( reply )
+        self._buffer = self._buffer + text
+        return 1
+
+    def expect( self, inList=None, inTimeout=None ):
+        """ Read until one of the REs in inList matches. Returns ( index,
+            match, text ) like telnetlib, or ( -1, None, text ) on timeout,
+            or when more than the buffer limit came without a match """
+        assert inList != None
+
+        exps, anchored = compilePatterns( inList )
+
+        if inTimeout != None:
+            end = time.time() + inTimeout
+
+        searched = 0
+        while 1:
+            i, match = searchPatterns( exps, anchored, self._buffer, searched )
+            if match != None:
+                text         = self._buffer[:match.end()]
+                self._buffer = self._buffer[match.end():]
+                return ( i, match, text )
+            searched = len( self._buffer )
+
+            if self.eof or searched >= self._maxBuffer:
+                break
+
+            wait = None
+            if inTimeout != None:
+                wait = end - time.time()
+                if wait <= 0:
+                    break
+
+            if not self._fill( wait ):
+                break
+
+        text, self._buffer = self._buffer, ''
+        if self.eof and not text:
+            raise EOFError( "telnet connection closed" )
+        return ( -1, None, text )
+
+    def read_very_eager( self ):
+        """ Return whatever can be read without blocking """
+
+        while not self.eof and self._fill( 0 ):
+            pass
+
+        text, self._buffer = self._buffer, ''
+        if self.eof and not text:
+            raise EOFError( "telnet connection closed" )
+        return text
+
+    def read_until( self, inMatch=None, inTimeout=None ):
+        """ Read until a string is seen, or inTimeout expires """
+        assert inMatch != None
+
+        try:
+            return self.expect( [ re.escape( inMatch ) ], inTimeout )[2]
+        except EOFError:
+            return ''
+
+    def close( self ):
+        """ Close the connection """
+
+        if self.sock != None:
+            self.sock.close()
+        self.sock = None
+        self.eof  = 1
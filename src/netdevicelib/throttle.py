@@ -0,0 +1,130 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Classes which adapt how many logins run at once to how well the
+#  devices and their AAA servers keep up
+#
+#  $Id$
+# ========================================================================
+
+import threading, time
+
+from netdevicelib.policies import classifyFailure, FAILURE_LOGIN, FAILURE_TIMEOUT
+
+# ------------------------------------------------------------------------
+
+# Module documentation strings
+__version__ = '$Revision: 1.1 $'.split()[-2]
+
+# ------------------------------------------------------------------------
+
+class AdaptiveLimiter:
+    """ AIMD concurrency limit for logins.
+
+    While logins finish under inTarget seconds the limit grows by
+    inIncrease per limit's worth of successes (about +inIncrease per round
+    trip); a slow or failed login multiplies it by inDecrease, at most once
+    per inTarget seconds so that one burst of failures doesn't collapse it.
+
+    The state is kept in a mapping with 'limit', 'active' and
+    'lastDecrease' keys. To share it between processes, pass a
+    multiprocessing.Manager() dict and condition, or use share(); by
+    default it is shared between the threads of one process.
+    """
+
+    def __init__( self, inInitial=4, inMin=1, inMax=64, inTarget=2.0,
+                  inIncrease=1.0, inDecrease=0.5, inState=None, inCond=None ):
+        """ Constructor. A non-empty inState is joined as it stands """
+        assert inMin >= 1
+        assert inMin <= inInitial <= inMax
+
+        if inState == None:
+            inState = {}
+        if inCond == None:
+            inCond = threading.Condition()
+        if not inState.has_key( 'limit' ):
+            inState['limit']        = float( inInitial )
+            inState['active']       = 0
+            inState['lastDecrease'] = 0
+
+        self._min      = inMin
+        self._max      = inMax
+        self._target   = inTarget
+        self._increase = inIncrease
+        self._decrease = inDecrease
+        self._state    = inState
+        self._cond     = inCond
+
+    def getLimit( self ):
+        """ Accessor method for the current number of logins allowed at once """
+        return int( self._state['limit'] )
+
+    def share( self, inManager=None ):
+        """ Return a limiter starting from this one's limit whose state
+            lives in the multiprocessing.Manager inManager, so that the
+            processes it is handed to adapt one limit together """
+        assert inManager != None
+
+        self._cond.acquire()
+        try:
+            state = inManager.dict( { 'limit'        : self._state['limit'],
+                                      'active'       : 0,
+                                      'lastDecrease' : self._state['lastDecrease'] } )
+        finally:
+            self._cond.release()
+
+        return AdaptiveLimiter( self._min, self._min, self._max, self._target,
+                                self._increase, self._decrease, state,
+                                inManager.Condition() )
+
+    def acquire( self ):
+        """ Wait for a login slot """
+
+        self._cond.acquire()
+        try:
+            state = self._state
+            while state['active'] >= int( state['limit'] ):
+                self._cond.wait()
+            state['active'] = state['active'] + 1
+        finally:
+            self._cond.release()
+
+    def release( self, inLatency=0.0, inFailed=0 ):
+        """ Give back a login slot, reporting how the login went """
+
+        self._cond.acquire()
+        try:
+            state = self._state
+            state['active'] = state['active'] - 1
+
+            now   = time.time()
+            limit = state['limit']
+            if inFailed or inLatency > self._target:
+                if now - state['lastDecrease'] >= self._target:
+                    state['limit']        = max( self._min, limit * self._decrease )
+                    state['lastDecrease'] = now
+            else:
+                state['limit'] = min( self._max, limit + self._increase / limit )
+
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
+    def call( self, inFunction=None, *inArgs ):
+        """ Run inFunction( *inArgs ), a login on an open connection, in a
+            login slot and return its result. Login failures and timeouts
+            count as overload; other failures say nothing about the AAA
+            servers """
+        assert inFunction != None
+
+        self.acquire()
+        start = time.time()
+        try:
+            result = inFunction( *inArgs )
+        except Exception, e:
+            failed = classifyFailure( e ) in ( FAILURE_LOGIN, FAILURE_TIMEOUT )
+            self.release( time.time() - start, failed )
+            raise
+
+        self.release( time.time() - start, 0 )
+        return result
@@ -0,0 +1,108 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Classes which reach devices through SSH jump hosts (bastions), with
+#  one authenticated connection per bastion shared by every session
+#
+#  $Id$
+# ========================================================================
+
+import os, threading
+
+from netdevicelib.sshtransport import AuthenticationError, authenticate, openTransport
+
+# ------------------------------------------------------------------------
+
+# Module documentation strings
+__version__ = '$Revision: 1.1 $'.split()[-2]
+
+# Exceptions
+JumpHostLoginFailedException = "Login to jump host failed"
+
+# ------------------------------------------------------------------------
+
+class JumpHost:
+    """ An SSH connection to a bastion, carrying device sessions as
+        direct-tcpip channels.
+
+    The connection is made on first use, kept warm with SSH keepalives
+    every inKeepalive seconds, and made again if it has dropped. A single
+    JumpHost can be given to any number of connections, from any thread.
+    """
+
+    def __init__( self, inHost=None, inPort=22, inUser=None, inPass=None,
+                  inOptions=None, inKeepalive=30, inTimeout=10 ):
+        """ Constructor. inOptions are the transport options described in
+            sshtransport, including host key checking, which refuses
+            unknown bastions by default """
+        assert inHost != None
+        assert inUser != None
+
+        self._host      = inHost
+        self._port      = inPort
+        self._user      = inUser
+        self._pass      = inPass
+        self._options   = inOptions
+        self._keepalive = inKeepalive
+        self._timeout   = inTimeout
+        self._transport = None
+        self._pid       = None
+        self._lock      = threading.Lock()
+
+    def __repr__( self ):
+        return "<JumpHost %s@%s:%d>" % ( self._user, self._host, self._port )
+
+    def getTransport( self ):
+        """ Return the authenticated transport, connecting if needed """
+
+        self._lock.acquire()
+        try:
+            # A transport inherited from a parent process has no thread
+            # running it here
+            if self._transport != None and self._transport.is_active() and \
+               self._pid == os.getpid():
+                return self._transport
+
+            transport = openTransport( self._host, self._port, self._options,
+                                       self._timeout, self._timeout )
+            try:
+                authenticate( transport, self._user, self._pass )
+            except AuthenticationError:
+                transport.close()
+                raise RuntimeError, JumpHostLoginFailedException
+
+            if self._keepalive:
+                transport.set_keepalive( self._keepalive )
+
+            self._transport = transport
+            self._pid       = os.getpid()
+            return transport
+        finally:
+            self._lock.release()
+
+    def openChannel( self, inHost=None, inPort=None, inTimeout=None ):
+        """ Open a channel to inHost:inPort through the bastion. The channel
+            can be used in place of a connected socket """
+        assert inHost != None
+        assert inPort != None
+
+        if inTimeout == None:
+            inTimeout = self._timeout
+
+        channel = self.getTransport().open_channel( 'direct-tcpip',
+                                                    ( inHost, inPort ),
+                                                    ( '127.0.0.1', 0 ),
+                                                    timeout=inTimeout )
+        channel.settimeout( None )
+        return channel
+
+    def close( self ):
+        """ Close the connection to the bastion, and every channel on it """
+
+        self._lock.acquire()
+        try:
+            if self._transport != None:
+                self._transport.close()
+                self._transport = None
+        finally:
+            self._lock.release()
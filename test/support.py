@@ -0,0 +1,45 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Helpers shared by the tests
+#
+#  $Id$
+# ========================================================================
+
+import os, resource
+
+# Descriptors past this can't be given to select()
+FD_SETSIZE = 1024
+
+# ------------------------------------------------------------------------
+
+class HighDescriptors:
+    """ Holds enough descriptors open that the next sockets created get
+        numbers past FD_SETSIZE, as in a process holding 1000+ sessions """
+
+    def __init__( self, inSpare=64 ):
+        """ Constructor. Raises RuntimeError if the descriptor limit is too
+            low and can't be raised """
+
+        soft, hard = resource.getrlimit( resource.RLIMIT_NOFILE )
+        wanted = FD_SETSIZE + inSpare
+        if soft < wanted:
+            if hard != resource.RLIM_INFINITY and hard < wanted:
+                raise RuntimeError( "Descriptor limit too low: %d" % hard )
+            resource.setrlimit( resource.RLIMIT_NOFILE, ( wanted, hard ) )
+
+        self._limit = ( soft, hard )
+        self._fds   = []
+        while 1:
+            fd = os.open( os.devnull, os.O_RDONLY )
+            self._fds.append( fd )
+            if fd >= FD_SETSIZE:
+                break
+
+    def close( self ):
+        """ Release the descriptors and the limit """
+
+        for fd in self._fds:
+            os.close( fd )
+        self._fds = []
+        resource.setrlimit( resource.RLIMIT_NOFILE, self._limit )
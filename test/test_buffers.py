@@ -0,0 +1,134 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tests for netdevicelib.buffers
+#
+#  $Id$
+# ========================================================================
+
+import os, shutil, tempfile, unittest
+
+from netdevicelib.buffers import OutputBuffer, OutputLimitException, SpilledOutput
+
+# ------------------------------------------------------------------------
+
+TEXT = "".join( [ "line %d\r\n" % i for i in range( 100 ) ] )
+
+def openDescriptors():
+    """ Number of descriptors open in this process, or None if unknown """
+
+    if not os.path.isdir( "/proc/self/fd" ):
+        return None
+    return len( os.listdir( "/proc/self/fd" ) )
+
+class OutputBufferTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._dir     = tempfile.mkdtemp()
+        self._tempdir = tempfile.tempdir
+        tempfile.tempdir = self._dir
+
+    def tearDown( self ):
+        tempfile.tempdir = self._tempdir
+        shutil.rmtree( self._dir )
+
+    def _fill( self, inBuffer=None, inText=TEXT ):
+        for i in range( 0, len( inText ), 100 ):
+            inBuffer.append( inText[i:i + 100] )
+        return inBuffer.getvalue()
+
+    def testInMemory( self ):
+        output = self._fill( OutputBuffer( len( TEXT ) ) )
+        self.assertEqual( type( output ), type( "" ) )
+        self.assertEqual( output, TEXT )
+
+    def testSpillThreshold( self ):
+        output = self._fill( OutputBuffer( len( TEXT ) - 1 ) )
+        self.failUnless( isinstance( output, SpilledOutput ) )
+        self.assertEqual( str( output ), TEXT )
+
+    def testEmpty( self ):
+        buffer = OutputBuffer( 10 )
+        buffer.append( "" )
+        self.assertEqual( buffer.getvalue(), "" )
+
+    def testLimit( self ):
+        buffer = OutputBuffer( 100, 250 )
+        buffer.append( "x" * 200 )
+        try:
+            buffer.append( "x" * 51 )
+        except RuntimeError, e:
+            self.assertEqual( e.args[0], OutputLimitException )
+        else:
+            self.fail( "buffer grew past its limit" )
+        self.assertEqual( len( buffer ), 200 )
+
+    def testTrim( self ):
+        for spill in ( None, 100 ):
+            buffer = OutputBuffer( spill )
+            self._fill( buffer )
+            buffer.trim( 20 )
+            self.assertEqual( str( buffer.getvalue() ), TEXT[:-20] )
+
+    def testTempFileRemoved( self ):
+        before = openDescriptors()
+        buffer = OutputBuffer( 100 )
+        output = self._fill( buffer )
+
+        # Never visible on disk, even while in use
+        self.failUnless( isinstance( output, SpilledOutput ) )
+        self.assertEqual( os.listdir( self._dir ), [] )
+
+        del buffer, output
+        if before != None:
+            self.assertEqual( openDescriptors(), before )
+
+class SpilledOutputTest( unittest.TestCase ):
+
+    def setUp( self ):
+        buffer = OutputBuffer( 10 )
+        buffer.append( TEXT )
+        self._output = buffer.getvalue()
+        self.failUnless( isinstance( self._output, SpilledOutput ) )
+
+    def testString( self ):
+        self.assertEqual( len( self._output ), len( TEXT ) )
+        self.assertEqual( str( self._output ), TEXT )
+        self.assertEqual( "%s" % self._output, TEXT )
+
+    def testSlicing( self ):
+        output = self._output
+        self.assertEqual( output[0], TEXT[0] )
+        self.assertEqual( output[-1], TEXT[-1] )
+        self.assertEqual( output[5:20], TEXT[5:20] )
+        self.assertEqual( output[-20:], TEXT[-20:] )
+        self.assertEqual( output[::7], TEXT[::7] )
+        self.assertEqual( output[5000:], "" )
+        self.assertRaises( IndexError, output.__getitem__, len( TEXT ) )
+
+    def testSearch( self ):
+        output = self._output
+        for needle in ( "line 42", "line", "\r\n", "missing" ):
+            self.assertEqual( output.find( needle ), TEXT.find( needle ) )
+            self.assertEqual( output.rfind( needle ), TEXT.rfind( needle ) )
+            self.assertEqual( output.find( needle, 100, 500 ), TEXT.find( needle, 100, 500 ) )
+        self.failUnless( "line 99" in output )
+        self.failIf( "line 100" in output )
+        self.failUnless( output.startswith( "line 0\r\n" ) )
+        self.failUnless( output.endswith( "line 99\r\n" ) )
+
+    def testLines( self ):
+        self.assertEqual( list( self._output ), TEXT.splitlines( True ) )
+        self.assertEqual( self._output.splitlines(), TEXT.splitlines() )
+
+    def testView( self ):
+        view = self._output.view( 8, 100 )
+        self.assertEqual( str( view ), TEXT[8:100] )
+        self.assertEqual( view.find( "line" ), TEXT[8:100].find( "line" ) )
+        self.assertEqual( view[-5:], TEXT[95:100] )
+        self.assertEqual( str( view.view( 10 ) ), TEXT[18:100] )
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,396 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tests for netdevicelib.connections, run against a fake transport
+#
+#  $Id$
+# ========================================================================
+
+import re, socket, threading, time, unittest
+
+from netdevicelib.buffers import OutputLimitException, SpilledOutput
+from netdevicelib import connections
+from netdevicelib.connections import EnableFailedException, LoginFailedException, \
+                                     SshExecConnection, TelnetConnection
+from netdevicelib.devices import DeviceFactory
+from netdevicelib.policies import FAILURE_ENABLE, classifyFailure
+from netdevicelib.sshtransport import AuthenticationError
+
+# ------------------------------------------------------------------------
+
+class FakeTransport:
+    """ Stands in for telnet.Telnet: every expect() returns the next chunk,
+        searched on its own as a real read would be, or raises it if it is
+        an exception. Past the last chunk the connection is closed """
+
+    def __init__( self, inChunks=None ):
+        self._chunks = list( inChunks )
+        self.reads   = 0
+        self.written = []
+        self.closed  = 0
+
+    def write( self, inData=None ):
+        self.written.append( inData )
+
+    def expect( self, inList=None, inTimeout=None ):
+        if not self._chunks:
+            raise EOFError( "telnet connection closed" )
+
+        self.reads = self.reads + 1
+        text = self._chunks.pop( 0 )
+        if isinstance( text, Exception ):
+            raise text
+        for i in range( len( inList ) ):
+            match = re.compile( inList[i] ).search( text )
+            if match != None:
+                return ( i, match, text )
+        return ( -1, None, text )
+
+    def close( self ):
+        self.closed = 1
+
+# ------------------------------------------------------------------------
+
+def connect( inChunks=None, inClass='IOS' ):
+    """ Return a telnet connection reading inChunks """
+
+    conn = TelnetConnection( DeviceFactory().createDevice( inClass ) )
+    conn._conn = FakeTransport( inChunks )
+    return conn
+
+# ------------------------------------------------------------------------
+
+class ExpectTest( unittest.TestCase ):
+
+    def testDeadlineWithSplitPrompt( self ):
+        lines  = [ "line %d\n" % i for i in range( 20 ) ]
+        conn   = connect( [ "show tech\n" ] + lines + [ "Router", "#" ] )
+        output = conn.cmd( "show tech", inDeadline=30 )
+
+        self.assertEqual( output, "".join( lines ) )
+        self.assertEqual( conn.getLastPrompt(), "Router#" )
+        self.assertEqual( conn._conn.reads, len( lines ) + 3 )
+
+    def testSplitPromptWithoutDeadline( self ):
+        conn   = connect( [ "show clock\n12:00:00\n", "Router", ">" ] )
+        output = conn.cmd( "show clock" )
+
+        self.assertEqual( output, "12:00:00\n" )
+        self.assertEqual( conn.getLastPrompt(), "Router>" )
+
+    def testSpilledOutput( self ):
+        lines  = [ "line %d\n" % i for i in range( 20 ) ]
+        conn   = connect( [ "show tech\n" ] + lines + [ "Router#" ] )
+        conn.memoryBudget( 50 )
+        output = conn.cmd( "show tech" )
+
+        self.failUnless( isinstance( output, SpilledOutput ) )
+        self.assertEqual( str( output ), "".join( lines ) )
+
+    def testOutputLimitClosesSession( self ):
+        conn = connect( [ "show tech\n" ] + [ "x" * 40 + "\n" ] * 10 + [ "Router#" ] )
+        conn._isOpen = 1
+        conn.memoryBudget( 50, 200 )
+
+        try:
+            conn.cmd( "show tech" )
+        except RuntimeError, e:
+            self.assertEqual( e.args[0], OutputLimitException )
+        else:
+            self.fail( "output grew past the memory budget" )
+
+        # The rest of the output is still coming: the session is useless
+        self.failUnless( conn._conn.closed )
+        self.failIf( conn._isOpen )
+        self.assertEqual( conn.getMode( 'enabled' ), None )
+
+class PagerTest( unittest.TestCase ):
+
+    def _paged( self, inChunks=None, inClass='IOS', inPrompt="Router#" ):
+        conn   = connect( [ "show run\n" ] + inChunks + [ inPrompt ], inClass )
+        output = conn.cmd( "show run" )
+        return ( output, conn._conn.written )
+
+    def testIOS( self ):
+        erase = "\x08" * 9 + " " * 9 + "\x08" * 9
+        output, written = self._paged( [ "line 1\nline 2\n --More-- ",
+                                         erase + "line 3\nline 4\n --More-- ",
+                                         erase + "line 5\n" ] )
+
+        self.assertEqual( output, "line 1\nline 2\nline 3\nline 4\nline 5\n" )
+        self.assertEqual( written, [ "show run\n", " ", " " ] )
+
+    def testMarkerAcrossReads( self ):
+        output, written = self._paged( [ "line 1\n --Mo", "re-- ",
+                                         "\r          \rline 2\n" ] )
+
+        self.assertEqual( output, "line 1\nline 2\n" )
+        self.assertEqual( written, [ "show run\n", " " ] )
+
+    def testPix( self ):
+        erase = "\r" + " " * 14 + "\r"
+        output, written = self._paged( [ "line 1\n<--- More --->",
+                                         erase + "line 2\n<--- More --->",
+                                         erase + "line 3\n" ],
+                                       'Pix', "pixfirewall# " )
+
+        self.assertEqual( output, "line 1\nline 2\nline 3\n" )
+        self.assertEqual( written, [ "show run\n", " ", " " ] )
+
+    def testASA( self ):
+        output, written = self._paged( [ "line 1\n<--- More --->",
+                                         "\x1b[Kline 2\n" ],
+                                       'ASA', "ciscoasa# " )
+
+        self.assertEqual( output, "line 1\nline 2\n" )
+        self.assertEqual( written, [ "show run\n", " " ] )
+
+    def testWithoutPager( self ):
+        # BB devices have no pager: a marker is just text
+        output, written = self._paged( [ "line 1\n --More-- \n" ], 'BB', "RPM>" )
+
+        self.assertEqual( output, "line 1\n --More-- \n" )
+        self.assertEqual( written, [ "show run\n" ] )
+
+class EnableTest( unittest.TestCase ):
+
+    def testBadSecret( self ):
+        conn = connect( [ "Password: " ] * 3 )
+        try:
+            conn.enable( "wrong" )
+        except RuntimeError, e:
+            self.assertEqual( e.args[0], EnableFailedException )
+            self.assertEqual( classifyFailure( e ), FAILURE_ENABLE )
+        else:
+            self.fail( "enable() accepted a bad secret" )
+
+class ModeTest( unittest.TestCase ):
+
+    def testTracking( self ):
+        conn = connect( [ "show clock\n12:00:00\nRouter>",
+                          "enable\nRouter#",
+                          "config term\nRouter(config)#",
+                          "interface Gi0/1\nRouter(config-if)#",
+                          "end\nRouter#" ] )
+
+        conn.cmd( "show clock" )
+        self.assertEqual( ( conn.getMode( 'enabled' ), conn.getMode( 'config' ) ), ( 0, '' ) )
+        conn.cmd( "enable" )
+        self.assertEqual( ( conn.getMode( 'enabled' ), conn.getMode( 'config' ) ), ( 1, '' ) )
+        conn.cmd( "config term" )
+        self.assertEqual( conn.getMode( 'config' ), 'config' )
+        conn.cmd( "interface Gi0/1" )
+        self.assertEqual( conn.getMode( 'config' ), 'config-if' )
+        conn.cmd( "end" )
+        self.assertEqual( ( conn.getMode( 'enabled' ), conn.getMode( 'config' ) ), ( 1, '' ) )
+
+    def testOtherPromptKeepsMode( self ):
+        conn = connect( [ "config term\nRouter(config)#",
+                          "do reload\nProceed with reload? [confirm]" ] )
+
+        conn.cmd( "config term" )
+        conn.cmd( "do reload", '\[confirm\]' )
+        self.assertEqual( conn.getLastPrompt(), "[confirm]" )
+        self.assertEqual( ( conn.getMode( 'enabled' ), conn.getMode( 'config' ) ),
+                          ( 1, 'config' ) )
+
+    def testRedundantCommandsSkipped( self ):
+        conn = connect( [ "terminal length 0\nRouter#",
+                          "config term\nRouter(config)#",
+                          "end\nRouter#" ] )
+
+        conn.disablePaging()
+        conn.disablePaging()
+        conn.enable( "secret" )
+        conn.configMode()
+        conn.configMode()
+        conn.endConfigMode()
+        conn.endConfigMode()
+        self.assertEqual( conn._conn.written,
+                          [ "terminal length 0\n", "config term\n", "end\n" ] )
+
+class ContextTest( unittest.TestCase ):
+
+    def testForEachContext( self ):
+        conn = connect( [ "changeto context a\nfw/a# ",
+                          "show clock\n12:00:00\nfw/a# ",
+                          "changeto system\nfw# " ], 'ASA' )
+        conn._isOpen = 1
+
+        results = conn.forEachContext( [ "show clock" ], [ "a" ] )
+        self.assertEqual( results, { "a" : [ "12:00:00\n" ] } )
+        self.assertEqual( conn.getMode( 'context' ), '' )
+
+    def testCleanupKeepsError( self ):
+        conn = connect( [ "changeto context a\nfw/a# ",
+                          socket.error( "connection reset" ) ], 'ASA' )
+        conn._isOpen = 1
+
+        self.assertRaises( socket.error, conn.forEachContext,
+                           [ "show clock" ], [ "a" ] )
+
+# ------------------------------------------------------------------------
+
+class FakeChannel:
+    """ An exec channel: sends its command's output in two reads, then
+        closes. Outputs which are exceptions are raised by recv() """
+
+    def __init__( self, inTransport=None ):
+        self._transport = inTransport
+        self._chunks    = []
+
+    def settimeout( self, inTimeout=None ):
+        pass
+
+    def exec_command( self, inCmd=None ):
+        output = self._transport.outputs[inCmd]
+        if isinstance( output, Exception ):
+            self._chunks = [ output ]
+        else:
+            half = len( output ) / 2
+            self._chunks = [ output[:half], output[half:] ]
+
+    def recv( self, inSize=None ):
+        time.sleep( self._transport.delay )
+        if not self._chunks:
+            return ""
+        data = self._chunks.pop( 0 )
+        if isinstance( data, Exception ):
+            raise data
+        return data
+
+    def close( self ):
+        self._transport.closed()
+
+class FakeSshTransport:
+    """ Stands in for a paramiko Transport, counting the channels open """
+
+    def __init__( self, inOutputs=None, inDelay=0.0 ):
+        self.outputs = inOutputs
+        self.delay   = inDelay
+        self.open    = 0
+        self.most    = 0
+        self.opened  = 0
+        self._lock   = threading.Lock()
+
+    def open_session( self, timeout=None ):
+        self._lock.acquire()
+        try:
+            self.open   = self.open + 1
+            self.most   = max( self.most, self.open )
+            self.opened = self.opened + 1
+        finally:
+            self._lock.release()
+        return FakeChannel( self )
+
+    def closed( self ):
+        self._lock.acquire()
+        try:
+            self.open = self.open - 1
+        finally:
+            self._lock.release()
+
+    def is_authenticated( self ):
+        return 1
+
+    def close( self ):
+        pass
+
+def execConnection( inOutputs=None, inDelay=0.0, inChannels=4 ):
+    """ Return an exec connection over a FakeSshTransport """
+
+    conn = SshExecConnection( DeviceFactory().createDevice( 'IOS' ), inChannels )
+    conn._transport = FakeSshTransport( inOutputs, inDelay )
+    conn._isOpen    = 1
+    return conn
+
+class SshExecTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._outputs = dict( [ ( "show %d" % i, "output of show %d\n" % i * 50 )
+                                for i in range( 8 ) ] )
+
+    def testCmd( self ):
+        conn = execConnection( self._outputs )
+        self.assertEqual( conn.cmd( "show 3" ), self._outputs["show 3"] )
+        self.assertEqual( conn._transport.open, 0 )
+
+    def testCmdsInOrder( self ):
+        conn     = execConnection( self._outputs, 0.05, 3 )
+        commands = [ "show %d" % i for i in range( 8 ) ]
+
+        start   = time.time()
+        outputs = conn.cmds( commands )
+        elapsed = time.time() - start
+
+        self.assertEqual( outputs, [ self._outputs[c] for c in commands ] )
+        self.assertEqual( conn._transport.most, 3 )
+        self.assertEqual( conn._transport.open, 0 )
+
+        # 8 commands of 3 reads each, 3 at a time
+        self.failUnless( elapsed < 8 * 3 * 0.05 )
+
+    def testChannelsArgument( self ):
+        conn = execConnection( self._outputs, 0.01 )
+        conn.cmds( self._outputs.keys(), 2 )
+        self.assertEqual( conn._transport.most, 2 )
+
+    def testOutputErrorSurfaces( self ):
+        self._outputs["show 5"] = socket.error( "connection reset" )
+        conn = execConnection( self._outputs, 0.01, 2 )
+
+        self.assertRaises( socket.error, conn.cmds,
+                           [ "show %d" % i for i in range( 8 ) ] )
+
+        # The other channels stop taking commands, and are all closed
+        self.failUnless( conn._transport.opened < 8 )
+        self.assertEqual( conn._transport.open, 0 )
+
+    def testDeadline( self ):
+        conn = execConnection( self._outputs, 0.05 )
+        self.assertRaises( socket.timeout, conn.cmd, "show 1", inDeadline=0.01 )
+        self.assertEqual( conn._transport.open, 0 )
+
+    def testOutputLimit( self ):
+        conn = execConnection( self._outputs )
+        conn.memoryBudget( 100, 200 )
+        try:
+            conn.cmd( "show 1" )
+        except RuntimeError, e:
+            self.assertEqual( e.args[0], OutputLimitException )
+        else:
+            self.fail( "output grew past the memory budget" )
+        self.assertEqual( conn._transport.open, 0 )
+
+class SshExecLoginTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._authenticate = connections.authenticate
+
+    def tearDown( self ):
+        connections.authenticate = self._authenticate
+
+    def _login( self, inAuthenticate=None ):
+        connections.authenticate = inAuthenticate
+        conn = execConnection( {} )
+        try:
+            conn.login( "admin", "wrong" )
+        except RuntimeError, e:
+            self.assertEqual( e.args[0], LoginFailedException )
+        else:
+            self.fail( "login accepted" )
+
+    def testRefused( self ):
+        def authenticate( inTransport=None, inUser=None, inPass=None ):
+            raise AuthenticationError( "Authentication failed." )
+        self._login( authenticate )
+
+    def testNotAuthenticated( self ):
+        def authenticate( inTransport=None, inUser=None, inPass=None ):
+            inTransport.is_authenticated = lambda: 0
+        self._login( authenticate )
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Runs the import check from bench/importcheck.py as a test, so that a
+#  slow or heavy import of netdevicelib.connections fails the suite
+#
+#  $Id$
+# ========================================================================
+
+import os, sys, unittest
+
+import netdevicelib
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ),
+                                  os.pardir, "bench" ) )
+import importcheck
+
+# ------------------------------------------------------------------------
+
+class ImportTest( unittest.TestCase ):
+
+    def setUp( self ):
+        # The probe interpreter must find the same netdevicelib as we do
+        self._path = os.environ.get( 'PYTHONPATH' )
+        top = os.path.dirname( os.path.dirname( os.path.abspath( netdevicelib.__file__ ) ) )
+        os.environ['PYTHONPATH'] = os.pathsep.join( filter( None, [ top, self._path ] ) )
+
+    def tearDown( self ):
+        if self._path == None:
+            del os.environ['PYTHONPATH']
+        else:
+            os.environ['PYTHONPATH'] = self._path
+
+    def testNoHeavyModules( self ):
+        elapsed, loaded = importcheck.measure()
+        self.assertEqual( loaded, [] )
+        for name in [ 'paramiko', 'multiprocessing', 'pkg_resources' ]:
+            self.failUnless( name in importcheck.HEAVY )
+
+    def testBudget( self ):
+        best = min( [ importcheck.measure()[0] for i in range( 5 ) ] )
+        self.failUnless( best <= importcheck.BUDGET,
+                         "import took %.3fs, budget %.3fs" % ( best, importcheck.BUDGET ) )
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tests for netdevicelib.jobs
+#
+#  $Id$
+# ========================================================================
+
+import os, shutil, tempfile, unittest
+
+from netdevicelib.jobs import Journal, STATE_COMMAND, STATE_PENDING, \
+                              STATE_STORED
+
+# ------------------------------------------------------------------------
+
+class JournalTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._dir  = tempfile.mkdtemp()
+        self._path = os.path.join( self._dir, "journal" )
+
+    def tearDown( self ):
+        shutil.rmtree( self._dir )
+
+    def testReplay( self ):
+        journal = Journal( self._path )
+        journal.record( "hostA", STATE_COMMAND, 1 )
+        journal.record( "hostA", STATE_STORED, 2 )
+        journal.close()
+
+        journal = Journal( self._path )
+        self.assertEqual( journal.get( "hostA" ), ( STATE_STORED, 2 ) )
+        self.assertEqual( journal.get( "hostB" ), ( STATE_PENDING, 0 ) )
+        journal.close()
+
+    def testTornLine( self ):
+        f = open( self._path, 'w' )
+        f.write( "hostA\tstored\t2\nhostB\tcomm" )
+        f.close()
+
+        journal = Journal( self._path )
+        self.assertEqual( journal.get( "hostA" ), ( STATE_STORED, 2 ) )
+        self.assertEqual( journal.get( "hostB" ), ( STATE_PENDING, 0 ) )
+        journal.record( "hostC", STATE_STORED, 2 )
+        journal.close()
+
+        f = open( self._path, 'r' )
+        self.assertEqual( f.read(), "hostA\tstored\t2\nhostC\tstored\t2\n" )
+        f.close()
+
+        journal = Journal( self._path )
+        self.assertEqual( journal.get( "hostC" ), ( STATE_STORED, 2 ) )
+        journal.close()
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
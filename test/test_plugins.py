@@ -0,0 +1,62 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tests for netdevicelib.plugins, against a package installed in a
+#  temporary directory
+#
+#  $Id$
+# ========================================================================
+
+import StringIO, os, shutil, sys, tempfile, unittest
+
+from netdevicelib import plugins
+
+# ------------------------------------------------------------------------
+
+GROUP = 'netdevicelib.tests'
+
+ENTRY_POINTS = """[%s]
+broken = testplugin:Missing
+good   = testplugin:Good
+""" % GROUP
+
+class PluginTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._dir = tempfile.mkdtemp()
+
+        f = open( os.path.join( self._dir, "testplugin.py" ), 'w' )
+        f.write( "class Good:\n    pass\n" )
+        f.close()
+
+        info = os.path.join( self._dir, "testplugin-1.0.egg-info" )
+        os.mkdir( info )
+        f = open( os.path.join( info, "entry_points.txt" ), 'w' )
+        f.write( ENTRY_POINTS )
+        f.close()
+
+        import pkg_resources
+        sys.path.insert( 0, self._dir )
+        pkg_resources.working_set.add_entry( self._dir )
+
+        self._stderr = sys.stderr
+        sys.stderr   = StringIO.StringIO()
+
+    def tearDown( self ):
+        sys.stderr = self._stderr
+        sys.path.remove( self._dir )
+        shutil.rmtree( self._dir )
+
+    def testBrokenEntryIsSkipped( self ):
+        registry = {}
+        self.assertEqual( plugins.loadEntryPoints( GROUP, registry ), 1 )
+        self.assertEqual( registry.keys(), [ 'good' ] )
+        self.failUnless( "broken" in sys.stderr.getvalue() )
+
+        # Scanned once only
+        self.assertEqual( plugins.loadEntryPoints( GROUP, {} ), 0 )
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,236 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tests for netdevicelib.polling
+#
+#  $Id$
+# ========================================================================
+
+import random, unittest
+
+from netdevicelib import runners
+from netdevicelib.polling import DeltaTracker, KIND_DELTA, KIND_FULL, KIND_SAME, \
+                                 Poller, applyLines, applyRecords, diffLines, \
+                                 diffRecords
+
+# ------------------------------------------------------------------------
+
+def interfaces( inCount=50, inDown=() ):
+    """ A 'show ip interface brief' like output """
+
+    lines = [ "Interface              IP-Address      OK? Method Status                Protocol\n" ]
+    for i in range( inCount ):
+        if i in inDown:
+            status = "down                  down"
+        else:
+            status = "up                    up"
+        lines.append( "GigabitEthernet0/%-5d 10.0.%d.1        YES NVRAM  %s\n" % ( i, i, status ) )
+    return "".join( lines )
+
+def parseInterfaces( inOutput=None ):
+    """ Records of interface -> status """
+
+    records = {}
+    for line in inOutput.splitlines()[1:]:
+        fields = line.split()
+        records[fields[0]] = " ".join( fields[4:] )
+    return records
+
+class DiffTest( unittest.TestCase ):
+
+    def _roundTrip( self, inOld=None, inNew=None ):
+        self.assertEqual( applyLines( inOld, diffLines( inOld, inNew ) ), inNew )
+
+    def testLines( self ):
+        old = interfaces()
+        self._roundTrip( old, old )
+        self._roundTrip( old, interfaces( inDown=( 0, 17, 49 ) ) )
+        self._roundTrip( old, interfaces( 40 ) )
+        self._roundTrip( old, interfaces( 60 ) )
+        self._roundTrip( old, "" )
+        self._roundTrip( "", old )
+        self._roundTrip( "a\nb", "a\nb\n" )
+
+    def testRandomEdits( self ):
+        rand = random.Random( 42 )
+        old  = [ "line %d\n" % i for i in range( 200 ) ]
+        for i in range( 50 ):
+            new = old[:]
+            for j in range( rand.randint( 1, 10 ) ):
+                where = rand.randint( 0, len( new ) )
+                what  = rand.choice( [ 'insert', 'delete', 'change' ] )
+                if what == 'insert' or not new:
+                    new.insert( where, "new %d\n" % j )
+                elif what == 'delete':
+                    del new[where - 1]
+                else:
+                    new[where - 1] = "changed %d\n" % j
+            self._roundTrip( "".join( old ), "".join( new ) )
+            old = new
+
+    def testDeltaIsSmall( self ):
+        delta = diffLines( interfaces(), interfaces( inDown=( 17, ) ) )
+        self.assertEqual( len( delta ), 1 )
+        self.assertEqual( delta[0][:2], ( 18, 19 ) )
+
+    def testRecords( self ):
+        old = { 'a' : 1, 'b' : 2, 'c' : 3 }
+        new = { 'a' : 1, 'b' : 5, 'd' : 4 }
+        delta = diffRecords( old, new )
+        self.assertEqual( delta, ( { 'b' : 5, 'd' : 4 }, [ 'c' ] ) )
+        self.assertEqual( applyRecords( old, delta ), new )
+        self.assertEqual( old, { 'a' : 1, 'b' : 2, 'c' : 3 } )
+
+# ------------------------------------------------------------------------
+
+class TrackerTest( unittest.TestCase ):
+
+    def testFirstIsFull( self ):
+        tracker = DeltaTracker()
+        self.assertEqual( tracker.update( "r1", "show int", interfaces() ),
+                          ( KIND_FULL, interfaces() ) )
+
+    def testDelta( self ):
+        tracker = DeltaTracker()
+        old = interfaces()
+        new = interfaces( inDown=( 3, ) )
+        tracker.update( "r1", "show int", old )
+
+        kind, delta = tracker.update( "r1", "show int", new )
+        self.assertEqual( kind, KIND_DELTA )
+        self.assertEqual( applyLines( old, delta ), new )
+
+    def testSameSkipsParser( self ):
+        calls = []
+        def parser( inOutput ):
+            calls.append( inOutput )
+            return parseInterfaces( inOutput )
+
+        tracker = DeltaTracker( inParsers={ "show int" : parser } )
+        tracker.update( "r1", "show int", interfaces() )
+        self.assertEqual( tracker.update( "r1", "show int", interfaces() ),
+                          ( KIND_SAME, None ) )
+        self.assertEqual( len( calls ), 1 )
+
+        kind, delta = tracker.update( "r1", "show int", interfaces( inDown=( 3, ) ) )
+        self.assertEqual( ( kind, delta ),
+                          ( KIND_DELTA, ( { 'GigabitEthernet0/3' : 'down down' }, [] ) ) )
+        self.assertEqual( len( calls ), 2 )
+
+    def testSnapshotCadence( self ):
+        tracker = DeltaTracker( 3 )
+        kinds   = [ tracker.update( "r1", "show int", interfaces() )[0]
+                    for i in range( 7 ) ]
+        self.assertEqual( kinds, [ KIND_FULL, KIND_SAME, KIND_SAME,
+                                   KIND_FULL, KIND_SAME, KIND_SAME, KIND_FULL ] )
+
+    def testDeltasCountTowardsSnapshot( self ):
+        tracker = DeltaTracker( 3 )
+        kinds   = [ tracker.update( "r1", "show int", interfaces( inDown=( i, ) ) )[0]
+                    for i in range( 4 ) ]
+        self.assertEqual( kinds, [ KIND_FULL, KIND_DELTA, KIND_DELTA, KIND_FULL ] )
+
+    def testLargeChangeSendsFull( self ):
+        tracker = DeltaTracker()
+        tracker.update( "r1", "show int", interfaces() )
+        new = interfaces( inDown=range( 40 ) )
+        self.assertEqual( tracker.update( "r1", "show int", new ), ( KIND_FULL, new ) )
+
+        # And the next delta is against that snapshot
+        kind, delta = tracker.update( "r1", "show int", interfaces( inDown=range( 41 ) ) )
+        self.assertEqual( kind, KIND_DELTA )
+
+    def testHostsAndCommandsApart( self ):
+        tracker = DeltaTracker()
+        tracker.update( "r1", "show int", interfaces() )
+        self.assertEqual( tracker.update( "r2", "show int", interfaces() )[0], KIND_FULL )
+        self.assertEqual( tracker.update( "r1", "show ver", interfaces() )[0], KIND_FULL )
+
+    def testForget( self ):
+        tracker = DeltaTracker()
+        tracker.update( "r1", "show int", interfaces() )
+        tracker.update( "r1", "show ver", "IOS" )
+        tracker.update( "r2", "show int", interfaces() )
+        tracker.forget( "r1" )
+
+        self.assertEqual( tracker.update( "r1", "show int", interfaces() )[0], KIND_FULL )
+        self.assertEqual( tracker.update( "r1", "show ver", "IOS" )[0], KIND_FULL )
+        self.assertEqual( tracker.update( "r2", "show int", interfaces() )[0], KIND_SAME )
+
+# ------------------------------------------------------------------------
+
+class FakeConnection:
+    """ Returns the outputs its factory holds for the host, raising those
+        which are exceptions """
+
+    def __init__( self, inOutputs=None ):
+        self._outputs = inOutputs
+        self._host    = None
+
+    def open( self, inHost=None, inPort=None ):
+        self._host = inHost
+
+    def login( self, inUser=None, inPass=None ):
+        pass
+
+    def cmd( self, inCmd=None ):
+        output = self._outputs[self._host][inCmd]
+        if isinstance( output, Exception ):
+            raise output
+        return output
+
+    def close( self ):
+        pass
+
+class FakeFactory:
+
+    def __init__( self ):
+        self.outputs = {}
+
+    def createConnection( self, inType=None, inClass=None ):
+        return FakeConnection( self.outputs )
+
+class PollerTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._factory = FakeFactory()
+        self._factory.outputs = { "r1" : { "show int" : interfaces(), "show ver" : "IOS" },
+                                  "r2" : { "show int" : interfaces(), "show ver" : "IOS" } }
+        self._poller = Poller( inFactory=self._factory )
+        self._hosts  = [ runners.Host( "r1", "IOS" ), runners.Host( "r2", "IOS" ) ]
+
+    def _poll( self ):
+        results = self._poller.poll( self._hosts, [ "show int", "show ver" ] )
+        kinds = {}
+        for host, ( ok, value ) in results.items():
+            if ok:
+                kinds[host] = [ kind for command, kind, payload in value ]
+            else:
+                kinds[host] = value
+        return kinds
+
+    def testPoll( self ):
+        self.assertEqual( self._poll(), { "r1" : [ KIND_FULL, KIND_FULL ],
+                                          "r2" : [ KIND_FULL, KIND_FULL ] } )
+
+        self._factory.outputs["r1"]["show int"] = interfaces( inDown=( 1, ) )
+        self.assertEqual( self._poll(), { "r1" : [ KIND_DELTA, KIND_SAME ],
+                                          "r2" : [ KIND_SAME, KIND_SAME ] } )
+
+    def testFailureForgetsHost( self ):
+        self._poll()
+
+        # The change to show int is seen, but never reaches the caller
+        self._factory.outputs["r1"]["show int"] = interfaces( inDown=( 1, ) )
+        self._factory.outputs["r1"]["show ver"] = EOFError( "telnet connection closed" )
+        self.assertEqual( self._poll(), { "r1" : "EOFError: telnet connection closed",
+                                          "r2" : [ KIND_SAME, KIND_SAME ] } )
+
+        self._factory.outputs["r1"]["show ver"] = "IOS"
+        self.assertEqual( self._poll(), { "r1" : [ KIND_FULL, KIND_FULL ],
+                                          "r2" : [ KIND_SAME, KIND_SAME ] } )
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tests for netdevicelib.recovery, run against a scripted console
+#
+#  $Id$
+# ========================================================================
+
+import re, time, unittest
+
+from netdevicelib import recovery
+from netdevicelib.connections import TelnetConnection
+from netdevicelib.devices import DeviceFactory
+from netdevicelib.runners import Host
+
+# ------------------------------------------------------------------------
+
+class FakeConsole:
+    """ Stands in for telnet.Telnet on a console port. The script is a list
+        of ( line, replies ): once the device is sent the next line, it
+        prints the replies, one per read. A reply which is an exception is
+        raised instead. With nothing to print the console stays silent """
+
+    def __init__( self, inScript=None ):
+        self._script    = list( inScript )
+        self._pending   = []
+        self._partial   = ''
+        self.unexpected = []
+
+    def remaining( self ):
+        return [ line for line, replies in self._script ]
+
+    def _received( self, inLine ):
+        if self._script and self._script[0][0] == inLine:
+            self._pending.extend( self._script.pop( 0 )[1] )
+        else:
+            self.unexpected.append( inLine )
+
+    def write( self, inData=None ):
+        lines = re.split( '\r\n|\r|\n', self._partial + inData )
+        self._partial = lines.pop()
+        for line in lines:
+            self._received( line )
+
+    def sendBreak( self ):
+        self._received( '<break>' )
+
+    def expect( self, inList=None, inTimeout=None ):
+        if not self._pending:
+            time.sleep( min( inTimeout, 0.01 ) )
+            return ( -1, None, '' )
+
+        text = self._pending.pop( 0 )
+        if isinstance( text, Exception ):
+            raise text
+        for i in range( len( inList ) ):
+            match = re.compile( inList[i] ).search( text )
+            if match != None:
+                return ( i, match, text )
+        return ( -1, None, text )
+
+    def close( self ):
+        pass
+
+class ConsoleConnection( TelnetConnection ):
+    """ A telnet connection over a FakeConsole """
+
+    def open( self, inHost=None, inPort=23 ):
+        self._isOpen = 1
+
+class ConsoleFactory:
+    """ Hands out connections over FakeConsoles, one script each """
+
+    def __init__( self, *inScripts ):
+        self._scripts = list( inScripts )
+        self.consoles = []
+
+    def createConnection( self, inType=None, inClass=None ):
+        conn = ConsoleConnection( DeviceFactory().createDevice( inClass ) )
+        conn._timeout = 1
+        conn._conn    = FakeConsole( self._scripts.pop( 0 ) )
+        self.consoles.append( conn._conn )
+        return conn
+
+# ------------------------------------------------------------------------
+
+# An IOS router taken through the whole flow, from its rommon prompt
+ROMMON = [ ( '', [ "\r\nrommon 1 > " ] ) ]
+
+BOOT = [
+    ( 'confreg 0x2142', [ "\r\nYou must reset or power cycle for new config to take effect\r\nrommon 2 > " ] ),
+    ( 'reset',          [ "\r\nSystem Bootstrap, Version 15.0\r\n", "#" * 40 + "\r\n",
+                          "\r\nWould you like to enter the initial configuration dialog? [yes/no]: " ] ),
+    ( 'no',             [ "\r\nPress RETURN to get started!\r\n" ] ),
+    ( '',               [ "\r\nRouter>" ] ),
+    ( 'enable',         [ "enable\r\nPassword: " ] ),
+    ( '',               [ "\r\nRouter#" ] ),
+    ( 'copy startup-config running-config',
+                        [ "copy startup-config running-config\r\nDestination filename [running-config]? " ] ),
+    ( '',               [ "\r\n1234 bytes copied in 0.520 secs\r\nrouter1#" ] ),
+    ( 'show version',   [ "show version\r\nCisco IOS Software\r\nrouter1#" ] ) ]
+
+RESTORE = [
+    ( 'config term',            [ "config term\r\nEnter configuration commands, one per line.\r\nrouter1(config)#" ] ),
+    ( 'config-register 0x2102', [ "config-register 0x2102\r\nrouter1(config)#" ] ),
+    ( 'end',                    [ "end\r\nrouter1#" ] ) ]
+
+SAVE = [ ( 'write mem', [ "write mem\r\nBuilding configuration...\r\n[OK]\r\nrouter1#" ] ) ]
+
+class RecoveryTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._stages = []
+
+    def _progress( self, inHost=None, inStage=None, inDetail='' ):
+        if not self._stages or self._stages[-1] != inStage:
+            self._stages.append( inStage )
+
+    def _recover( self, inScript=None, **inKeywords ):
+        factory = ConsoleFactory( inScript )
+        runner  = recovery.Recovery( [ 'show version' ], inTimeout=0.2,
+                                     inProgress=self._progress,
+                                     inFactory=factory, **inKeywords )
+        host    = Host( "console1", "IOS", inPort=2001, inUser="admin",
+                        inPass="secret" )
+        results = runner.run( [ host ] )
+
+        self._console = factory.consoles[0]
+        self._final   = runner.getProgress()
+        return results["console1:2001"]
+
+    def testFullFlow( self ):
+        ok, value = self._recover( ROMMON + BOOT + RESTORE + SAVE )
+
+        self.assertEqual( ( ok, value ), ( 1, [ "Cisco IOS Software\r\n" ] ) )
+        self.assertEqual( self._stages, [ recovery.STAGE_ROMMON, recovery.STAGE_CONFREG,
+                                          recovery.STAGE_BOOTING, recovery.STAGE_SETUP,
+                                          recovery.STAGE_LOAD, recovery.STAGE_COMMANDS,
+                                          recovery.STAGE_RESTORE, recovery.STAGE_DONE ] )
+        self.assertEqual( self._console.unexpected, [] )
+        self.assertEqual( self._console.remaining(), [] )
+        self.assertEqual( self._final, { "console1:2001" : recovery.STAGE_DONE } )
+
+    def testWithoutSave( self ):
+        ok, value = self._recover( ROMMON + BOOT + RESTORE, inSave=0 )
+
+        # The config register is put back all the same
+        self.assertEqual( ok, 1 )
+        self.assertEqual( self._console.unexpected, [] )
+        self.assertEqual( self._console.remaining(), [] )
+
+    def testBreakWhileBooting( self ):
+        script = [ ( '',        [ "\r\nUsername: " ] ),
+                   ( 'admin',   [ "\r\nPassword: " ] ),
+                   ( 'secret',  [ "\r\nSystem Bootstrap, Version 15.0\r\n", "#" * 40 ] ),
+                   ( '<break>', [ "\r\nmonitor: command \"boot\" aborted due to user interrupt\r\nrommon 1 > " ] ) ]
+        ok, value = self._recover( script + BOOT + RESTORE + SAVE, inBreak=1 )
+
+        self.assertEqual( ok, 1 )
+        self.assertEqual( self._console.unexpected, [] )
+
+    def testTimeoutInRommon( self ):
+        ok, value = self._recover( [] )
+
+        self.assertEqual( ( ok, value ),
+                          ( 0, "RuntimeError: %s" % recovery.RecoveryTimeoutException ) )
+        self.assertEqual( self._stages, [ recovery.STAGE_ROMMON, recovery.STAGE_FAILED ] )
+        self.assertEqual( self._final, { "console1:2001" : recovery.STAGE_FAILED } )
+
+    def testTimeoutWhileBooting( self ):
+        ok, value = self._recover( ROMMON + BOOT[:1] + [ ( 'reset', [ "#" * 40 ] ) ] )
+
+        self.assertEqual( ok, 0 )
+        self.assertEqual( self._stages[-2:], [ recovery.STAGE_BOOTING, recovery.STAGE_FAILED ] )
+
+    def testConsoleDropped( self ):
+        script = ROMMON + BOOT[:-1] + [ ( 'show version', [ EOFError( "telnet connection closed" ) ] ) ]
+        ok, value = self._recover( script )
+
+        self.assertEqual( ( ok, value ), ( 0, "EOFError: telnet connection closed" ) )
+        self.assertEqual( self._stages[-2:], [ recovery.STAGE_COMMANDS, recovery.STAGE_FAILED ] )
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
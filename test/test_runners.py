@@ -0,0 +1,147 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tests for netdevicelib.runners, run against a fake connection factory
+#
+#  $Id$
+# ========================================================================
+
+import os, shutil, socket, tempfile, time, unittest
+
+from netdevicelib import runners
+from netdevicelib.buffers import OutputBuffer, SpilledOutput
+from netdevicelib.connections import LoginFailedException
+from netdevicelib.policies import ConnectionPolicy, RetryPolicy
+from netdevicelib.throttle import AdaptiveLimiter
+
+# ------------------------------------------------------------------------
+
+class FakeConnection:
+    """ Returns incompressible output, kept on disk past 1000 bytes as with
+        a memory budget """
+
+    def __init__( self, inSize=0 ):
+        self._size = inSize
+
+    def open( self, inHost=None, inPort=None ):
+        pass
+
+    def login( self, inUser=None, inPass=None ):
+        pass
+
+    def cmd( self, inCmd=None ):
+        output = OutputBuffer( 1000 )
+        output.append( os.urandom( self._size ) )
+        return output.getvalue()
+
+    def close( self ):
+        pass
+
+class FakeFactory:
+
+    def __init__( self, inSize=0 ):
+        self._size = inSize
+
+    def createConnection( self, inType=None, inClass=None ):
+        return FakeConnection( self._size )
+
+class DeadConnection( FakeConnection ):
+    """ Never gets connected """
+
+    def open( self, inHost=None, inPort=None ):
+        raise socket.timeout( "timed out" )
+
+class DeniedConnection( FakeConnection ):
+    """ Connects, but refuses the login """
+
+    def login( self, inUser=None, inPass=None ):
+        raise RuntimeError, LoginFailedException
+
+class SlowConnection( FakeConnection ):
+    """ Takes a while to log in """
+
+    def login( self, inUser=None, inPass=None ):
+        time.sleep( 0.2 )
+
+class SlowFactory:
+
+    def createConnection( self, inType=None, inClass=None ):
+        return SlowConnection()
+
+class FailingFactory:
+
+    def __init__( self, inClass=None ):
+        self._class = inClass
+
+    def createConnection( self, inType=None, inClass=None ):
+        return self._class()
+
+# ------------------------------------------------------------------------
+
+class ShardedRunnerTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._dir    = tempfile.mkdtemp()
+        self._shmDir = runners._shmDir
+        runners._shmDir = lambda: self._dir
+
+    def tearDown( self ):
+        runners._shmDir = self._shmDir
+        shutil.rmtree( self._dir )
+
+    def testSpilledOutput( self ):
+        self.failUnless( isinstance( FakeConnection( 2000 ).cmd(), SpilledOutput ) )
+
+        hosts   = [ runners.Host( "host%d" % i, "IOS" ) for i in range( 4 ) ]
+        runner  = runners.ShardedRunner( 2, 2, inFactory=FakeFactory( 2000 ) )
+        results = list( runner.run( hosts, [ "show tech" ] ) )
+
+        self.assertEqual( len( results ), 4 )
+        for host, ok, value in results:
+            self.assertEqual( ok, 1 )
+            self.assertEqual( len( value[0] ), 2000 )
+
+    def testEarlyCloseRemovesSpillFiles( self ):
+        hosts  = [ runners.Host( "host%d" % i, "IOS" ) for i in range( 8 ) ]
+        runner = runners.ShardedRunner( 2, 4,
+                                        inFactory=FakeFactory( 2 * runners.SPILL_SIZE ) )
+        results = runner.run( hosts, [ "show tech" ] )
+
+        host, ok, value = results.next()
+        self.assertEqual( ok, 1 )
+        results.close()
+
+        self.assertEqual( os.listdir( self._dir ), [] )
+
+    def testLimiterSharedByWorkers( self ):
+        hosts   = [ runners.Host( "host%d" % i, "IOS" ) for i in range( 4 ) ]
+        limiter = AdaptiveLimiter( 1, 1, 1 )
+        runner  = runners.ShardedRunner( 2, 2, inFactory=SlowFactory(),
+                                         inLimiter=limiter )
+
+        # One login at a time across both workers, not one each
+        start   = time.time()
+        results = list( runner.run( hosts, [ "show clock" ] ) )
+        self.failUnless( time.time() - start >= 0.75 )
+        self.assertEqual( [ ok for host, ok, value in results ], [ 1, 1, 1, 1 ] )
+
+class ConnectHostTest( unittest.TestCase ):
+
+    def _connect( self, inClass=None ):
+        limiter = AdaptiveLimiter( 4, 1, 8, 0.1 )
+        policy  = ConnectionPolicy( RetryPolicy( 3, 0.01 ) )
+        host    = runners.Host( "host", "IOS" )
+        self.assertRaises( Exception, runners.connectHost, host,
+                           FailingFactory( inClass ), policy, limiter )
+        return limiter
+
+    def testConnectFailureLeavesLimit( self ):
+        self.assertEqual( self._connect( DeadConnection ).getLimit(), 4 )
+
+    def testLoginFailureLowersLimit( self ):
+        self.assertEqual( self._connect( DeniedConnection ).getLimit(), 2 )
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tests for netdevicelib.scheduler, run against a fake connection factory
+#
+#  $Id$
+# ========================================================================
+
+import os, shutil, tempfile, threading, time, unittest
+
+from netdevicelib import runners
+from netdevicelib.scheduler import CostModel, LOGIN, Scheduler
+
+# ------------------------------------------------------------------------
+
+class Recorder:
+    """ Tracks which hosts have sessions open, and the most seen at once """
+
+    def __init__( self ):
+        self.started = []
+        self.open    = []
+        self.most    = {}
+        self._lock   = threading.Lock()
+
+    def opened( self, inHost ):
+        self._lock.acquire()
+        try:
+            self.started.append( inHost.host )
+            self.open.append( inHost )
+            self._note( 'global', len( self.open ) )
+            self._note( inHost.site,
+                        len( [ h for h in self.open if h.site == inHost.site ] ) )
+            self._note( inHost.host,
+                        len( [ h for h in self.open if h.host == inHost.host ] ) )
+        finally:
+            self._lock.release()
+
+    def closed( self, inHost ):
+        self._lock.acquire()
+        try:
+            self.open.remove( inHost )
+        finally:
+            self._lock.release()
+
+    def _note( self, inKey, inCount ):
+        self.most[inKey] = max( self.most.get( inKey, 0 ), inCount )
+
+class FakeConnection:
+
+    def __init__( self ):
+        self._host = None
+
+    def open( self, inHost=None, inPort=None ):
+        self._host = inHost
+
+    def login( self, inUser=None, inPass=None ):
+        pass
+
+    def cmd( self, inCmd=None ):
+        time.sleep( 0.05 )
+        return "%s: %s" % ( self._host, inCmd )
+
+    def close( self ):
+        pass
+
+class FakeFactory:
+
+    def createConnection( self, inType=None, inClass=None ):
+        return FakeConnection()
+
+class RecordingHost( runners.Host ):
+    """ Reports its sessions to a Recorder """
+
+    def __init__( self, inRecorder=None, *inArgs, **inKeywords ):
+        runners.Host.__init__( self, *inArgs, **inKeywords )
+        self._recorder = inRecorder
+
+    def connect( self, inFactory=None, inLimiter=None ):
+        conn = runners.Host.connect( self, inFactory, inLimiter )
+        self._recorder.opened( self )
+
+        close = conn.close
+        def closed():
+            self._recorder.closed( self )
+            close()
+        conn.close = closed
+        return conn
+
+# ------------------------------------------------------------------------
+
+class SchedulerTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._recorder = Recorder()
+
+    def _host( self, inName=None, inSite=None ):
+        return RecordingHost( self._recorder, inName, "IOS", inSite=inSite )
+
+    def _run( self, inTasks=None, **inKeywords ):
+        scheduler = Scheduler( inFactory=FakeFactory(), **inKeywords )
+        results = scheduler.run( inTasks )
+        self.assertEqual( [ ok for ok, value in results ], [ 1 ] * len( inTasks ) )
+        return results
+
+    def testLongestFirst( self ):
+        tasks = [ ( self._host( "short" ), [ "a" ] ),
+                  ( self._host( "long" ), [ "a", "b", "c" ] ),
+                  ( self._host( "medium" ), [ "a", "b" ] ) ]
+        results = self._run( tasks, inGlobal=1 )
+
+        self.assertEqual( self._recorder.started, [ "long", "medium", "short" ] )
+        self.assertEqual( results[0], ( 1, [ "short: a" ] ) )
+
+    def testLearnedCosts( self ):
+        costs = CostModel()
+        costs.observe( "IOS", "slow", 10.0 )
+        tasks = [ ( self._host( "one" ), [ "a", "a" ] ),
+                  ( self._host( "two" ), [ "slow" ] ) ]
+        self._run( tasks, inCostModel=costs, inGlobal=1 )
+
+        self.assertEqual( self._recorder.started, [ "two", "one" ] )
+
+    def testGlobalLimit( self ):
+        tasks = [ ( self._host( "host%d" % i ), [ "a" ] ) for i in range( 8 ) ]
+        self._run( tasks, inGlobal=3 )
+        self.assertEqual( self._recorder.most['global'], 3 )
+
+    def testSiteLimit( self ):
+        tasks = [ ( self._host( "a%d" % i, "siteA" ), [ "a" ] ) for i in range( 4 ) ] + \
+                [ ( self._host( "b%d" % i, "siteB" ), [ "a" ] ) for i in range( 4 ) ]
+        self._run( tasks, inGlobal=8, inPerSite={ 'siteA' : 1 } )
+
+        self.assertEqual( self._recorder.most['siteA'], 1 )
+        self.assertEqual( self._recorder.most['siteB'], 4 )
+
+    def testDeviceLimit( self ):
+        tasks = [ ( self._host( "router" ), [ "a" ] ) for i in range( 4 ) ] + \
+                [ ( self._host( "switch" ), [ "a" ] ) for i in range( 4 ) ]
+        self._run( tasks, inGlobal=8, inPerDevice=2 )
+
+        self.assertEqual( self._recorder.most['router'], 2 )
+        self.assertEqual( self._recorder.most['switch'], 2 )
+
+    def testImpossibleLimits( self ):
+        self.assertRaises( AssertionError, Scheduler, inGlobal=0 )
+        self.assertRaises( AssertionError, Scheduler, inPerDevice=0 )
+        self.assertRaises( AssertionError, Scheduler, inPerSite=0 )
+        self.assertRaises( AssertionError, Scheduler, inPerSite={ 'siteA' : 0 } )
+
+    def testFailure( self ):
+        host = runners.Host( "down", "IOS" )
+        host.connect = lambda inFactory=None, inLimiter=None: 1 / 0
+        results = Scheduler( inFactory=FakeFactory() ).run( [ ( host, [ "a" ] ) ] )
+        self.assertEqual( results[0][0], 0 )
+        self.failUnless( "ZeroDivisionError" in results[0][1] )
+
+# ------------------------------------------------------------------------
+
+class CostModelTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._dir  = tempfile.mkdtemp()
+        self._path = os.path.join( self._dir, "costs" )
+
+    def tearDown( self ):
+        shutil.rmtree( self._dir )
+
+    def testAverage( self ):
+        costs = CostModel( inAlpha=0.5, inDefault=2.0 )
+        self.assertEqual( costs.estimate( "IOS", LOGIN ), 2.0 )
+        costs.observe( "IOS", LOGIN, 4.0 )
+        costs.observe( "IOS", LOGIN, 2.0 )
+        self.assertEqual( costs.estimate( "IOS", LOGIN ), 3.0 )
+
+    def testSaveAndLoad( self ):
+        costs = CostModel( self._path )
+        costs.observe( "IOS", "show tech", 30.0 )
+        costs.save()
+
+        self.assertEqual( os.listdir( self._dir ), [ "costs" ] )
+        self.assertEqual( CostModel( self._path ).estimate( "IOS", "show tech" ), 30.0 )
+        self.assertEqual( CostModel( self._path ).estimate( "IOS", "show clock" ), 1.0 )
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tests for netdevicelib.sockets, with a stub getaddrinfo()
+#
+#  $Id$
+# ========================================================================
+
+import socket, time, unittest
+
+from netdevicelib.sockets import Resolver, connectSocket, openSocket, \
+                                 waitReady, _interleave
+
+from support import FD_SETSIZE, HighDescriptors
+
+# ------------------------------------------------------------------------
+
+class StubResolver:
+    """ Stands in for socket.getaddrinfo(), counting lookups per name """
+
+    def __init__( self, inNames ):
+        self._names = inNames
+        self.calls  = {}
+
+    def __call__( self, inHost, inPort, inFamily=0, inType=0 ):
+        self.calls[inHost] = self.calls.get( inHost, 0 ) + 1
+        if not self._names.has_key( inHost ):
+            raise socket.gaierror( socket.EAI_NONAME, "Name or service not known" )
+        return [ ( family, socket.SOCK_STREAM, 6, '', address )
+                 for family, address in self._names[inHost] ]
+
+def listener():
+    """ Return a socket listening on a free IPv4 loopback port """
+
+    sock = socket.socket()
+    sock.bind( ( '127.0.0.1', 0 ) )
+    sock.listen( 5 )
+    return sock
+
+def closedPort():
+    """ Return an IPv4 loopback port nothing listens on """
+
+    sock = socket.socket()
+    sock.bind( ( '127.0.0.1', 0 ) )
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+# ------------------------------------------------------------------------
+
+V4 = ( socket.AF_INET,  ( '127.0.0.1', 0 ) )
+V6 = ( socket.AF_INET6, ( '::1', 0, 0, 0 ) )
+
+class ResolverTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._getaddrinfo  = socket.getaddrinfo
+        self._stub         = StubResolver( { 'router1' : [ V6, V4, V4 ],
+                                             'router2' : [ V4 ] } )
+        socket.getaddrinfo = self._stub
+
+    def tearDown( self ):
+        socket.getaddrinfo = self._getaddrinfo
+
+    def testResolve( self ):
+        resolver = Resolver()
+        self.assertEqual( resolver.resolve( 'router1', 23 ),
+                          [ ( socket.AF_INET6, ( '::1', 23, 0, 0 ) ),
+                            ( socket.AF_INET,  ( '127.0.0.1', 23 ) ) ] )
+
+        # Cached, whatever the port
+        resolver.resolve( 'router1', 22 )
+        self.assertEqual( self._stub.calls, { 'router1' : 1 } )
+
+    def testExpiry( self ):
+        resolver = Resolver( 0.05 )
+        resolver.resolve( 'router1', 23 )
+        time.sleep( 0.1 )
+        resolver.resolve( 'router1', 23 )
+        self.assertEqual( self._stub.calls, { 'router1' : 2 } )
+
+    def testFlush( self ):
+        resolver = Resolver()
+        resolver.resolve( 'router1', 23 )
+        resolver.flush()
+        resolver.resolve( 'router1', 23 )
+        self.assertEqual( self._stub.calls, { 'router1' : 2 } )
+
+    def testResolveAll( self ):
+        resolver = Resolver( inThreads=2 )
+        resolver.resolve( 'router2', 23 )
+        resolver.resolveAll( [ 'router1', 'router2', 'missing', 'router1' ] )
+        self.assertEqual( self._stub.calls,
+                          { 'router1' : 1, 'router2' : 1, 'missing' : 1 } )
+
+        resolver.resolve( 'router1', 23 )
+        self.assertEqual( self._stub.calls['router1'], 1 )
+
+        # Names which didn't resolve fail when they are asked for
+        self.assertRaises( socket.gaierror, resolver.resolve, 'missing', 23 )
+
+# ------------------------------------------------------------------------
+
+class ConnectTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._listener = listener()
+        self._port     = self._listener.getsockname()[1]
+
+    def tearDown( self ):
+        self._listener.close()
+
+    def testInterleave( self ):
+        a, b = socket.AF_INET6, socket.AF_INET
+        self.assertEqual( _interleave( [ ( a, 1 ), ( a, 2 ), ( a, 3 ), ( b, 4 ) ] ),
+                          [ ( a, 1 ), ( b, 4 ), ( a, 2 ), ( a, 3 ) ] )
+
+    def testFallbackAfterRefused( self ):
+        sock = connectSocket( [ ( socket.AF_INET, ( '127.0.0.1', closedPort() ) ),
+                                ( socket.AF_INET, ( '127.0.0.1', self._port ) ) ], 5 )
+        self.assertEqual( sock.getpeername(), ( '127.0.0.1', self._port ) )
+        sock.close()
+
+    def testFallbackBetweenFamilies( self ):
+        # IPv6 is refused, or missing altogether on this box: either way
+        # the IPv4 address must win
+        getaddrinfo = socket.getaddrinfo
+        socket.getaddrinfo = StubResolver( { 'router1' : [ V6, V4 ] } )
+        try:
+            sock = openSocket( 'router1', self._port, 5, Resolver() )
+        finally:
+            socket.getaddrinfo = getaddrinfo
+        self.assertEqual( sock.getpeername(), ( '127.0.0.1', self._port ) )
+        sock.close()
+
+    def testAllRefused( self ):
+        self.assertRaises( socket.error, connectSocket,
+                           [ ( socket.AF_INET, ( '127.0.0.1', closedPort() ) ) ], 5 )
+
+    def testHighDescriptor( self ):
+        try:
+            held = HighDescriptors()
+        except RuntimeError, e:
+            self.skipTest( str( e ) )
+        try:
+            sock = connectSocket( [ ( socket.AF_INET, ( '127.0.0.1', self._port ) ) ], 5 )
+            self.failUnless( sock.fileno() >= FD_SETSIZE )
+            sock.close()
+        finally:
+            held.close()
+
+class WaitReadyTest( unittest.TestCase ):
+
+    def testReadable( self ):
+        a, b = socket.socketpair()
+        try:
+            self.assertEqual( waitReady( [ a ], 0, 0.05 ), [] )
+            b.sendall( "x" )
+            self.assertEqual( waitReady( [ a ], 0, 5 ), [ a ] )
+            self.assertEqual( waitReady( [ b ], 1, 5 ), [ b ] )
+        finally:
+            a.close()
+            b.close()
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tests for netdevicelib.sshtransport
+#
+#  $Id$
+# ========================================================================
+
+import os, shutil, socket, tempfile, unittest
+
+from netdevicelib import sshtransport
+from netdevicelib.sshtransport import HostKeyException, SshShell, checkHostKey, \
+                                     openTransport
+
+from support import FD_SETSIZE, HighDescriptors
+
+# ------------------------------------------------------------------------
+
+class ShellExpectTest( unittest.TestCase ):
+    """ A socket stands in for the paramiko channel: expect() only needs
+        fileno() and recv() """
+
+    def setUp( self ):
+        try:
+            self._held = HighDescriptors()
+        except RuntimeError, e:
+            self.skipTest( str( e ) )
+        self._server, client = socket.socketpair()
+        self._shell = SshShell()
+        self._shell._chan = client
+
+    def tearDown( self ):
+        self._shell._chan.close()
+        self._server.close()
+        self._held.close()
+
+    def testHighDescriptor( self ):
+        self.failUnless( self._shell._chan.fileno() >= FD_SETSIZE )
+        self._server.sendall( "show clock\r\n12:00:00\r\nRouter#" )
+
+        index, match, text = self._shell.expect( [ 'Router#$' ], 5 )
+        self.assertEqual( index, 0 )
+        self.assertEqual( text, "show clock\r\n12:00:00\r\nRouter#" )
+
+    def testTimeout( self ):
+        self._server.sendall( "no prompt" )
+        self.assertEqual( self._shell.expect( [ 'Router#$' ], 0.1 ),
+                          ( -1, None, "no prompt" ) )
+
+class FakeTransport:
+    """ Only presents a host key """
+
+    def __init__( self, inKey=None ):
+        self._key = inKey
+
+    def get_remote_server_key( self ):
+        return self._key
+
+class HostKeyTest( unittest.TestCase ):
+
+    def setUp( self ):
+        try:
+            self._paramiko = sshtransport._loadParamiko()
+        except RuntimeError, e:
+            self.skipTest( str( e ) )
+
+        self._known = self._paramiko.RSAKey.generate( 1024 )
+        self._other = self._paramiko.RSAKey.generate( 1024 )
+
+        self._dir  = tempfile.mkdtemp()
+        self._path = os.path.join( self._dir, "known_hosts" )
+        f = open( self._path, 'w' )
+        f.write( "router1 %s %s\n" % ( self._known.get_name(),
+                                       self._known.get_base64() ) )
+        f.close()
+        sshtransport._knownHosts.clear()
+
+    def tearDown( self ):
+        sshtransport._knownHosts.clear()
+        shutil.rmtree( self._dir )
+
+    def _check( self, inKey=None, inHost="router1", inOptions=None ):
+        options = { 'knownHosts' : self._path }
+        options.update( inOptions or {} )
+        checkHostKey( FakeTransport( inKey ), inHost, 22, options )
+
+    def _refused( self, inKey=None, inHost="router1", inOptions=None ):
+        try:
+            self._check( inKey, inHost, inOptions )
+        except RuntimeError, e:
+            self.assertEqual( e.args[0], HostKeyException )
+        else:
+            self.fail( "key accepted" )
+
+    def testKnownKey( self ):
+        self._check( self._known )
+
+    def testMismatchedKey( self ):
+        self._refused( self._other )
+        self._refused( self._other, inOptions={ 'strictHostKeys' : 0 } )
+
+    def testUnknownHostRefused( self ):
+        self._refused( self._other, "router2" )
+
+    def testUnknownHostOptOut( self ):
+        self._check( self._other, "router2", { 'strictHostKeys' : 0 } )
+
+        # Remembered, and checked from then on
+        self._check( self._other, "router2" )
+        self._refused( self._known, "router2", { 'strictHostKeys' : 0 } )
+
+    def testDefaultFile( self ):
+        home = os.environ.get( 'HOME' )
+        os.environ['HOME'] = self._dir
+        try:
+            os.mkdir( os.path.join( self._dir, ".ssh" ) )
+            shutil.copy( self._path, os.path.join( self._dir, ".ssh", "known_hosts" ) )
+            checkHostKey( FakeTransport( self._known ), "router1" )
+            self.assertRaises( RuntimeError, checkHostKey,
+                               FakeTransport( self._other ), "router1" )
+        finally:
+            if home == None:
+                del os.environ['HOME']
+            else:
+                os.environ['HOME'] = home
+
+class OpenTransportTest( unittest.TestCase ):
+
+    def setUp( self ):
+        try:
+            sshtransport._loadParamiko()
+        except RuntimeError, e:
+            self.skipTest( str( e ) )
+
+        self._openSocket = sshtransport.openSocket
+        self.calls       = []
+
+        def openSocket( inHost=None, inPort=None, inTimeout=None, inResolver=None ):
+            self.calls.append( ( inHost, inPort, inTimeout ) )
+            raise socket.timeout( "timed out" )
+        sshtransport.openSocket = openSocket
+
+    def tearDown( self ):
+        sshtransport.openSocket = self._openSocket
+
+    def testConnectsThroughResolver( self ):
+        self.assertRaises( socket.timeout, openTransport, "bastion", 2222, None, 5 )
+        self.assertEqual( self.calls, [ ( "bastion", 2222, 5 ) ] )
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
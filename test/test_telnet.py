@@ -0,0 +1,162 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tests for netdevicelib.telnet
+#
+#  $Id$
+# ========================================================================
+
+import re, socket, unittest
+
+from netdevicelib.telnet import BRK, DO, DONT, IAC, SB, SE, WILL, WONT, \
+                                Telnet, TelnetProtocol, _isAnchored
+
+from support import FD_SETSIZE, HighDescriptors
+
+# ------------------------------------------------------------------------
+
+ECHO  = chr( 1 )
+NAWS  = chr( 31 )
+TTYPE = chr( 24 )
+
+class ProtocolTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._protocol = TelnetProtocol()
+
+    def testPlainText( self ):
+        self.assertEqual( self._protocol.feed( "Router#" ), ( "Router#", "" ) )
+
+    def testIgnoredCharacters( self ):
+        self.assertEqual( self._protocol.feed( "a\x00b\x11c" ), ( "abc", "" ) )
+
+    def testRefusals( self ):
+        data, reply = self._protocol.feed( IAC + DO + NAWS + "x" + IAC + WILL + ECHO +
+                                           IAC + DONT + TTYPE + IAC + WONT + ECHO )
+        self.assertEqual( data, "x" )
+        self.assertEqual( reply, IAC + WONT + NAWS + IAC + DONT + ECHO +
+                                 IAC + WONT + TTYPE + IAC + DONT + ECHO )
+
+    def testEscapedIAC( self ):
+        self.assertEqual( self._protocol.feed( "a" + IAC + IAC + "b" ),
+                          ( "a" + IAC + "b", "" ) )
+
+    def testEncode( self ):
+        self.assertEqual( self._protocol.encode( "a" + IAC + "b" ),
+                          "a" + IAC + IAC + "b" )
+
+    def testSplitIAC( self ):
+        self.assertEqual( self._protocol.feed( "abc" + IAC ), ( "abc", "" ) )
+        self.assertEqual( self._protocol.feed( DO ), ( "", "" ) )
+        self.assertEqual( self._protocol.feed( NAWS + "def" ),
+                          ( "def", IAC + WONT + NAWS ) )
+
+    def testSplitEscapedIAC( self ):
+        self.assertEqual( self._protocol.feed( "a" + IAC ), ( "a", "" ) )
+        self.assertEqual( self._protocol.feed( IAC + "b" ), ( IAC + "b", "" ) )
+
+    def testSubnegotiationAcrossReads( self ):
+        self.assertEqual( self._protocol.feed( "a" + IAC + SB + TTYPE + "\x01" ),
+                          ( "a", "" ) )
+        self.assertEqual( self._protocol.feed( "still inside" + IAC ), ( "", "" ) )
+        self.assertEqual( self._protocol.feed( SE + "b" ), ( "b", "" ) )
+
+    def testSubnegotiationWithEscapedIAC( self ):
+        data, reply = self._protocol.feed( IAC + SB + NAWS + IAC + IAC + "\x00" +
+                                           IAC + SE + "c" )
+        self.assertEqual( ( data, reply ), ( "c", "" ) )
+
+    def testOtherCommands( self ):
+        self.assertEqual( self._protocol.feed( "a" + IAC + BRK + "b" ), ( "ab", "" ) )
+
+# ------------------------------------------------------------------------
+
+class AnchoredTest( unittest.TestCase ):
+
+    def testAnchored( self ):
+        self.failUnless( _isAnchored( re.compile( '[\w.-]+#\s*$' ) ) )
+        self.failUnless( _isAnchored( re.compile( ' ?--More--\s*$|<--- More --->\s*$' ) ) )
+        self.failUnless( _isAnchored( re.compile( '(?:a|b)#$' ) ) )
+
+    def testNotAnchored( self ):
+        self.failIf( _isAnchored( re.compile( 'Press RETURN to get started' ) ) )
+        self.failIf( _isAnchored( re.compile( '#\s*$|##########' ) ) )
+        self.failIf( _isAnchored( re.compile( '(?m)^Router#$' ) ) )
+        self.failIf( _isAnchored( re.compile( '(a$|b)' ) ) )
+
+# ------------------------------------------------------------------------
+
+class TelnetTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._server, client = socket.socketpair()
+        self._telnet = Telnet( inReadSize=16 )
+        self._telnet.open( "device", inSock=client )
+
+    def tearDown( self ):
+        self._telnet.close()
+        self._server.close()
+
+    def testExpectAcrossReads( self ):
+        self._server.sendall( "x" * 5000 + IAC + DO + ECHO + "\r\nRouter#" )
+
+        index, match, text = self._telnet.expect( [ 'Router#\s*$' ], 5 )
+        self.assertEqual( index, 0 )
+        self.assertEqual( text, "x" * 5000 + "\r\nRouter#" )
+        self.assertEqual( self._server.recv( 16 ), IAC + WONT + ECHO )
+
+    def testUnanchoredPattern( self ):
+        self._server.sendall( "Press RETURN" + "x" * 100 )
+
+        index, match, text = self._telnet.expect( [ 'Router#$', 'Press RETURN' ], 5 )
+        self.assertEqual( index, 1 )
+        self.assertEqual( text, "Press RETURN" )
+
+    def testBufferLimit( self ):
+        self._telnet._maxBuffer = 100
+        self._server.sendall( "x" * 300 + "Router#" )
+
+        # Handed back once over the limit, in whole reads
+        self.assertEqual( self._telnet.expect( [ 'Router#$' ], 5 ),
+                          ( -1, None, "x" * 112 ) )
+
+    def testTimeout( self ):
+        self._server.sendall( "no prompt" )
+        self.assertEqual( self._telnet.expect( [ 'Router#$' ], 0.1 ),
+                          ( -1, None, "no prompt" ) )
+
+    def testEOF( self ):
+        self._server.close()
+        self.assertRaises( EOFError, self._telnet.expect, [ 'Router#$' ], 5 )
+
+    def testWriteEscapes( self ):
+        self._telnet.write( "a" + IAC )
+        self.assertEqual( self._server.recv( 16 ), "a" + IAC + IAC )
+
+class HighDescriptorTest( unittest.TestCase ):
+
+    def setUp( self ):
+        try:
+            self._held = HighDescriptors()
+        except RuntimeError, e:
+            self.skipTest( str( e ) )
+        self._server, client = socket.socketpair()
+        self._telnet = Telnet()
+        self._telnet.open( "device", inSock=client )
+
+    def tearDown( self ):
+        self._telnet.close()
+        self._server.close()
+        self._held.close()
+
+    def testExpect( self ):
+        self.failUnless( self._telnet.fileno() >= FD_SETSIZE )
+        self._server.sendall( "\r\nRouter#" )
+
+        index, match, text = self._telnet.expect( [ 'Router#$' ], 5 )
+        self.assertEqual( index, 0 )
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tests for netdevicelib.throttle
+#
+#  $Id$
+# ========================================================================
+
+import multiprocessing, time, unittest
+
+from netdevicelib.throttle import AdaptiveLimiter
+
+# ------------------------------------------------------------------------
+
+def _holdSlot( inLimiter, inSpans ):
+    """ Worker process body: hold a login slot for a moment """
+
+    inLimiter.acquire()
+    start = time.time()
+    time.sleep( 0.2 )
+    inSpans.append( ( start, time.time() ) )
+    inLimiter.release( 0.0 )
+
+class LimiterTest( unittest.TestCase ):
+
+    def testIncrease( self ):
+        limiter = AdaptiveLimiter( 2, 1, 8, 1.0 )
+        for i in range( 4 ):
+            limiter.acquire()
+            limiter.release( 0.1 )
+        self.assertEqual( limiter.getLimit(), 3 )
+
+    def testDecreaseOncePerTarget( self ):
+        limiter = AdaptiveLimiter( 8, 1, 8, 1.0 )
+        for i in range( 3 ):
+            limiter.acquire()
+            limiter.release( 0.1, 1 )
+        self.assertEqual( limiter.getLimit(), 4 )
+
+        limiter.acquire()
+        limiter.release( 5.0 )
+        self.assertEqual( limiter.getLimit(), 4 )
+
+    def testMinimum( self ):
+        limiter = AdaptiveLimiter( 1, 1, 8, 0.0 )
+        limiter.acquire()
+        limiter.release( 0.1, 1 )
+        self.assertEqual( limiter.getLimit(), 1 )
+
+    def testShared( self ):
+        manager = multiprocessing.Manager()
+        try:
+            limiter = AdaptiveLimiter( 1, 1, 1 ).share( manager )
+            spans   = manager.list()
+            workers = [ multiprocessing.Process( target=_holdSlot,
+                                                 args=( limiter, spans ) )
+                        for i in range( 3 ) ]
+            for p in workers:
+                p.start()
+            for p in workers:
+                p.join()
+
+            spans = sorted( spans )
+            self.assertEqual( len( spans ), 3 )
+            for i in range( 1, len( spans ) ):
+                self.failUnless( spans[i][0] >= spans[i - 1][1] )
+        finally:
+            manager.shutdown()
+
+    def testShareKeepsLimit( self ):
+        limiter = AdaptiveLimiter( 6, 1, 8 )
+        manager = multiprocessing.Manager()
+        try:
+            self.assertEqual( limiter.share( manager ).getLimit(), 6 )
+        finally:
+            manager.shutdown()
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
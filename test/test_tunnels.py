@@ -0,0 +1,134 @@
+#!/usr/local/bin/python
+
+# ========================================================================
+#  Tests for netdevicelib.tunnels, with openTransport() and authenticate()
+#  stubbed out
+#
+#  $Id$
+# ========================================================================
+
+import os, unittest
+
+from netdevicelib import tunnels
+from netdevicelib.sshtransport import AuthenticationError
+from netdevicelib.tunnels import JumpHost, JumpHostLoginFailedException
+
+# ------------------------------------------------------------------------
+
+class FakeChannel:
+
+    def __init__( self, inDestination=None ):
+        self.destination = inDestination
+        self.timeout     = 'unset'
+
+    def settimeout( self, inTimeout=None ):
+        self.timeout = inTimeout
+
+class FakeTransport:
+    """ Records the keepalive and the channels opened over it """
+
+    def __init__( self ):
+        self.active    = 1
+        self.keepalive = None
+        self.channels  = []
+
+    def is_active( self ):
+        return self.active
+
+    def set_keepalive( self, inInterval=None ):
+        self.keepalive = inInterval
+
+    def open_channel( self, inKind=None, inDestination=None, inSource=None,
+                      timeout=None ):
+        assert inKind == 'direct-tcpip'
+        channel = FakeChannel( inDestination )
+        self.channels.append( channel )
+        return channel
+
+    def close( self ):
+        self.active = 0
+
+class JumpHostTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self._saved     = ( tunnels.openTransport, tunnels.authenticate, tunnels.os.getpid )
+        self.transports = []
+        self.refuse     = 0
+
+        def openTransport( inHost=None, inPort=22, inOptions=None,
+                           inConnectTimeout=None, inTimeout=None, inSock=None ):
+            self.transports.append( FakeTransport() )
+            return self.transports[-1]
+
+        def authenticate( inTransport=None, inUser=None, inPass=None ):
+            if self.refuse:
+                raise AuthenticationError( "Authentication failed." )
+
+        tunnels.openTransport = openTransport
+        tunnels.authenticate  = authenticate
+        self._jump = JumpHost( "bastion", inUser="ops", inPass="secret",
+                               inKeepalive=15 )
+
+    def tearDown( self ):
+        tunnels.openTransport, tunnels.authenticate, tunnels.os.getpid = self._saved
+
+    def testChannelsShareTransport( self ):
+        first  = self._jump.openChannel( "router1", 23 )
+        second = self._jump.openChannel( "router2", 22 )
+
+        self.assertEqual( len( self.transports ), 1 )
+        self.assertEqual( [ c.destination for c in self.transports[0].channels ],
+                          [ ( "router1", 23 ), ( "router2", 22 ) ] )
+        self.assertEqual( first.timeout, None )
+
+    def testKeepalive( self ):
+        self._jump.openChannel( "router1", 23 )
+        self.assertEqual( self.transports[0].keepalive, 15 )
+
+    def testNoKeepalive( self ):
+        jump = JumpHost( "bastion", inUser="ops", inKeepalive=0 )
+        jump.openChannel( "router1", 23 )
+        self.assertEqual( self.transports[0].keepalive, None )
+
+    def testReconnectWhenDropped( self ):
+        self._jump.openChannel( "router1", 23 )
+        self.transports[0].active = 0
+        self._jump.openChannel( "router1", 23 )
+
+        self.assertEqual( len( self.transports ), 2 )
+        self.assertEqual( len( self.transports[1].channels ), 1 )
+
+    def testReconnectAfterFork( self ):
+        self._jump.openChannel( "router1", 23 )
+
+        # A forked child sees the parent's transport, but no thread runs it
+        pid = os.getpid()
+        tunnels.os.getpid = lambda: pid + 1
+        self._jump.openChannel( "router1", 23 )
+        self._jump.openChannel( "router2", 23 )
+
+        self.assertEqual( len( self.transports ), 2 )
+        self.assertEqual( len( self.transports[1].channels ), 2 )
+
+    def testLoginFailure( self ):
+        self.refuse = 1
+        try:
+            self._jump.openChannel( "router1", 23 )
+        except RuntimeError, e:
+            self.assertEqual( e.args[0], JumpHostLoginFailedException )
+        else:
+            self.fail( "login to the jump host accepted" )
+        self.failIf( self.transports[0].active )
+
+    def testClose( self ):
+        self._jump.openChannel( "router1", 23 )
+        self._jump.close()
+        self.failIf( self.transports[0].active )
+
+        self._jump.openChannel( "router1", 23 )
+        self.assertEqual( len( self.transports ), 2 )
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()